@@ -0,0 +1,288 @@
+# Copyright (C) 2020, Stefan Schwarzer <sschwarzer@sschwarzer.net>
+# and ftputil contributors (see `doc/contributors.txt`)
+# See the file LICENSE for licensing terms.
+
+"""
+batch.py - pipelined execution of independent FTP commands
+
+Usually, ftputil sends a command and waits for the reply before it
+sends the next command. Over a connection with a high latency, most of
+the time is spent waiting. A `CommandBatch` collects independent
+commands, sends them without waiting and reads the replies afterwards.
+"""
+
+import collections
+
+import ftputil.error
+import ftputil.keep_alive
+import ftputil.tool
+
+
+__all__ = ["BatchResult", "CommandBatch"]
+
+
+class BatchResult:
+    """
+    Result of an operation in a `CommandBatch`.
+
+    `operation` is the name of the `CommandBatch` method that queued
+    the operation, for example "remove", and `args` are its arguments
+    (with paths made absolute). After the batch has been executed,
+    `reply` is the last server reply for the operation and `error` is
+    `None`. If the operation failed, `reply` is `None` and `error` is
+    the `TemporaryError` or `PermanentError` for the failure.
+    """
+
+    def __init__(self, operation, args, dir_path, commands):
+        self.operation = operation
+        self.args = args
+        # Directory to change into before sending the commands
+        self._dir_path = dir_path
+        # FTP commands to send for the operation
+        self._commands = commands
+        self.reply = None
+        self.error = None
+
+    @property
+    def ok(self):
+        """Return `True` if the operation succeeded, else `False`."""
+        return self.error is None
+
+    def __repr__(self):
+        return "<{} {}{!r}: {}>".format(
+            self.__class__.__name__,
+            self.operation,
+            self.args,
+            self.reply if self.ok else self.error.strerror,
+        )
+
+
+class CommandBatch:
+    """
+    Collection of independent commands which are sent to the server
+    without waiting for the replies of the previous commands.
+
+    Don't create a `CommandBatch` directly, but use `FTPHost.batch`:
+
+      with ftp_host.batch() as batch:
+          for name in names:
+              batch.remove(name)
+
+    The commands are sent when the `with` block is left. The failure
+    of a command doesn't prevent the execution of the other commands.
+    If any command failed, a `BatchError` is raised after all replies
+    have been read. Its `results` attribute contains a `BatchResult`
+    object for each operation in the order of the calls.
+
+    Since the commands are sent before the replies of the previous
+    commands arrive, the commands must not depend on each other. For
+    example, don't remove a directory in the same batch as the files
+    in it.
+
+    As in `FTPHost._robust_ftp_command`, the commands aren't sent with
+    absolute paths. Instead, the batch changes into the directory of
+    each path and sends the command with the base name. The commands
+    for the paths in the same directory are sent together, so this
+    costs one additional round trip per directory.
+    """
+
+    # Maximum number of commands sent but not yet answered. This
+    # prevents a deadlock if neither the client nor the server read
+    # from the control connection because their send buffers are full.
+    DEFAULT_WINDOW = 64
+
+    def __init__(self, host, window=DEFAULT_WINDOW):
+        if window < 1:
+            raise ValueError("window must be at least 1, not {!r}".format(window))
+        self._host = host
+        self._window = window
+        self._results = []
+
+    def _add(self, operation, args, dir_path, commands):
+        """
+        Queue the operation `operation` with the arguments `args`,
+        which sends the FTP commands in the list `commands` in the
+        directory `dir_path`.
+        """
+        self._results.append(BatchResult(operation, args, dir_path, commands))
+
+    def _abspath(self, path):
+        """Return `path` as absolute remote path."""
+        return self._host.path.abspath(ftputil.tool.as_str_path(path))
+
+    def _add_path_command(self, operation, args, command):
+        """
+        Queue the operation `operation` for the path `args[0]`, which
+        sends `command`, formatted with the base name of the path.
+        """
+        head, tail = self._host.path.split(args[0])
+        self._add(operation, args, head, [command.format(tail)])
+
+    # The following methods correspond to the `FTPHost` methods with
+    # the same names. However, they don't check the type of the
+    # remote items, so for example `remove` doesn't refuse to remove
+    # a directory (though the server usually will).
+
+    def remove(self, path):
+        """Queue the removal of the file or link `path`."""
+        self._add_path_command("remove", (self._abspath(path),), "DELE {}")
+
+    unlink = remove
+
+    # Ignore unused argument `mode`
+    # pylint: disable=unused-argument
+    def mkdir(self, path, mode=None):
+        """
+        Queue the creation of the directory `path`. `mode` is ignored
+        as in `FTPHost.mkdir`.
+        """
+        self._add_path_command("mkdir", (self._abspath(path),), "MKD {}")
+
+    def rmdir(self, path):
+        """Queue the removal of the empty directory `path`."""
+        self._add_path_command("rmdir", (self._abspath(path),), "RMD {}")
+
+    def chmod(self, path, mode):
+        """Queue the change of the mode of `path` to the integer `mode`."""
+        self._add_path_command(
+            "chmod", (self._abspath(path), mode), "SITE CHMOD 0{:o} {{}}".format(mode)
+        )
+
+    def rename(self, source, target):
+        """
+        Queue renaming `source` to `target`.
+
+        If `target` is in another directory than `source`, the `RNTO`
+        command gets the absolute path of `target`, as in
+        `FTPHost.rename`.
+        """
+        source = self._abspath(source)
+        target = self._abspath(target)
+        source_head, source_tail = self._host.path.split(source)
+        target_head, target_tail = self._host.path.split(target)
+        if target_head != source_head:
+            target_tail = target
+        self._add(
+            "rename",
+            (source, target),
+            source_head,
+            ["RNFR {}".format(source_tail), "RNTO {}".format(target_tail)],
+        )
+
+    def _read_reply(self, session, result):
+        """
+        Read the next reply from `session` and store it in `result`.
+        """
+        try:
+            with ftputil.error.ftplib_error_to_ftp_os_error:
+                reply = session.getresp()
+        except (ftputil.error.TemporaryError, ftputil.error.PermanentError) as exc:
+            # If the first command of an operation failed, the
+            # following commands usually fail, too (for example, `RNTO`
+            # after a failed `RNFR`). Report the first error.
+            if result.error is None:
+                result.error = exc
+                result.reply = None
+            return
+        if result.error is None:
+            result.reply = ftputil.tool.as_str(reply)
+
+    def _send_commands(self, session, results):
+        """
+        Send the commands for `results` over `session` and read all
+        replies.
+        """
+        # Commands sent but not yet answered, with their results
+        pending = collections.deque()
+        for result in results:
+            # pylint: disable=protected-access
+            for command in result._commands:
+                with ftputil.error.ftplib_error_to_ftp_os_error:
+                    session.putcmd(command)
+                pending.append(result)
+                while len(pending) >= self._window:
+                    self._read_reply(session, pending.popleft())
+        while pending:
+            self._read_reply(session, pending.popleft())
+
+    def execute(self):
+        """
+        Send all queued commands and read their replies. Return the
+        list of `BatchResult` objects.
+
+        If one or more commands failed, raise a `BatchError`. Other
+        exceptions, for example if the connection is lost, are raised
+        immediately. In this case, it's not known which of the
+        commands have been executed by the server.
+        """
+        results, self._results = self._results, []
+        if not results:
+            return results
+        host = self._host
+        # Results by directory, in the order of the first operation
+        # in each directory
+        results_by_dir = collections.OrderedDict()
+        for result in results:
+            # pylint: disable=protected-access
+            results_by_dir.setdefault(result._dir_path, []).append(result)
+        old_dir = host.getcwd()
+        try:
+            # The keep-alive thread mustn't take the pending replies.
+            with ftputil.keep_alive.busy_session(host):
+                # pylint: disable=protected-access
+                #
+                # As in `FTPHost._robust_ftp_command`, don't change the
+                # directory if we can't change back.
+                host._check_inaccessible_login_directory()
+                try:
+                    for dir_path, dir_results in results_by_dir.items():
+                        if dir_path != host.getcwd():
+                            try:
+                                host.chdir(dir_path)
+                            except (
+                                ftputil.error.TemporaryError,
+                                ftputil.error.PermanentError,
+                            ) as exc:
+                                # Don't send the commands in the wrong
+                                # directory.
+                                for result in dir_results:
+                                    result.error = exc
+                                continue
+                        self._send_commands(host._session, dir_results)
+                finally:
+                    if host.getcwd() != old_dir:
+                        host.chdir(old_dir)
+        finally:
+            for result in results:
+                if (result.operation == "rename") and (result.reply is not None):
+                    host.stat_cache.rename_tree(*result.args)
+                elif result.operation == "rmdir":
+                    host.stat_cache.invalidate_tree(result.args[0])
+                else:
+                    for path in result.args:
+                        if isinstance(path, str):
+                            host.stat_cache.invalidate(path)
+                if result.operation in ("rmdir", "rename"):
+                    host._forget_dirs(result.args[0])
+        failed_results = [result for result in results if not result.ok]
+        if failed_results:
+            raise ftputil.error.BatchError(
+                "{} of {} batch operations failed, first error: {}".format(
+                    len(failed_results), len(results), failed_results[0].error.strerror
+                ),
+                results=results,
+            )
+        return results
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        # pylint: disable=unused-argument
+        if exc_type is None:
+            self.execute()
+        else:
+            # Don't send commands if the block was left with an
+            # exception.
+            self._results = []
+        return False
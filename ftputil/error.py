@@ -28,6 +28,7 @@ __all__ = [
     "PermanentError",
     "CommandNotImplementedError",
     "SyncError",
+    "BatchError",
     "FTPIOError",
 ]
 
@@ -143,6 +144,23 @@ class SyncError(PermanentError):
     pass
 
 
+class BatchError(FTPOSError):
+    """
+    Raised if commands in a command batch failed (see
+    `FTPHost.batch`).
+    """
+
+    def __init__(self, *args, results=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # `BatchResult` objects for all operations of the batch
+        self.results = results or []
+
+    @property
+    def errors(self):
+        """Return the `BatchResult` objects of the failed operations."""
+        return [result for result in self.results if not result.ok]
+
+
 class FtplibErrorToFTPOSError:
     """
     Context manager to convert `ftplib` exceptions to exceptions
@@ -6,15 +6,127 @@
 ftputil.file - support for file-like objects on FTP servers
 """
 
+import functools
 import io
+import zlib
 
 import ftputil.error
+import ftputil.keep_alive
 
 
 # This module shouldn't be used by clients of the ftputil library.
 __all__ = []
 
 
+class _DecompressingReader(io.RawIOBase):
+    """
+    Raw binary stream which receives the deflate-compressed data of a
+    `MODE Z` transfer from the socket `conn` and returns the
+    decompressed data.
+
+    Each `readinto` call decompresses at most as many bytes as fit
+    into the buffer, so the memory use doesn't depend on the
+    compression ratio.
+    """
+
+    # Maximum number of compressed bytes to receive at once
+    _receive_size = 64 * 1024
+
+    def __init__(self, conn):
+        super().__init__()
+        self._conn = conn
+        self._decompressor = zlib.decompressobj()
+        # Received compressed data which hasn't been decompressed yet
+        self._pending = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        with memoryview(buffer) as view, view.cast("B") as byte_view:
+            while True:
+                if self._decompressor.eof:
+                    return 0
+                try:
+                    data = self._decompressor.decompress(self._pending, len(byte_view))
+                except zlib.error as exc:
+                    raise ftputil.error.FTPIOError(
+                        "invalid MODE Z data: {}".format(exc)
+                    )
+                self._pending = self._decompressor.unconsumed_tail
+                if data:
+                    byte_view[: len(data)] = data
+                    return len(data)
+                if self._decompressor.eof:
+                    return 0
+                self._pending = self._conn.recv(self._receive_size)
+                if not self._pending:
+                    raise ftputil.error.FTPIOError("incomplete MODE Z data")
+
+
+class _CompressingWriter(io.RawIOBase):
+    """
+    Raw binary stream which compresses the written data for a `MODE Z`
+    transfer and sends it over the socket `conn`.
+
+    The compressed stream is finished when the stream is closed.
+    """
+
+    def __init__(self, conn):
+        super().__init__()
+        self._conn = conn
+        self._compressor = zlib.compressobj()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        with memoryview(data) as view:
+            compressed = self._compressor.compress(view)
+            if compressed:
+                self._conn.sendall(compressed)
+            return view.nbytes
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            self._conn.sendall(self._compressor.flush())
+        finally:
+            super().close()
+
+
+def compressed_file(
+    conn, mode, buffering=None, encoding=None, errors=None, newline=None
+):
+    """
+    Return a file object for the data connection `conn` of a `MODE Z`
+    transfer. The arguments are the same as for `socket.makefile`, but
+    reading from the file object returns the decompressed data and
+    writing to it compresses the data.
+    """
+    # pylint: disable=too-many-arguments
+    if "r" in mode:
+        raw = _DecompressingReader(conn)
+    else:
+        raw = _CompressingWriter(conn)
+    if (buffering is None) or (buffering < 0):
+        buffering = io.DEFAULT_BUFFER_SIZE
+    if buffering == 0:
+        if "b" not in mode:
+            raise ValueError("unbuffered streams must be binary")
+        return raw
+    if "r" in mode:
+        buffer = io.BufferedReader(raw, buffering)
+    else:
+        buffer = io.BufferedWriter(raw, buffering)
+    if "b" in mode:
+        return buffer
+    text = io.TextIOWrapper(buffer, encoding, errors, newline)
+    text.mode = mode
+    return text
+
+
 class FTPFile:
     """
     Represents a file-like object associated with an FTP host. File
@@ -34,6 +146,8 @@ class FTPFile:
         self.closed = True
         self._conn = None
         self._fobj = None
+        # `True` if the data connection uses `MODE Z`
+        self._compressed = False
 
     def _open(
         self,
@@ -45,10 +159,13 @@ class FTPFile:
         newline=None,
         *,
         rest=None,
+        compress=False,
     ):
         """
         Open the remote file with given path name and mode.
 
+        If `compress` is true, transfer the data with `MODE Z`.
+
         Contrary to the `open` builtin, this method returns `None`,
         instead this file object is modified in-place.
         """
@@ -75,25 +192,44 @@ class FTPFile:
             raise ftputil.error.CommandNotImplementedError(
                 "`rest` argument can't be used for text files"
             )
+        # The offset for `REST` would be ambiguous for compressed data.
+        if compress and (rest is not None):
+            raise ftputil.error.CommandNotImplementedError(
+                "`rest` argument can't be used with compression"
+            )
         # Always use binary mode and leave any conversions to Python,
         # controlled by the arguments to `makefile` below.
         transfer_type = "I"
         command = "TYPE {}".format(transfer_type)
         with ftputil.error.ftplib_error_to_ftp_io_error:
             self._session.voidcmd(command)
+            # pylint: disable=protected-access
+            self._host._set_transfer_mode(compress)
         # Make transfer command.
         command_type = "RETR" if is_read_mode else "STOR"
         command = "{} {}".format(command_type, path)
-        # Get connection and file object.
-        with ftputil.error.ftplib_error_to_ftp_io_error:
-            self._conn = self._session.transfercmd(command, rest)
-        self._fobj = self._conn.makefile(
-            mode, buffering=buffering, encoding=encoding, errors=errors, newline=newline
-        )
-        # This comes last so that `close` won't try to close `FTPFile`
-        # objects without `_conn` and `_fobj` attributes in case of an
-        # error.
-        self.closed = False
+        # Get connection and file object. The keep-alive thread
+        # considers the session idle while the file is closed, so keep
+        # it from sending a command after the transfer command.
+        with ftputil.keep_alive.busy_session(self._host):
+            with ftputil.error.ftplib_error_to_ftp_io_error:
+                self._conn = self._session.transfercmd(command, rest)
+            if compress:
+                make_file = functools.partial(compressed_file, self._conn)
+            else:
+                make_file = self._conn.makefile
+            self._fobj = make_file(
+                mode,
+                buffering=buffering,
+                encoding=encoding,
+                errors=errors,
+                newline=newline,
+            )
+            self._compressed = compress
+            # This comes last so that `close` won't try to close
+            # `FTPFile` objects without `_conn` and `_fobj` attributes
+            # in case of an error.
+            self.closed = False
 
     def __iter__(self):
         """Return a file iterator."""
@@ -134,9 +270,12 @@ class FTPFile:
         Handle requests for attributes unknown to `FTPFile` objects:
         delegate the requests to the contained file object.
         """
+        # `read1`, `readinto` and `readinto1` are only available for
+        # files opened in binary mode. For text files, the lookup on
+        # the contained file object raises the `AttributeError`.
         if attr_name in (
-            "encoding flush isatty fileno read readline "
-            "readlines seek tell truncate name softspace "
+            "encoding flush isatty fileno read read1 readinto readinto1 "
+            "readline readlines seek tell truncate name softspace "
             "write writelines".split()
         ):
             return getattr(self._fobj, attr_name)
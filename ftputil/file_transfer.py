@@ -6,8 +6,22 @@
 file_transfer.py - upload, download and generic file copy
 """
 
+import errno
+import hashlib
 import os
-
+import socket
+import stat
+import time
+import zlib
+
+try:
+    import ssl
+except ImportError:
+    # Python may have been built without SSL support.
+    ssl = None
+
+import ftputil.file
+import ftputil.rate_limit
 import ftputil.stat
 
 
@@ -20,6 +34,9 @@ __all__ = []
 # Maximum size of chunk in `FTPHost.copyfileobj` in bytes.
 MAX_COPY_CHUNK_SIZE = 64 * 1024
 
+# Pass this as chunk size to adapt the chunk size to the throughput.
+AUTO_CHUNK_SIZE = "auto"
+
 
 class LocalFile:
     """
@@ -62,11 +79,13 @@ class RemoteFile:
     is already transferred.
     """
 
-    def __init__(self, ftp_host, name, mode):
+    def __init__(self, ftp_host, name, mode, compress=None):
         self._host = ftp_host
         self._path = ftp_host.path
         self.name = self._path.abspath(name)
         self.mode = mode
+        # Passed to `FTPHost.open`
+        self._compress = compress
 
     def exists(self):
         """
@@ -88,7 +107,7 @@ class RemoteFile:
 
     def fobj(self):
         """Return a file object for the name/path in the constructor."""
-        return self._host.open(self.name, self.mode)
+        return self._host.open(self.name, self.mode, compress=self._compress)
 
 
 def source_is_newer_than_target(source_file, target_file):
@@ -126,6 +145,48 @@ def source_is_newer_than_target(source_file, target_file):
         )
 
 
+# Algorithm names for `local_checksum` and `FTPHost.checksum`
+CHECKSUM_ALGORITHMS = ("crc32", "md5", "sha1", "sha256", "sha512")
+
+
+class _CRC32:
+    """
+    CRC32 "hash" object with the part of the `hashlib` interface
+    needed by `local_checksum`.
+    """
+
+    def __init__(self):
+        self._crc = 0
+
+    def update(self, data):
+        """Update the checksum with the bytes `data`."""
+        self._crc = zlib.crc32(data, self._crc)
+
+    def hexdigest(self):
+        """Return the checksum as hex string."""
+        return "{:08x}".format(self._crc)
+
+
+def local_checksum(path, algorithm):
+    """
+    Return the checksum of the local file `path` as lowercase hex
+    string. `algorithm` is one of the names in `CHECKSUM_ALGORITHMS`.
+
+    The file is read in chunks, so even large files don't need much
+    memory.
+    """
+    if algorithm not in CHECKSUM_ALGORITHMS:
+        raise ValueError("unsupported checksum algorithm {!r}".format(algorithm))
+    if algorithm == "crc32":
+        hash_ = _CRC32()
+    else:
+        hash_ = hashlib.new(algorithm)
+    with open(path, "rb") as fobj:
+        for chunk in chunks(fobj):
+            hash_.update(chunk)
+    return hash_.hexdigest()
+
+
 def chunks(fobj, max_chunk_size=MAX_COPY_CHUNK_SIZE):
     """
     Return an iterator which yields the contents of the file object.
@@ -145,19 +206,352 @@ def chunks(fobj, max_chunk_size=MAX_COPY_CHUNK_SIZE):
         yield chunk
 
 
+class _FixedChunkSize:
+    """Chunk size which doesn't change during a transfer."""
+
+    def __init__(self, size):
+        self.size = size
+
+    def update(self, byte_count, duration):
+        """Ignore the statistics for a transferred chunk."""
+        # pylint: disable=unused-argument
+        pass
+
+
+class _AdaptiveChunkSize:
+    """
+    Chunk size which adapts to the observed throughput.
+
+    After each chunk, the chunk size is set so that a chunk would take
+    about `TARGET_CHUNK_DURATION` seconds at the throughput of the
+    last chunk. This gives large chunks for fast connections, but
+    keeps the time between two callback calls bounded for slow
+    connections. To smooth the adaption, the chunk size changes at
+    most by a factor of two per chunk and always stays between
+    `MIN_SIZE` and `MAX_SIZE`.
+    """
+
+    MIN_SIZE = 4 * 1024
+    MAX_SIZE = 16 * 1024 * 1024
+    # Duration in seconds
+    TARGET_CHUNK_DURATION = 0.1
+
+    def __init__(self):
+        self.size = MAX_COPY_CHUNK_SIZE
+
+    def update(self, byte_count, duration):
+        """
+        Adapt the chunk size after `byte_count` bytes were transferred in
+        `duration` seconds.
+        """
+        if duration > 0:
+            ideal_size = int(byte_count / duration * self.TARGET_CHUNK_DURATION)
+        else:
+            # Too fast to measure
+            ideal_size = self.MAX_SIZE
+        new_size = max(self.size // 2, min(ideal_size, self.size * 2))
+        self.size = max(self.MIN_SIZE, min(new_size, self.MAX_SIZE))
+
+
+def _chunk_size_object(chunk_size):
+    """
+    Return an object with the attribute `size` (the size of the next
+    chunk) and a method `update` (to be called after each chunk). If
+    `chunk_size` is `AUTO_CHUNK_SIZE`, the size adapts to the
+    throughput. Otherwise `chunk_size` must be a positive integer,
+    which is used as fixed size.
+    """
+    if chunk_size == AUTO_CHUNK_SIZE:
+        return _AdaptiveChunkSize()
+    if (not isinstance(chunk_size, int)) or (chunk_size <= 0):
+        raise ValueError(
+            "chunk size must be a positive integer or {!r}, not {!r}".format(
+                AUTO_CHUNK_SIZE, chunk_size
+            )
+        )
+    return _FixedChunkSize(chunk_size)
+
+
+def _copy_with_buffer(readinto, target_fobj, max_chunk_size, callback, rate_limiter):
+    """
+    Copy data with the bound `readinto` method of the source file
+    object to `target_fobj`.
+
+    Use the same preallocated buffer for all chunks, so that the copy
+    doesn't need to allocate a new `bytes` object for each chunk. (If
+    the chunk size adapts to the throughput, the buffer is only
+    reallocated when the chunk size grows beyond the buffer size.)
+
+    If `rate_limiter` isn't `None`, it's an object with an `acquire`
+    method (see module `rate_limit`), which is called for each chunk.
+    """
+    chunk_size = _chunk_size_object(max_chunk_size)
+    buffer_view = memoryview(bytearray(chunk_size.size))
+    while True:
+        if chunk_size.size > len(buffer_view):
+            buffer_view = memoryview(bytearray(chunk_size.size))
+        start_time = time.monotonic()
+        count = readinto(buffer_view[: chunk_size.size])
+        if not count:
+            break
+        target_fobj.write(buffer_view[:count])
+        if callback is not None:
+            # The buffer is overwritten by the next `readinto` call,
+            # so give the callback its own copy of the data.
+            callback(bytes(buffer_view[:count]))
+        if rate_limiter is not None:
+            rate_limiter.acquire(count)
+        chunk_size.update(count, time.monotonic() - start_time)
+
+
 def copyfileobj(
-    source_fobj, target_fobj, max_chunk_size=MAX_COPY_CHUNK_SIZE, callback=None
+    source_fobj,
+    target_fobj,
+    max_chunk_size=MAX_COPY_CHUNK_SIZE,
+    callback=None,
+    rate_limit=None,
 ):
-    """Copy data from file-like object source to file-like object target."""
+    """
+    Copy data from file-like object source to file-like object target.
+
+    `max_chunk_size` is either a positive integer or `AUTO_CHUNK_SIZE`.
+    In the latter case, the chunk size adapts to the throughput of the
+    transfer.
+
+    `rate_limit` is either `None` (no limit), the maximum throughput
+    in bytes per second or a `rate_limit.RateLimiter`, which can be
+    shared by several transfers.
+    """
+    _copyfileobj(
+        source_fobj,
+        target_fobj,
+        max_chunk_size,
+        callback,
+        ftputil.rate_limit.combined_rate_limiter(rate_limit),
+    )
+
+
+def _copyfileobj(source_fobj, target_fobj, max_chunk_size, callback, rate_limiter):
+    """
+    Copy data from file-like object source to file-like object target.
+
+    `rate_limiter` is `None` or an object with an `acquire` method.
+    """
     # Inspired by `shutil.copyfileobj` (I don't use the `shutil`
     # code directly because it might change)
-    for chunk in chunks(source_fobj, max_chunk_size):
+    #
+    # Binary files usually support `readinto`, text files don't.
+    try:
+        readinto = source_fobj.readinto
+    except AttributeError:
+        readinto = None
+    if readinto is not None:
+        _copy_with_buffer(readinto, target_fobj, max_chunk_size, callback, rate_limiter)
+        return
+    chunk_size = _chunk_size_object(max_chunk_size)
+    while True:
+        start_time = time.monotonic()
+        chunk = source_fobj.read(chunk_size.size)
+        if not chunk:
+            break
         target_fobj.write(chunk)
         if callback is not None:
             callback(chunk)
+        if rate_limiter is not None:
+            rate_limiter.acquire(len(chunk))
+        chunk_size.update(len(chunk), time.monotonic() - start_time)
 
 
-def copy_file(source_file, target_file, conditional, callback):
+def _data_socket(fobj, allow_tls):
+    """
+    Return the data connection socket of `fobj` if `fobj` is an
+    `FTPFile` with a socket as data connection which doesn't use
+    `MODE Z`. If `allow_tls` is false, only return plain (unencrypted)
+    sockets. Otherwise return `None`.
+    """
+    if not isinstance(fobj, ftputil.file.FTPFile):
+        return None
+    # pylint: disable=protected-access
+    # With `MODE Z`, the socket carries the compressed data.
+    if fobj._compressed:
+        return None
+    data_socket = fobj._conn
+    if not isinstance(data_socket, socket.socket):
+        return None
+    is_tls_socket = (ssl is not None) and isinstance(data_socket, ssl.SSLSocket)
+    if is_tls_socket and not allow_tls:
+        return None
+    return data_socket
+
+
+def _send_local_file(source_fobj, target_fobj, max_chunk_size, rate_limiter):
+    """
+    Try to send the local file object `source_fobj` to the remote file
+    `target_fobj` without copying the data through user space.
+
+    Return `True` if the data was sent, else `False`. In the latter
+    case, nothing has been sent yet and the caller should use the
+    buffered copy instead.
+
+    Without a `rate_limiter`, the whole file is sent with a single
+    `sendfile` call. Otherwise the file is sent in chunks of
+    `max_chunk_size` bytes, so that the limiter can throttle the
+    transfer.
+    """
+    data_socket = _data_socket(target_fobj, allow_tls=False)
+    if data_socket is None:
+        return False
+    # Nothing should have been written to the file object yet, but
+    # make sure its buffer is empty before bypassing it.
+    target_fobj.flush()
+    # `socket.sendfile` uses `os.sendfile` if available, else it falls
+    # back to `socket.send`.
+    if rate_limiter is None:
+        data_socket.sendfile(source_fobj)
+        return True
+    chunk_size = _chunk_size_object(max_chunk_size)
+    while True:
+        start_time = time.monotonic()
+        # `socket.sendfile` starts at the given offset (not the current
+        # file position), but afterwards sets the file position after
+        # the sent bytes.
+        count = data_socket.sendfile(
+            source_fobj, offset=source_fobj.tell(), count=chunk_size.size
+        )
+        if not count:
+            break
+        rate_limiter.acquire(count)
+        chunk_size.update(count, time.monotonic() - start_time)
+    return True
+
+
+def _splice_to_file(data_socket, target_fobj, max_chunk_size, rate_limiter):
+    """
+    Try to move the data from the plain socket `data_socket` to the
+    local file object `target_fobj` with `os.splice`, i. e. inside the
+    kernel.
+
+    Return `True` if the data was moved, else `False`. In the latter
+    case, nothing has been received yet.
+    """
+    # `os.splice` is only available on Linux (with Python 3.10 or
+    # later). It needs a blocking socket; sockets with a timeout are
+    # non-blocking on the file descriptor level.
+    if (not hasattr(os, "splice")) or (data_socket.gettimeout() is not None):
+        return False
+    target_fobj.flush()
+    target_fd = target_fobj.fileno()
+    if not stat.S_ISREG(os.fstat(target_fd).st_mode):
+        return False
+    chunk_size = _chunk_size_object(max_chunk_size)
+    # `splice` needs a pipe as one end of each call.
+    pipe_read_fd, pipe_write_fd = os.pipe()
+    try:
+        received_any_data = False
+        while True:
+            try:
+                count = os.splice(data_socket.fileno(), pipe_write_fd, chunk_size.size)
+            except OSError as exc:
+                # The kernel may not support `splice` for this
+                # combination of socket and file.
+                if (not received_any_data) and exc.errno in (
+                    errno.EINVAL,
+                    errno.ENOSYS,
+                    errno.EOPNOTSUPP,
+                ):
+                    return False
+                raise
+            if count == 0:
+                break
+            received_any_data = True
+            if rate_limiter is not None:
+                rate_limiter.acquire(count)
+            while count > 0:
+                count -= os.splice(pipe_read_fd, target_fd, count)
+    finally:
+        os.close(pipe_read_fd)
+        os.close(pipe_write_fd)
+    return True
+
+
+def _receive_remote_file(
+    source_fobj, target_fobj, max_chunk_size, callback, rate_limiter
+):
+    """
+    Try to receive the data of the remote file object `source_fobj`
+    directly from its data socket, bypassing the buffered file object
+    around the socket, and write it to the local file object
+    `target_fobj`.
+
+    Return `True` if the data was received, else `False`. In the
+    latter case, nothing has been received yet and the caller should
+    use the buffered copy instead.
+    """
+    data_socket = _data_socket(source_fobj, allow_tls=True)
+    if data_socket is None:
+        return False
+    # The callback needs the transferred data, so we can only use
+    # `splice` without a callback.
+    if (
+        (callback is None)
+        and (_data_socket(source_fobj, allow_tls=False) is not None)
+        and _splice_to_file(data_socket, target_fobj, max_chunk_size, rate_limiter)
+    ):
+        return True
+    # Nothing has been read from the file object yet, so its buffer is
+    # empty and we can read from the socket directly.
+    _copy_with_buffer(
+        data_socket.recv_into, target_fobj, max_chunk_size, callback, rate_limiter
+    )
+    return True
+
+
+def _copy_fobj(
+    source_file,
+    source_fobj,
+    target_file,
+    target_fobj,
+    max_chunk_size,
+    callback,
+    rate_limiter,
+):
+    """
+    Copy the data from `source_fobj` to `target_fobj`. These are the
+    opened file objects for `source_file` and `target_file`,
+    respectively.
+
+    Where possible, bypass the buffered file objects around data
+    sockets.
+    """
+    local_to_remote = isinstance(source_file, LocalFile) and isinstance(
+        target_file, RemoteFile
+    )
+    remote_to_local = isinstance(source_file, RemoteFile) and isinstance(
+        target_file, LocalFile
+    )
+    # The callback needs the transferred data, so we can only use
+    # `sendfile` without a callback.
+    if (
+        local_to_remote
+        and (callback is None)
+        and _send_local_file(source_fobj, target_fobj, max_chunk_size, rate_limiter)
+    ):
+        return
+    if remote_to_local and _receive_remote_file(
+        source_fobj, target_fobj, max_chunk_size, callback, rate_limiter
+    ):
+        return
+    _copyfileobj(source_fobj, target_fobj, max_chunk_size, callback, rate_limiter)
+
+
+def copy_file(
+    source_file,
+    target_file,
+    conditional,
+    callback,
+    max_chunk_size=MAX_COPY_CHUNK_SIZE,
+    rate_limiter=None,
+):
     """
     Copy a file from `source_file` to `target_file`.
 
@@ -168,7 +562,13 @@ def copy_file(source_file, target_file, conditional, callback):
     source. If `conditional` is false, the file is copied
     unconditionally. Return `True` if the file was copied, else
     `False`.
+
+    `max_chunk_size` is the chunk size for the copy (see
+    `copyfileobj`). `rate_limiter` is `None` or an object with an
+    `acquire` method to throttle the copy (see module `rate_limit`).
     """
+    # Fail early for an invalid chunk size, before opening any files.
+    _chunk_size_object(max_chunk_size)
     if conditional:
         # Evaluate condition: The target file either doesn't exist or is
         # older than the source file. If in doubt (due to imprecise
@@ -183,7 +583,15 @@ def copy_file(source_file, target_file, conditional, callback):
     try:
         target_fobj = target_file.fobj()
         try:
-            copyfileobj(source_fobj, target_fobj, callback=callback)
+            _copy_fobj(
+                source_file,
+                source_fobj,
+                target_file,
+                target_fobj,
+                max_chunk_size,
+                callback,
+                rate_limiter,
+            )
         finally:
             target_fobj.close()
     finally:
@@ -8,16 +8,24 @@
 See `__init__.py` for an example.
 """
 
+import concurrent.futures
 import datetime
 import ftplib
+import hashlib
+import os
 import stat
 import sys
 import time
 
+import ftputil.batch
 import ftputil.error
 import ftputil.file
 import ftputil.file_transfer
+import ftputil.keep_alive
+import ftputil.lrucache
 import ftputil.path
+import ftputil.rate_limit
+import ftputil.session_pool
 import ftputil.stat
 import ftputil.tool
 
@@ -95,6 +103,50 @@ class FTPHost:
         # understand the `-a` option and interprets it as a path, the
         # results can be surprising. See ticket #110.
         self.use_list_a_option = False
+        # Use `MODE Z` for transfers and directory listings if the
+        # server supports it. See `_use_compression`.
+        self.use_compression = False
+        # Current transfer mode of the session, "S" (stream) or "Z"
+        # (compressed), see `_set_transfer_mode`
+        self._transfer_mode = "S"
+        # Limit for the throughput of all uploads and downloads of this
+        # host. See the `rate_limit` property.
+        self._rate_limiter = None
+        # Formats of the commands to set the modification time of a
+        # file, in the order they're tried. Formats which the server
+        # doesn't support are removed, see `utime`.
+        self._utime_command_formats = [
+            "MFMT {timestamp} {path}",
+            "SITE UTIME {timestamp} {path}",
+        ]
+        # Lines of the server's `FEAT` reply, see `_features`
+        self._feature_lines = None
+        # `True` or `False` after checking if the server supports
+        # `SITE CPFR`/`SITE CPTO`, see `_server_side_copy_supported`
+        self._server_side_copy = None
+        # Algorithm currently selected for the `HASH` command, see
+        # `checksum`
+        self._hash_command_algorithm = None
+        # Checksum commands ("HASH" or the `X*` commands) which the
+        # server doesn't implement, see `checksum`
+        self._unsupported_checksum_commands = set()
+        # Absolute paths of directories which are known to exist
+        # because this host created them or changed into them in
+        # `makedirs`. The entries expire like stat cache entries, see
+        # `_is_known_dir`.
+        self._known_dirs = ftputil.lrucache.LRUCache()
+        # `KeepAlive` object while the background keep-alive thread
+        # runs, see `start_keep_alive`
+        self._keep_alive = None
+        # `None` or a tuple `(max_attempts, initial_delay, max_delay)`,
+        # see `enable_auto_reconnect`
+        self._reconnect_policy = None
+        # Set after the connection to the server has been lost, so
+        # that the next operation reconnects first
+        self._needs_reconnect = False
+        # `True` while a `_call_with_reconnect` call is running, so
+        # that nested calls don't retry on their own
+        self._in_call_with_reconnect = False
 
     def keep_alive(self):
         """
@@ -111,6 +163,149 @@ class FTPHost:
             # Ignore return value.
             self._session.pwd()
 
+    def start_keep_alive(self, interval=60.0):
+        """
+        Start a background thread which sends a `NOOP` command to
+        each session of this `FTPHost` object that hasn't been used
+        for `interval` seconds. This includes the sessions for remote
+        files (see `open`) and the sessions of worker connections, for
+        example for `rmtree` with several workers.
+
+        Sessions with an open remote file and sessions which are used
+        at the moment aren't touched.
+
+        If the keep-alive thread is already running, raise a
+        `RuntimeError`.
+        """
+        if self._keep_alive is not None:
+            raise RuntimeError("keep-alive thread is already running")
+        keep_alive = ftputil.keep_alive.KeepAlive(self, interval)
+        keep_alive.start()
+        self._keep_alive = keep_alive
+
+    def stop_keep_alive(self):
+        """
+        Stop the keep-alive thread started with `start_keep_alive`
+        and wait until it has finished. If the thread isn't running,
+        do nothing.
+        """
+        keep_alive, self._keep_alive = self._keep_alive, None
+        if keep_alive is not None:
+            keep_alive.stop()
+
+    #
+    # Reconnecting after a lost connection
+    #
+    def reconnect(self):
+        """
+        Replace the session of this `FTPHost` object with a new
+        connection to the server and change to the current directory
+        of the previous session.
+
+        The stat cache, the time shift, the directory parser and the
+        other settings of this `FTPHost` object are kept. Remote files
+        opened before aren't affected.
+        """
+        old_session = self._session
+        try:
+            with ftputil.error.ftplib_error_to_ftp_os_error:
+                old_session.close()
+        # The old connection is probably broken anyway.
+        except ftputil.error.FTPOSError:
+            pass
+        self._session = self._make_session()
+        if self._keep_alive is not None:
+            self._keep_alive.guard(self)
+        # The selected `HASH` algorithm and the transfer mode are
+        # settings of the session.
+        self._hash_command_algorithm = None
+        self._transfer_mode = "S"
+        with ftputil.error.ftplib_error_to_ftp_os_error:
+            self._session.cwd(self._cached_current_dir)
+        self._needs_reconnect = False
+
+    def enable_auto_reconnect(self, max_attempts=3, initial_delay=0.5, max_delay=30.0):
+        """
+        Reconnect automatically (see `reconnect`) if the connection to
+        the server has been lost, that is, if the server replied with
+        status code 421 or the connection was closed or timed out.
+
+        Operations which can be repeated without changing the result
+        (listing directories, `stat`, `chdir`, `chmod`, `utime` and
+        `checksum`) are tried up to `max_attempts` times in total. The
+        delay before the first retry is `initial_delay` seconds. It
+        doubles for each further retry, up to `max_delay` seconds.
+
+        Other operations, for example `remove` or `rename`, aren't
+        repeated because it's unknown whether the server executed them
+        before the connection was lost. They raise the original
+        exception, but the next operation reconnects first.
+        """
+        if max_attempts < 1:
+            raise ValueError(
+                "max_attempts must be at least 1, not {!r}".format(max_attempts)
+            )
+        self._reconnect_policy = (max_attempts, initial_delay, max_delay)
+
+    def disable_auto_reconnect(self):
+        """Don't reconnect automatically anymore."""
+        self._reconnect_policy = None
+        self._needs_reconnect = False
+
+    @staticmethod
+    def _is_connection_error(exc):
+        """
+        Return `True` if the `FTPOSError` `exc` indicates that the
+        connection to the server has been lost, else `False`.
+        """
+        if isinstance(exc, ftputil.error.TemporaryError):
+            # "Service not available, closing control connection"
+            return exc.errno == 421
+        if isinstance(exc, ftputil.error.PermanentError):
+            return False
+        # `ftplib_error_to_ftp_os_error` raises a plain `FTPOSError`
+        # for an `EOFError` or `OSError`, for example a socket
+        # timeout.
+        original_exception = exc.__context__
+        return isinstance(original_exception, (EOFError, OSError)) and not isinstance(
+            original_exception, ftputil.error.FTPError
+        )
+
+    def _call_with_reconnect(self, function, idempotent):
+        """
+        Return the result of calling `function` without arguments.
+
+        If auto-reconnect is enabled and the connection has been lost,
+        reconnect and, if `idempotent` is true, call `function` again
+        (see `enable_auto_reconnect`).
+        """
+        if (self._reconnect_policy is None) or self._in_call_with_reconnect:
+            return function()
+        max_attempts, delay, max_delay = self._reconnect_policy
+        # The current directory may be changed in `function`. After a
+        # failure, the changes may not have been undone.
+        current_dir = self._cached_current_dir
+        attempt = 1
+        self._in_call_with_reconnect = True
+        try:
+            while True:
+                try:
+                    if self._needs_reconnect:
+                        self.reconnect()
+                    return function()
+                except ftputil.error.FTPOSError as exc:
+                    if not self._is_connection_error(exc):
+                        raise
+                    self._needs_reconnect = True
+                    self._cached_current_dir = current_dir
+                    if (not idempotent) or (attempt >= max_attempts):
+                        raise
+                time.sleep(delay)
+                delay = min(2 * delay, max_delay)
+                attempt += 1
+        finally:
+            self._in_call_with_reconnect = False
+
     #
     # Dealing with child sessions and file-like objects
     # (rather low-level)
@@ -196,6 +391,7 @@ class FTPHost:
         newline=None,
         *,
         rest=None,
+        compress=None,
     ):
         """
         Return an open file(-like) object which is associated with
@@ -208,15 +404,23 @@ class FTPHost:
         - reading will start at the byte (zero-based) `rest`
         - writing will overwrite the remote file from byte `rest`
 
+        If `compress` is true, the data is transferred with `MODE Z`.
+        If it's `None` (the default), the `use_compression` attribute
+        decides (see `_use_compression`).
+
         This method tries to reuse a child but will generate a new one
         if none is available.
         """
         # Support the same arguments as `open`.
         # pylint: disable=too-many-arguments
         path = ftputil.tool.as_str_path(path)
+        compress = self._use_compression(compress)
         host = self._available_child()
         if host is None:
             host = self._copy()
+            if self._keep_alive is not None:
+                # Guard the session before `FTPFile` stores it.
+                self._keep_alive.guard(host)
             self._children.append(host)
             host._file = ftputil.file.FTPFile(host)
         basedir = self.getcwd()
@@ -245,6 +449,7 @@ class FTPHost:
             errors=errors,
             newline=newline,
             rest=rest,
+            compress=compress,
         )
         if "w" in mode:
             # Invalidate cache entry because size and timestamps will change.
@@ -255,6 +460,7 @@ class FTPHost:
         """Close host connection."""
         if self.closed:
             return
+        self.stop_keep_alive()
         # Close associated children.
         for host in self._children:
             # Children have a `_file` attribute which is an `FTPFile` object.
@@ -303,6 +509,19 @@ class FTPHost:
         # Set the parser explicitly, don't allow "smart" switching anymore.
         self._stat._parser = parser
         self._stat._allow_parser_switching = False
+        self._stat._parser_detection = None
+
+    @property
+    def parser_detection(self):
+        """
+        Return a tuple `(parser, confidence)` for the parser detected
+        from the first non-empty directory listing, or `None` if no
+        parser has been detected (yet).
+
+        `confidence` is the fraction of the sampled listing lines the
+        parser could parse, from 0.0 to 1.0.
+        """
+        return self._stat._parser_detection
 
     #
     # Time shift adjustment between client (i. e. us) and server
@@ -448,6 +667,36 @@ class FTPHost:
             time_shift = server_datetime.timestamp() - now
         self.set_time_shift(time_shift)
 
+    #
+    # Bandwidth throttling
+    #
+    @property
+    def rate_limit(self):
+        """
+        Return the `ftputil.rate_limit.RateLimiter` which limits the
+        throughput of all uploads and downloads of this host together,
+        or `None` if there's no such limit.
+        """
+        return self._rate_limiter
+
+    @rate_limit.setter
+    def rate_limit(self, rate_limit):
+        """
+        Set the host-wide limit for the throughput of uploads and
+        downloads. `rate_limit` is `None` (no limit), the maximum rate
+        in bytes per second or a `ftputil.rate_limit.RateLimiter`,
+        which may be shared with other hosts.
+        """
+        self._rate_limiter = ftputil.rate_limit.rate_limiter(rate_limit)
+
+    def _transfer_rate_limiter(self, rate_limit):
+        """
+        Return an object to throttle a transfer with the limit
+        `rate_limit` for this transfer and the host-wide limit, or
+        `None` if there's no limit at all.
+        """
+        return ftputil.rate_limit.combined_rate_limiter(rate_limit, self._rate_limiter)
+
     #
     # Operations based on file-like objects (rather high-level),
     # like upload and download
@@ -462,44 +711,92 @@ class FTPHost:
         target,
         max_chunk_size=ftputil.file_transfer.MAX_COPY_CHUNK_SIZE,
         callback=None,
+        rate_limit=None,
     ):
         """
         Copy data from file-like object `source` to file-like object
         `target`.
+
+        `max_chunk_size` is the maximum size of the chunks in bytes or
+        "auto" to adapt the chunk size to the throughput.
+
+        `rate_limit` is `None` (no limit), the maximum rate in bytes
+        per second or a `ftputil.rate_limit.RateLimiter`.
         """
-        ftputil.file_transfer.copyfileobj(source, target, max_chunk_size, callback)
+        ftputil.file_transfer.copyfileobj(
+            source, target, max_chunk_size, callback, rate_limit
+        )
 
-    def _upload_files(self, source_path, target_path):
+    def _upload_files(self, source_path, target_path, compress=None):
         """
         Return a `LocalFile` and `RemoteFile` as source and target,
         respectively.
 
         The strings `source_path` and `target_path` are the (absolute
         or relative) paths of the local and the remote file, respectively.
+        `compress` is passed to `open` for the remote file.
         """
         source_file = ftputil.file_transfer.LocalFile(source_path, "rb")
         # Passing `self` (the `FTPHost` instance) here is correct.
-        target_file = ftputil.file_transfer.RemoteFile(self, target_path, "wb")
+        target_file = ftputil.file_transfer.RemoteFile(
+            self, target_path, "wb", compress
+        )
         return source_file, target_file
 
-    def upload(self, source, target, callback=None):
+    def upload(
+        self,
+        source,
+        target,
+        callback=None,
+        *,
+        chunk_size=ftputil.file_transfer.MAX_COPY_CHUNK_SIZE,
+        rate_limit=None,
+        compress=None,
+    ):
         """
         Upload a file from the local source (name) to the remote
         target (name).
 
         If a callable `callback` is given, it's called after every
-        chunk of transferred data. The chunk size is a constant
-        defined in `file_transfer`. The callback will be called with a
+        chunk of transferred data. The callback will be called with a
         single argument, the data chunk that was transferred before
         the callback was called.
+
+        `chunk_size` is the maximum size of the chunks in bytes. If
+        it's "auto", the chunk size adapts to the throughput of the
+        transfer, keeping the time between callback calls bounded.
+
+        `rate_limit` limits the throughput of this transfer. It's
+        either the maximum rate in bytes per second or a
+        `ftputil.rate_limit.RateLimiter`, which may be shared with
+        other transfers. The host-wide limit in the `rate_limit`
+        attribute applies in addition.
+
+        If `compress` is true, transfer the data with `MODE Z`. If
+        it's `None` (the default), the `use_compression` attribute
+        decides. The callback gets the uncompressed data.
         """
         target = ftputil.tool.as_str_path(target)
-        source_file, target_file = self._upload_files(source, target)
+        source_file, target_file = self._upload_files(source, target, compress)
         ftputil.file_transfer.copy_file(
-            source_file, target_file, conditional=False, callback=callback
+            source_file,
+            target_file,
+            conditional=False,
+            callback=callback,
+            max_chunk_size=chunk_size,
+            rate_limiter=self._transfer_rate_limiter(rate_limit),
         )
 
-    def upload_if_newer(self, source, target, callback=None):
+    def upload_if_newer(
+        self,
+        source,
+        target,
+        callback=None,
+        *,
+        chunk_size=ftputil.file_transfer.MAX_COPY_CHUNK_SIZE,
+        rate_limit=None,
+        compress=None,
+    ):
         """
         Upload a file only if it's newer than the target on the
         remote host or if the target file does not exist. See the
@@ -508,47 +805,104 @@ class FTPHost:
         If an upload was necessary, return `True`, else return `False`.
 
         If a callable `callback` is given, it's called after every
-        chunk of transferred data. The chunk size is a constant
-        defined in `file_transfer`. The callback will be called with a
+        chunk of transferred data. The callback will be called with a
         single argument, the data chunk that was transferred before
         the callback was called.
+
+        `chunk_size` is the maximum size of the chunks in bytes. If
+        it's "auto", the chunk size adapts to the throughput of the
+        transfer, keeping the time between callback calls bounded.
+
+        `rate_limit` limits the throughput of this transfer. It's
+        either the maximum rate in bytes per second or a
+        `ftputil.rate_limit.RateLimiter`, which may be shared with
+        other transfers. The host-wide limit in the `rate_limit`
+        attribute applies in addition.
+
+        If `compress` is true, transfer the data with `MODE Z`. If
+        it's `None` (the default), the `use_compression` attribute
+        decides. The callback gets the uncompressed data.
         """
         target = ftputil.tool.as_str_path(target)
-        source_file, target_file = self._upload_files(source, target)
+        source_file, target_file = self._upload_files(source, target, compress)
         return ftputil.file_transfer.copy_file(
-            source_file, target_file, conditional=True, callback=callback
+            source_file,
+            target_file,
+            conditional=True,
+            callback=callback,
+            max_chunk_size=chunk_size,
+            rate_limiter=self._transfer_rate_limiter(rate_limit),
         )
 
-    def _download_files(self, source_path, target_path):
+    def _download_files(self, source_path, target_path, compress=None):
         """
         Return a `RemoteFile` and `LocalFile` as source and target,
         respectively.
 
         The strings `source_path` and `target_path` are the (absolute
         or relative) paths of the remote and the local file, respectively.
+        `compress` is passed to `open` for the remote file.
         """
-        source_file = ftputil.file_transfer.RemoteFile(self, source_path, "rb")
+        source_file = ftputil.file_transfer.RemoteFile(
+            self, source_path, "rb", compress
+        )
         target_file = ftputil.file_transfer.LocalFile(target_path, "wb")
         return source_file, target_file
 
-    def download(self, source, target, callback=None):
+    def download(
+        self,
+        source,
+        target,
+        callback=None,
+        *,
+        chunk_size=ftputil.file_transfer.MAX_COPY_CHUNK_SIZE,
+        rate_limit=None,
+        compress=None,
+    ):
         """
         Download a file from the remote source (name) to the local
         target (name).
 
         If a callable `callback` is given, it's called after every
-        chunk of transferred data. The chunk size is a constant
-        defined in `file_transfer`. The callback will be called with a
+        chunk of transferred data. The callback will be called with a
         single argument, the data chunk that was transferred before
         the callback was called.
+
+        `chunk_size` is the maximum size of the chunks in bytes. If
+        it's "auto", the chunk size adapts to the throughput of the
+        transfer, keeping the time between callback calls bounded.
+
+        `rate_limit` limits the throughput of this transfer. It's
+        either the maximum rate in bytes per second or a
+        `ftputil.rate_limit.RateLimiter`, which may be shared with
+        other transfers. The host-wide limit in the `rate_limit`
+        attribute applies in addition.
+
+        If `compress` is true, transfer the data with `MODE Z`. If
+        it's `None` (the default), the `use_compression` attribute
+        decides. The callback gets the uncompressed data.
         """
         source = ftputil.tool.as_str_path(source)
-        source_file, target_file = self._download_files(source, target)
+        source_file, target_file = self._download_files(source, target, compress)
         ftputil.file_transfer.copy_file(
-            source_file, target_file, conditional=False, callback=callback
+            source_file,
+            target_file,
+            conditional=False,
+            callback=callback,
+            max_chunk_size=chunk_size,
+            rate_limiter=self._transfer_rate_limiter(rate_limit),
         )
 
-    def download_if_newer(self, source, target, callback=None):
+    def download_if_newer(
+        self,
+        source,
+        target,
+        callback=None,
+        *,
+        chunk_size=ftputil.file_transfer.MAX_COPY_CHUNK_SIZE,
+        rate_limit=None,
+        compress=None,
+    ):
         """
         Download a file only if it's newer than the target on the
         local host or if the target file does not exist. See the
@@ -558,16 +912,277 @@ class FTPHost:
         `False`.
 
         If a callable `callback` is given, it's called after every
-        chunk of transferred data. The chunk size is a constant
-        defined in `file_transfer`. The callback will be called with a
+        chunk of transferred data. The callback will be called with a
         single argument, the data chunk that was transferred before
         the callback was called.
+
+        `chunk_size` is the maximum size of the chunks in bytes. If
+        it's "auto", the chunk size adapts to the throughput of the
+        transfer, keeping the time between callback calls bounded.
+
+        `rate_limit` limits the throughput of this transfer. It's
+        either the maximum rate in bytes per second or a
+        `ftputil.rate_limit.RateLimiter`, which may be shared with
+        other transfers. The host-wide limit in the `rate_limit`
+        attribute applies in addition.
+
+        If `compress` is true, transfer the data with `MODE Z`. If
+        it's `None` (the default), the `use_compression` attribute
+        decides. The callback gets the uncompressed data.
         """
         source = ftputil.tool.as_str_path(source)
-        source_file, target_file = self._download_files(source, target)
+        source_file, target_file = self._download_files(source, target, compress)
         return ftputil.file_transfer.copy_file(
-            source_file, target_file, conditional=True, callback=callback
+            source_file,
+            target_file,
+            conditional=True,
+            callback=callback,
+            max_chunk_size=chunk_size,
+            rate_limiter=self._transfer_rate_limiter(rate_limit),
+        )
+
+    def _files_differ(self, local_path, remote_path, algorithm):
+        """
+        Return `True` if the local file `local_path` and the remote
+        file `remote_path` differ, else `False`. A missing file counts
+        as different.
+
+        The sizes are compared first. Only if they're the same, the
+        checksums are compared (see `checksum`).
+        """
+        if not (os.path.isfile(local_path) and self.path.isfile(remote_path)):
+            return True
+        if os.path.getsize(local_path) != self.path.getsize(remote_path):
+            return True
+        return ftputil.file_transfer.local_checksum(
+            local_path, algorithm
+        ) != self.checksum(remote_path, algorithm)
+
+    def upload_if_changed(
+        self,
+        source,
+        target,
+        callback=None,
+        *,
+        algorithm="sha256",
+        chunk_size=ftputil.file_transfer.MAX_COPY_CHUNK_SIZE,
+        rate_limit=None,
+        compress=None,
+    ):
+        """
+        Upload a file only if the target doesn't exist or if its
+        content differs from the local source file. See the method
+        `upload` for the meaning of the other parameters.
+
+        The contents are compared by size and, if the sizes are the
+        same, by the checksums with the algorithm `algorithm` (see
+        `checksum`). Unlike `upload_if_newer`, this doesn't depend on
+        the precision of timestamps. If the server can't calculate
+        checksums, raise a `CommandNotImplementedError`.
+
+        If an upload was necessary, return `True`, else return `False`.
+        """
+        target = ftputil.tool.as_str_path(target)
+        if not self._files_differ(source, target, algorithm):
+            return False
+        self.upload(
+            source,
+            target,
+            callback,
+            chunk_size=chunk_size,
+            rate_limit=rate_limit,
+            compress=compress,
+        )
+        return True
+
+    def download_if_changed(
+        self,
+        source,
+        target,
+        callback=None,
+        *,
+        algorithm="sha256",
+        chunk_size=ftputil.file_transfer.MAX_COPY_CHUNK_SIZE,
+        rate_limit=None,
+        compress=None,
+    ):
+        """
+        Download a file only if the target doesn't exist or if its
+        content differs from the remote source file. See the methods
+        `download` and `upload_if_changed` for the meaning of the
+        parameters.
+
+        If a download was necessary, return `True`, else return
+        `False`.
+        """
+        source = ftputil.tool.as_str_path(source)
+        if not self._files_differ(target, source, algorithm):
+            return False
+        self.download(
+            source,
+            target,
+            callback,
+            chunk_size=chunk_size,
+            rate_limit=rate_limit,
+            compress=compress,
         )
+        return True
+
+    #
+    # Server-to-server transfers
+    #
+    @staticmethod
+    def _uses_tls(session):
+        """
+        Return `True` if `session` is an `ftplib.FTP_TLS` session,
+        else `False`.
+        """
+        # `ftplib.FTP_TLS` isn't available if Python was built without
+        # SSL support.
+        ftp_tls_class = getattr(ftplib, "FTP_TLS", None)
+        # The keep-alive thread may have wrapped the session.
+        session = ftputil.keep_alive.unwrapped_session(session)
+        return (ftp_tls_class is not None) and isinstance(session, ftp_tls_class)
+
+    @staticmethod
+    def _passive_address(session):
+        """
+        Send `PASV` to `session` and return the address `(host, port)`
+        where the server listens for the data connection.
+
+        Like `ftplib.FTP.makepasv`, use the host of the command
+        connection instead of the host in the reply, unless the
+        `trust_server_pasv_ipv4_address` attribute of the session is
+        true.
+        """
+        untrusted_host, port = ftplib.parse227(session.sendcmd("PASV"))
+        if getattr(session, "trust_server_pasv_ipv4_address", False):
+            return untrusted_host, port
+        return session.sock.getpeername()[0], port
+
+    def _fxp_transfer(self, other_host, source_name, target_name):
+        """
+        Transfer the file `source_name` in the current directory of
+        this host to `target_name` in the current directory of
+        `other_host`, directly between the servers.
+        """
+        source_session = self._session
+        target_session = other_host._session
+        with ftputil.error.ftplib_error_to_ftp_os_error:
+            source_session.voidcmd("TYPE I")
+            target_session.voidcmd("TYPE I")
+            # A compressed directory listing may have left a session
+            # in `MODE Z`. The servers must use the same mode.
+            self._set_transfer_mode(False)
+            other_host._set_transfer_mode(False)
+        # As in `ftplib.ftpcp`, the source server listens for the data
+        # connection and the target server connects to it. Many
+        # servers refuse a `PORT` command for an address other than
+        # the client's.
+        try:
+            with ftputil.error.ftplib_error_to_ftp_os_error:
+                host, port = self._passive_address(source_session)
+        except ftputil.error.PermanentError as exc:
+            raise ftputil.error.CommandNotImplementedError(
+                "server-to-server transfer not supported: {}".format(exc.strerror)
+            )
+        try:
+            with ftputil.error.ftplib_error_to_ftp_os_error:
+                target_session.sendport(host, port)
+        except ftputil.error.PermanentError as exc:
+            # Don't leave the source server listening.
+            try:
+                source_session.abort()
+            except ftplib.all_errors:
+                pass
+            raise ftputil.error.CommandNotImplementedError(
+                "server-to-server transfer not supported: {}".format(exc.strerror)
+            )
+        try:
+            with ftputil.error.ftplib_error_to_ftp_os_error:
+                # RFC 959 requires that the "listening" side gets its
+                # transfer command first. Here that's the target server
+                # because it received the `PORT` command.
+                try:
+                    target_session.sendcmd("STOR {}".format(target_name))
+                except ftplib.all_errors:
+                    # Don't leave the source server listening.
+                    try:
+                        source_session.abort()
+                    except ftplib.all_errors:
+                        pass
+                    raise
+                try:
+                    source_session.sendcmd("RETR {}".format(source_name))
+                except ftplib.all_errors:
+                    # The target server still waits for the data.
+                    try:
+                        target_session.abort()
+                    except ftplib.all_errors:
+                        pass
+                    raise
+                try:
+                    source_session.voidresp()
+                finally:
+                    target_session.voidresp()
+        except ftputil.error.FTPOSError as exc:
+            # Some servers accept the `PORT` command, but refuse the
+            # data connection to a third party when it's opened.
+            if exc.errno not in self._data_connection_reply_codes:
+                raise
+            # Don't leave a partial file behind. If the removal fails,
+            # a copy via the client overwrites the file anyway.
+            try:
+                target_session.delete(target_name)
+            except ftplib.all_errors:
+                pass
+            raise ftputil.error.CommandNotImplementedError(
+                "server-to-server transfer failed: {}".format(exc.strerror)
+            )
+
+    def copy_to(self, other_host, source, target):
+        """
+        Copy the file `source` on this host to the file `target` on
+        the `FTPHost` `other_host`. The data is transferred directly
+        between the servers ("FXP"), not via the client.
+
+        Both servers must allow server-to-server transfers, i. e. the
+        target server must accept a `PORT` command with the address of
+        the source server. If a server refuses the transfer or the data
+        connection between the servers fails, raise a
+        `CommandNotImplementedError`. In the latter case, a partial
+        `target` file is removed if possible. FXP isn't supported for
+        TLS connections.
+        """
+        source = ftputil.tool.as_str_path(source)
+        target = ftputil.tool.as_str_path(target)
+        if self._uses_tls(self._session) or self._uses_tls(other_host._session):
+            raise ftputil.error.CommandNotImplementedError(
+                "server-to-server transfer not supported for TLS connections"
+            )
+        source = self.path.abspath(source)
+        target = other_host.path.abspath(target)
+        source_dir, source_name = self.path.split(source)
+        target_dir, target_name = other_host.path.split(target)
+        # As in `_robust_ftp_command`, run the commands in the directory
+        # of the file.
+        old_source_dir = self.getcwd()
+        old_target_dir = other_host.getcwd()
+        self.chdir(source_dir)
+        try:
+            other_host.chdir(target_dir)
+            try:
+                # The target session waits for the end of the transfer
+                # while the source session reads its reply, so the
+                # keep-alive thread mustn't use either session.
+                with ftputil.keep_alive.busy_session(self):
+                    with ftputil.keep_alive.busy_session(other_host):
+                        self._fxp_transfer(other_host, source_name, target_name)
+            finally:
+                other_host.chdir(old_target_dir)
+        finally:
+            self.chdir(old_source_dir)
+        other_host.stat_cache.invalidate(target)
 
     #
     # Helper methods to descend into a directory before executing a command
@@ -588,14 +1203,26 @@ class FTPHost:
                 "directory '{}' is not accessible".format(presumable_login_dir)
             )
 
-    def _robust_ftp_command(self, command, path, descend_deeply=False):
+    def _robust_ftp_command(
+        self, command, path, descend_deeply=False, *, idempotent=False
+    ):
         """
         Run an FTP command on a path. The return value of the method
         is the return value of the command.
 
         If `descend_deeply` is true (the default is false), descend
         deeply, i. e. change the directory to the end of the path.
+
+        If `idempotent` is true, the command may be repeated after a
+        reconnect (see `enable_auto_reconnect`).
         """
+        return self._call_with_reconnect(
+            lambda: self.__robust_ftp_command(command, path, descend_deeply),
+            idempotent,
+        )
+
+    def __robust_ftp_command(self, command, path, descend_deeply):
+        """Implementation of `_robust_ftp_command` without reconnects."""
         # If we can't change to the yet-current directory, the code
         # below won't work (see below), so in this case rather raise
         # an exception than giving wrong results.
@@ -635,8 +1262,13 @@ class FTPHost:
     def chdir(self, path):
         """Change the directory on the host."""
         path = ftputil.tool.as_str_path(path)
-        with ftputil.error.ftplib_error_to_ftp_os_error:
-            self._session.cwd(path)
+
+        def change_dir():
+            """Change the directory."""
+            with ftputil.error.ftplib_error_to_ftp_os_error:
+                self._session.cwd(path)
+
+        self._call_with_reconnect(change_dir, idempotent=True)
         # The path given as the argument is relative to the old current
         # directory, therefore join them.
         self._cached_current_dir = self.path.normpath(
@@ -659,12 +1291,63 @@ class FTPHost:
                 self._session.mkd(path)
 
         self._robust_ftp_command(command, path)
+        self._remember_dir(self.path.abspath(path))
+
+    def _remember_dir(self, path):
+        """Remember that the absolute `path` is a directory."""
+        self._known_dirs[path] = True
+
+    def _is_known_dir(self, path):
+        """
+        Return `True` if the absolute `path` is known to be a
+        directory without asking the server, else `False`.
+
+        A remembered directory is forgotten after the maximum age
+        which the stat cache uses for `path` (see
+        `StatCache.max_age_for`), so that a directory removed by
+        another client is made again.
+        """
+        if path == self.sep:
+            return True
+        try:
+            age = time.time() - self._known_dirs.mtime(path)
+        except ftputil.lrucache.CacheKeyError:
+            pass
+        else:
+            max_age = self.stat_cache.max_age_for(path)
+            if (max_age is None) or (age <= max_age):
+                return True
+            del self._known_dirs[path]
+        try:
+            return stat.S_ISDIR(self.stat_cache[path].st_mode)
+        except ftputil.error.CacheMissError:
+            return False
+
+    def _forget_dirs(self, path):
+        """
+        Forget the directory `path` and the directories below it as
+        known directories, for example after removing `path`.
+        """
+        path = self.path.abspath(path)
+        prefix = path.rstrip(self.sep) + self.sep
+        for known_dir in list(self._known_dirs):
+            if (known_dir == path) or known_dir.startswith(prefix):
+                del self._known_dirs[known_dir]
+
+    def _make_dir_with_abspath(self, path):
+        """
+        Make the directory for the absolute `path` and remember it. If
+        the directory can't be made, raise a `PermanentError` unless
+        the directory exists (for example, if it was made by another
+        client in the meantime).
+        """
+        try:
+            self.mkdir(path)
+        except ftputil.error.PermanentError:
+            if not self.path.isdir(path):
+                raise
+        self._remember_dir(path)
 
-    # TODO: The virtual directory support doesn't have unit tests yet
-    # because the mocking most likely would be quite complicated. The
-    # tests should be added when mainly the `mock` library is used
-    # instead of the mock code in `test.mock_ftplib`.
-    #
     # Ignore unused argument `mode`
     # pylint: disable=unused-argument
     def makedirs(self, path, mode=None):
@@ -673,37 +1356,84 @@ class FTPHost:
         intermediate directories, like `os.makedirs`. The value of
         `mode` is only accepted for compatibility with `os.makedirs`
         but otherwise ignored.
+
+        Directories in the stat cache and directories this host made
+        or found before are known to exist. For the other directories,
+        start with `path` itself and try to change into the parent
+        directories until a directory exists. Then make the missing
+        directories below it. So if only the last directory is
+        missing, this needs only a few commands, regardless of the
+        depth of `path`.
         """
         path = ftputil.tool.as_str_path(path)
         path = self.path.abspath(path)
-        directories = path.split(self.sep)
+        # Missing directories, deepest first
+        missing_dirs = []
+        existing_dir = path
         old_dir = self.getcwd()
+        changed_dir = False
         try:
-            # Try to build the directory chain from the "uppermost" to
-            # the "lowermost" directory.
-            for index in range(1, len(directories)):
-                # Re-insert the separator which got lost by using
-                # `path.split`.
-                next_directory = self.sep + self.path.join(*directories[: index + 1])
+            while not self._is_known_dir(existing_dir):
                 # If we have "virtual directories" (see #86), just
                 # listing the parent directory won't tell us if a
                 # directory actually exists. So try to change into the
                 # directory.
                 try:
-                    self.chdir(next_directory)
+                    self.chdir(existing_dir)
                 except ftputil.error.PermanentError:
-                    try:
-                        self.mkdir(next_directory)
-                    except ftputil.error.PermanentError:
-                        # Find out the cause of the error. Re-raise
-                        # the exception only if the directory didn't
-                        # exist already, else something went _really_
-                        # wrong, e. g. there's a regular file with the
-                        # name of the directory.
-                        if not self.path.isdir(next_directory):
-                            raise
+                    missing_dirs.append(existing_dir)
+                    existing_dir = self.path.dirname(existing_dir)
+                else:
+                    changed_dir = True
+                    self._remember_dir(existing_dir)
+                    break
+            for missing_dir in reversed(missing_dirs):
+                self._make_dir_with_abspath(missing_dir)
         finally:
-            self.chdir(old_dir)
+            if changed_dir:
+                self.chdir(old_dir)
+
+    def makedirs_many(self, paths, mode=None):
+        """
+        Make the directories in the iterable `paths` including their
+        missing intermediate directories, like calling `makedirs` for
+        each of them, but with fewer round trips.
+
+        The common parent directory of all paths is made with
+        `makedirs`. Below it, the directories are made level by level,
+        parents first. The `MKD` commands for each level are sent as a
+        batch (see `batch`).
+        """
+        abs_paths = [
+            self.path.abspath(ftputil.tool.as_str_path(path)) for path in paths
+        ]
+        if not abs_paths:
+            return
+        common_dir = self.path.commonpath(abs_paths)
+        self.makedirs(common_dir)
+        # Directories below `common_dir` by depth
+        dirs_by_depth = {}
+        for abs_path in abs_paths:
+            dir_path = abs_path
+            while (dir_path != common_dir) and not self._is_known_dir(dir_path):
+                depth = dir_path.count(self.sep)
+                dirs_by_depth.setdefault(depth, set()).add(dir_path)
+                dir_path = self.path.dirname(dir_path)
+        for depth in sorted(dirs_by_depth):
+            dir_paths = sorted(dirs_by_depth[depth])
+            batch = self.batch()
+            for dir_path in dir_paths:
+                batch.mkdir(dir_path)
+            try:
+                batch.execute()
+            except ftputil.error.BatchError as exc:
+                for result in exc.errors:
+                    # As in `makedirs`, ignore errors for directories
+                    # which exist.
+                    if not self.path.isdir(result.args[0]):
+                        raise result.error
+            for dir_path in dir_paths:
+                self._remember_dir(dir_path)
 
     def rmdir(self, path):
         """
@@ -727,6 +1457,7 @@ class FTPHost:
 
         self._robust_ftp_command(command, path)
         self.stat_cache.invalidate(path)
+        self._forget_dirs(path)
 
     def remove(self, path):
         """
@@ -761,7 +1492,156 @@ class FTPHost:
 
     unlink = remove
 
-    def rmtree(self, path, ignore_errors=False, onerror=None):
+    # Minimum and maximum number of paths which a worker of a parallel
+    # `rmtree` removes in one command batch
+    _RMTREE_MIN_BATCH_SIZE = 16
+    _RMTREE_MAX_BATCH_SIZE = 512
+
+    def _rmtree_snapshot(self, path, onerror):
+        """
+        Return a list of the files and links and a list of the
+        directories in the tree `path`, including `path` itself.
+
+        The directories are listed as `(depth, path)` tuples where the
+        depth of `path` is 0.
+        """
+        file_paths = []
+        dir_paths = []
+        pending_dirs = [(0, path)]
+        while pending_dirs:
+            depth, dir_path = pending_dirs.pop()
+            dir_paths.append((depth, dir_path))
+            names = []
+            try:
+                names = self.listdir(dir_path)
+            except ftputil.error.PermanentError:
+                onerror(self.listdir, dir_path, sys.exc_info())
+            for name in names:
+                full_name = self.path.join(dir_path, name)
+                # `listdir` has put the stat results into the cache,
+                # so `lstat` doesn't need more `LIST` commands.
+                try:
+                    mode = self.lstat(full_name).st_mode
+                except ftputil.error.PermanentError:
+                    mode = 0
+                if stat.S_ISDIR(mode):
+                    pending_dirs.append((depth + 1, full_name))
+                else:
+                    file_paths.append(full_name)
+        return file_paths, dir_paths
+
+    @staticmethod
+    def _remove_in_batch(host_pool, operation, abs_paths):
+        """
+        Remove the absolute paths `abs_paths` with the `CommandBatch`
+        method `operation` ("remove" or "rmdir"), using a host from
+        `host_pool`. Return a list with the exception or `None` for
+        each path.
+        """
+        with host_pool.host() as host:
+            batch = host.batch()
+            for abs_path in abs_paths:
+                getattr(batch, operation)(abs_path)
+            try:
+                results = batch.execute()
+            except ftputil.error.BatchError as exc:
+                results = exc.results
+        return [result.error for result in results]
+
+    def _rmtree_remove_paths(
+        self, executor, host_pool, workers, operation, paths, reported_errors, onerror
+    ):
+        """
+        Remove `paths` in parallel with `workers` threads, using the
+        `CommandBatch` method `operation`. Wait until all paths are
+        handled.
+
+        Exceptions of the types `reported_errors` are passed to
+        `onerror`, other exceptions are raised.
+        """
+        batch_size = max(
+            self._RMTREE_MIN_BATCH_SIZE,
+            min(self._RMTREE_MAX_BATCH_SIZE, -(-len(paths) // workers)),
+        )
+        path_batches = [
+            paths[index : index + batch_size]
+            for index in range(0, len(paths), batch_size)
+        ]
+        futures = [
+            executor.submit(
+                self._remove_in_batch,
+                host_pool,
+                operation,
+                [self.path.abspath(path) for path in path_batch],
+            )
+            for path_batch in path_batches
+        ]
+        try:
+            # Call `onerror` in this thread and in the order of the paths.
+            for path_batch, future in zip(path_batches, futures):
+                for path, error in zip(path_batch, future.result()):
+                    if error is None:
+                        continue
+                    if not isinstance(error, reported_errors):
+                        raise error
+                    # Raise the exception, so that `onerror` can re-raise
+                    # it with a bare `raise` as in the sequential `rmtree`.
+                    try:
+                        raise error
+                    except reported_errors:
+                        onerror(getattr(self, operation), path, sys.exc_info())
+        except BaseException:
+            # Don't remove more paths if we leave because of an
+            # exception. `Executor.shutdown` only has a `cancel_futures`
+            # argument since Python 3.9, so cancel the batches here.
+            for future in futures:
+                future.cancel()
+            raise
+
+    def _rmtree_in_parallel(self, path, onerror, workers):
+        """
+        Remove the tree `path` with `workers` threads, each with its
+        own connection.
+
+        After listing the whole tree, remove all files in parallel.
+        Then remove the directories level by level, starting with the
+        deepest, so that the directories are empty when they're
+        removed.
+        """
+        file_paths, dir_paths = self._rmtree_snapshot(path, onerror)
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+        host_pool = ftputil.session_pool.HostPool(self, workers)
+        try:
+            self._rmtree_remove_paths(
+                executor,
+                host_pool,
+                workers,
+                "remove",
+                file_paths,
+                ftputil.error.PermanentError,
+                onerror,
+            )
+            for depth in range(max(depth for depth, _ in dir_paths), -1, -1):
+                self._rmtree_remove_paths(
+                    executor,
+                    host_pool,
+                    workers,
+                    "rmdir",
+                    [
+                        dir_path
+                        for dir_depth, dir_path in dir_paths
+                        if dir_depth == depth
+                    ],
+                    ftputil.error.FTPOSError,
+                    onerror,
+                )
+        finally:
+            executor.shutdown(wait=True)
+            host_pool.close()
+            self.stat_cache.invalidate_tree(self.path.abspath(path))
+            self._forget_dirs(path)
+
+    def rmtree(self, path, ignore_errors=False, onerror=None, *, workers=1):
         """
         Remove the given remote, possibly non-empty, directory tree.
         The interface of this method is rather complex, in favor of
@@ -781,6 +1661,13 @@ class FTPHost:
         (`listdir`, `remove`, `rmdir`). `exc_info` is the exception
         info as it's got from `sys.exc_info`.
 
+        If `workers` is greater than 1, list the whole tree first and
+        then remove files and directories with this number of threads,
+        each with its own connection. The commands of each thread are
+        sent in batches (see `batch`). Files are removed before the
+        directories, and the directories are removed from the deepest
+        level upwards. `onerror` is still called in the calling thread.
+
         Implementation note: The code is copied from `shutil.rmtree`
         in Python 2.4 and adapted to ftputil.
         """
@@ -803,6 +1690,9 @@ class FTPHost:
 
         else:
             new_onerror = onerror
+        if workers > 1:
+            self._rmtree_in_parallel(path, new_onerror, workers)
+            return
         names = []
         try:
             names = self.listdir(path)
@@ -825,11 +1715,19 @@ class FTPHost:
             self.rmdir(path)
         except ftputil.error.FTPOSError:
             new_onerror(self.rmdir, path, sys.exc_info())
+        finally:
+            # Also remove cache entries for paths below `path` which
+            # weren't removed with `remove` or `rmdir`, for example
+            # after errors.
+            self.stat_cache.invalidate_tree(self.path.abspath(path))
 
     def rename(self, source, target):
         """Rename the source on the FTP host to target."""
         source = ftputil.tool.as_str_path(source)
         target = ftputil.tool.as_str_path(target)
+        self._forget_dirs(source)
+        abs_source = self.path.abspath(source)
+        abs_target = self.path.abspath(target)
         # The following code is in spirit similar to the code in the
         # method `_robust_ftp_command`, though we do _not_ do
         # _everything_ imaginable.
@@ -850,6 +1748,320 @@ class FTPHost:
             # Use straightforward command.
             with ftputil.error.ftplib_error_to_ftp_os_error:
                 self._session.rename(source, target)
+        # Keep the cache entries below a renamed directory.
+        self.stat_cache.rename_tree(abs_source, abs_target)
+
+    # Parts of (lower-case) error messages for a rename across file
+    # systems. There's no special reply code for this error.
+    _cross_device_messages = (
+        "cross-device",
+        "across file systems",
+        "different file system",
+        "exdev",
+    )
+
+    def _is_cross_device_error(self, exc):
+        """
+        Return `True` if the `PermanentError` `exc` of a rename means
+        that the server doesn't implement the rename or can't rename
+        across file systems, else `False`.
+        """
+        if exc.errno in self._not_implemented_reply_codes:
+            return True
+        message = exc.strerror.lower()
+        return any(part in message for part in self._cross_device_messages)
+
+    def move(self, source, target):
+        """
+        Move the file `source` on the FTP host to `target`, which may
+        be in another directory.
+
+        Try to rename the file on the server (`RNFR`/`RNTO`). If the
+        server doesn't implement renaming or can't rename the file
+        because the directories are on different file systems, copy
+        the file (see `copy`) and remove the source file. Other errors,
+        for example if `source` doesn't exist, are raised.
+        """
+        try:
+            self.rename(source, target)
+        except ftputil.error.PermanentError as exc:
+            if not self._is_cross_device_error(exc):
+                raise
+            self.copy(source, target)
+            self.remove(source)
+
+    def batch(self, window=ftputil.batch.CommandBatch.DEFAULT_WINDOW):
+        """
+        Return a `CommandBatch` to send independent commands without
+        waiting for the reply of each command before sending the next
+        one. Use it like
+
+          with ftp_host.batch() as batch:
+              batch.remove("file1")
+              batch.chmod("file2", 0o644)
+
+        The commands are sent when the `with` block is left. If any
+        of them failed, a `BatchError` is raised. `window` is the
+        maximum number of commands sent but not answered yet.
+        """
+        return ftputil.batch.CommandBatch(self, window)
+
+    def _features(self):
+        """
+        Return a list of the features from the server's `FEAT` reply,
+        for example `["MDTM", "MFMT", "SIZE", "UTF8"]`.
+
+        If the server doesn't support `FEAT`, return an empty list. The
+        result is cached.
+        """
+        if self._feature_lines is None:
+            try:
+                with ftputil.error.ftplib_error_to_ftp_os_error:
+                    reply = self._session.sendcmd("FEAT")
+            except ftputil.error.PermanentError:
+                self._feature_lines = []
+            else:
+                # The first and last line are the "211" lines around
+                # the features.
+                self._feature_lines = [
+                    line.strip() for line in reply.splitlines()[1:-1] if line.strip()
+                ]
+        return self._feature_lines
+
+    def _has_feature(self, name):
+        """
+        Return `True` if the server lists the feature `name` (for
+        example "MFMT" or "SITE COPY") in its `FEAT` reply, else
+        `False`.
+        """
+        name = name.upper()
+        for line in self._features():
+            line = line.upper()
+            if (line == name) or line.startswith(name + " "):
+                return True
+        return False
+
+    def _use_compression(self, compress):
+        """
+        Return `True` if a transfer should use `MODE Z`, else `False`.
+
+        If `compress` is `None`, use `MODE Z` if the `use_compression`
+        attribute is true and the server lists `MODE Z` in its `FEAT`
+        reply. Otherwise, if `compress` is true and the server doesn't
+        support `MODE Z`, raise a `CommandNotImplementedError`.
+        """
+        if compress is None:
+            return self.use_compression and self._has_feature("MODE Z")
+        if compress and not self._has_feature("MODE Z"):
+            raise ftputil.error.CommandNotImplementedError(
+                "server doesn't support MODE Z"
+            )
+        return bool(compress)
+
+    def _set_transfer_mode(self, compress):
+        """
+        Switch the session to `MODE Z` if `compress` is true, else to
+        `MODE S`. Don't send a command if the session is already in
+        the requested mode.
+
+        `ftplib` exceptions aren't converted, so the caller must do it.
+        """
+        transfer_mode = "Z" if compress else "S"
+        if transfer_mode != self._transfer_mode:
+            self._session.voidcmd("MODE {}".format(transfer_mode))
+            self._transfer_mode = transfer_mode
+
+    # Map checksum algorithms (see `file_transfer.CHECKSUM_ALGORITHMS`)
+    # to the algorithm names for the `HASH` command and to the
+    # non-standard commands for the algorithm.
+    _checksum_commands = {
+        "crc32": ("CRC32", "XCRC"),
+        "md5": ("MD5", "XMD5"),
+        "sha1": ("SHA-1", "XSHA1"),
+        "sha256": ("SHA-256", "XSHA256"),
+        "sha512": ("SHA-512", "XSHA512"),
+    }
+
+    def _hash_command_algorithms(self):
+        """
+        Return the algorithm names the server supports for the `HASH`
+        command, according to its `FEAT` reply.
+        """
+        for line in self._features():
+            if line.upper().startswith("HASH "):
+                # For example "HASH SHA-256;SHA-1*;MD5", where "*" marks
+                # the currently selected algorithm.
+                return [
+                    name.rstrip("*").upper() for name in line[5:].strip().split(";")
+                ]
+        return []
+
+    @staticmethod
+    def _digest_from_reply(reply, algorithm):
+        """
+        Return the hex digest for `algorithm` from the server reply
+        `reply` or raise a `PermanentError` if the reply doesn't
+        contain a digest.
+        """
+        # The replies of the `HASH` command look like
+        # "213 SHA-256 0-49 169cd22282da7f147cb491e559e9dd filename",
+        # those of the `X*` commands like "250 169cd22282da7f147cb491e559e9dd"
+        # with an optional file name. So look for a hex string of the
+        # appropriate length.
+        digest_length = {"crc32": 8}.get(algorithm) or (
+            2 * hashlib.new(algorithm).digest_size
+        )
+        for word in reply.split()[1:]:
+            if (len(word) == digest_length) or (
+                (algorithm == "crc32") and (len(word) < digest_length)
+            ):
+                try:
+                    int(word, 16)
+                except ValueError:
+                    continue
+                return word.lower().rjust(digest_length, "0")
+        raise ftputil.error.PermanentError(
+            "no {} checksum in server reply {!r}".format(algorithm, reply)
+        )
+
+    def checksum(self, path, algorithm="sha256"):
+        """
+        Return the checksum of the remote file `path` as lowercase hex
+        string, calculated by the server.
+
+        `algorithm` is one of "crc32", "md5", "sha1", "sha256" and
+        "sha512". If the server lists the algorithm for the `HASH`
+        command in its `FEAT` reply, use `HASH`. Otherwise, or if
+        `HASH` fails, try the non-standard commands `XCRC`, `XMD5`,
+        `XSHA1`, `XSHA256` or `XSHA512`, respectively. If the server
+        doesn't support any of these, raise a
+        `CommandNotImplementedError`. Commands which the server doesn't
+        implement aren't tried again.
+
+        The result can be compared with that of
+        `ftputil.file_transfer.local_checksum` for a local file.
+        """
+        if algorithm not in self._checksum_commands:
+            raise ValueError("unsupported checksum algorithm {!r}".format(algorithm))
+        path = ftputil.tool.as_str_path(path)
+        path = self.path.abspath(path)
+        hash_name, x_command = self._checksum_commands[algorithm]
+
+        def hash_command(self, path):
+            """Callback function."""
+            with ftputil.error.ftplib_error_to_ftp_os_error:
+                if self._hash_command_algorithm != hash_name:
+                    self._session.sendcmd("OPTS HASH {}".format(hash_name))
+                    self._hash_command_algorithm = hash_name
+                return self._session.sendcmd("HASH {}".format(path))
+
+        def non_standard_command(self, path):
+            """Callback function."""
+            with ftputil.error.ftplib_error_to_ftp_os_error:
+                return self._session.sendcmd("{} {}".format(x_command, path))
+
+        hash_error = None
+        if (hash_name in self._hash_command_algorithms()) and (
+            "HASH" not in self._unsupported_checksum_commands
+        ):
+            try:
+                reply = self._robust_ftp_command(hash_command, path, idempotent=True)
+            except ftputil.error.PermanentError as exc:
+                # Some servers list `HASH` in their `FEAT` reply, but
+                # the command fails anyway. Try the `X*` command then.
+                if exc.errno in self._not_implemented_reply_codes:
+                    self._unsupported_checksum_commands.add("HASH")
+                hash_error = exc
+            else:
+                return self._digest_from_reply(ftputil.tool.as_str(reply), algorithm)
+        if x_command not in self._unsupported_checksum_commands:
+            try:
+                reply = self._robust_ftp_command(
+                    non_standard_command, path, idempotent=True
+                )
+            except ftputil.error.PermanentError as exc:
+                if exc.errno not in self._not_implemented_reply_codes:
+                    raise
+                self._unsupported_checksum_commands.add(x_command)
+            else:
+                return self._digest_from_reply(ftputil.tool.as_str(reply), algorithm)
+        # If `HASH` failed for another reason, for example because the
+        # file doesn't exist, that's the relevant error.
+        if (hash_error is not None) and (
+            hash_error.errno not in self._not_implemented_reply_codes
+        ):
+            raise hash_error
+        raise ftputil.error.CommandNotImplementedError(
+            "server supports neither HASH {} nor {}".format(hash_name, x_command)
+        )
+
+    def _server_side_copy_supported(self):
+        """
+        Return `True` if the server supports copying files with
+        `SITE CPFR` and `SITE CPTO` (for example ProFTPD's `mod_copy`),
+        else `False`.
+
+        The support is detected from the `FEAT` reply or, if it's not
+        listed there, from the `SITE HELP` reply. The result is cached.
+        """
+        if self._server_side_copy is None:
+            if self._has_feature("SITE COPY"):
+                self._server_side_copy = True
+            else:
+                try:
+                    with ftputil.error.ftplib_error_to_ftp_os_error:
+                        reply = self._session.sendcmd("SITE HELP")
+                except ftputil.error.PermanentError:
+                    reply = ""
+                words = reply.upper().split()
+                self._server_side_copy = ("CPFR" in words) and ("CPTO" in words)
+        return self._server_side_copy
+
+    def copy(self, source, target):
+        """
+        Copy the file `source` on the FTP host to `target` on the same
+        host.
+
+        If the server supports it, copy the file on the server with
+        `SITE CPFR`/`SITE CPTO`. Otherwise stream the data from one
+        child session to another, chunk by chunk, so the file is
+        never held in memory completely.
+        """
+        source = ftputil.tool.as_str_path(source)
+        target = ftputil.tool.as_str_path(target)
+        source = self.path.abspath(source)
+        target = self.path.abspath(target)
+        if self._server_side_copy_supported():
+            source_head = self.path.dirname(source)
+            target_head, target_tail = self.path.split(target)
+            # As in `rename`, use the plain name for a target in the
+            # same directory.
+            if target_head == source_head:
+                cpto_path = target_tail
+            else:
+                cpto_path = target
+
+            def command(self, source_tail):
+                """Callback function."""
+                # `CPTO` must directly follow `CPFR`.
+                with ftputil.keep_alive.busy_session(self):
+                    with ftputil.error.ftplib_error_to_ftp_os_error:
+                        # `CPFR` is answered with "350", so `voidcmd`
+                        # would fail.
+                        self._session.sendcmd("SITE CPFR {}".format(source_tail))
+                        self._session.voidcmd("SITE CPTO {}".format(cpto_path))
+
+            try:
+                self._robust_ftp_command(command, source, idempotent=True)
+            finally:
+                # Even a failed copy may have created the target.
+                self.stat_cache.invalidate(target)
+        else:
+            with self.open(source, "rb") as source_file, self.open(
+                target, "wb"
+            ) as target_file:
+                ftputil.file_transfer.copyfileobj(source_file, target_file)
+            self.stat_cache.invalidate(target)
 
     # XXX: One could argue to put this method into the `_Stat` class,
     # but I refrained from that because then `_Stat` would have to
@@ -863,6 +2075,8 @@ class FTPHost:
         # Don't use `self.path.isdir` in this method because that
         # would cause a call of `(l)stat` and thus a call to `_dir`,
         # so we would end up with an infinite recursion.
+        compress = self._use_compression(None)
+
         def _FTPHost_dir_command(self, path):
             """Callback function."""
             lines = []
@@ -871,18 +2085,45 @@ class FTPHost:
                 """Callback function."""
                 lines.append(ftputil.tool.as_str(line))
 
+            if self.use_list_a_option:
+                args = ("-a", path)
+            else:
+                args = (path,)
             with ftputil.error.ftplib_error_to_ftp_os_error:
-                if self.use_list_a_option:
-                    self._session.dir("-a", path, callback)
+                self._set_transfer_mode(compress)
+                if compress:
+                    self._compressed_dir(args, callback)
                 else:
-                    self._session.dir(path, callback)
+                    self._session.dir(*args, callback)
             return lines
 
         lines = self._robust_ftp_command(
-            _FTPHost_dir_command, path, descend_deeply=True
+            _FTPHost_dir_command, path, descend_deeply=True, idempotent=True
         )
         return lines
 
+    def _compressed_dir(self, args, callback):
+        """
+        Like `self._session.dir(*args, callback)`, but for a session
+        in `MODE Z`. The callback gets the lines as byte strings
+        without the line endings.
+
+        `ftplib` exceptions aren't converted, so the caller must do it.
+        """
+        command = " ".join(["LIST"] + [arg for arg in args if arg])
+        # Don't let the keep-alive thread take the reply for the
+        # transfer.
+        with ftputil.keep_alive.busy_session(self):
+            self._session.voidcmd("TYPE A")
+            conn = self._session.transfercmd(command)
+            try:
+                with ftputil.file.compressed_file(conn, "rb") as fobj:
+                    for line in fobj:
+                        callback(line.rstrip(b"\r\n"))
+            finally:
+                conn.close()
+            self._session.voidresp()
+
     # The `listdir`, `lstat` and `stat` methods don't use
     # `_robust_ftp_command` because they implicitly already use
     # `_dir` which actually uses `_robust_ftp_command`.
@@ -931,6 +2172,78 @@ class FTPHost:
         path = ftputil.tool.as_str_path(path)
         return self._stat._stat(path, _exception_for_missing_path)
 
+    def _list_dirs_in_parallel(self, dir_paths, workers):
+        """
+        Return a dictionary which maps the absolute directory paths in
+        the list `dir_paths` to the lines of their listings, or to
+        `None` if a directory can't be listed. Use `workers` threads,
+        each with its own connection.
+        """
+        with ftputil.session_pool.HostPool(self, workers) as host_pool:
+
+            def list_dir(dir_path):
+                """Return the lines of the listing of `dir_path`."""
+                with host_pool.host() as worker_host:
+                    try:
+                        return worker_host._dir(dir_path)
+                    except ftputil.error.PermanentError:
+                        return None
+
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+                return dict(zip(dir_paths, executor.map(list_dir, dir_paths)))
+
+    def _stat_many(self, method, paths, workers):
+        """
+        Return a dictionary which maps the `paths` to the results of
+        the `_Stat` method `method` for their absolute paths.
+        """
+        paths = list(paths)
+        abs_paths = [
+            self.path.abspath(ftputil.tool.as_str_path(path)) for path in paths
+        ]
+        listings = None
+        if workers > 1:
+            # Parent directories which need to be listed
+            dir_paths = sorted(
+                {
+                    self.path.dirname(abs_path)
+                    for abs_path in abs_paths
+                    if (abs_path != "/") and (abs_path not in self.stat_cache)
+                }
+            )
+            if len(dir_paths) > 1:
+                listings = self._list_dirs_in_parallel(dir_paths, workers)
+        results = method(abs_paths, listings)
+        return {path: results[abs_path] for path, abs_path in zip(paths, abs_paths)}
+
+    def lstat_many(self, paths, *, workers=1):
+        """
+        Return a dictionary which maps each of the `paths` to an
+        object like that returned by `lstat`, or to `None` if the path
+        doesn't exist.
+
+        Instead of a directory listing for each path, each parent
+        directory of paths which aren't in the stat cache is listed
+        only once. If `workers` is greater than 1, the directories are
+        listed in parallel over up to `workers` additional
+        connections.
+
+        If a directory listing can't be parsed, raise a `ParserError`.
+        """
+        return self._stat_many(self._stat._lstat_many, paths, workers)
+
+    def stat_many(self, paths, *, workers=1):
+        """
+        Return a dictionary which maps each of the `paths` to an
+        object like that returned by `stat`, or to `None` if the path
+        doesn't exist. This includes links to paths which don't exist.
+
+        For the listing of the directories and `workers`, see
+        `lstat_many`. Raise a `RecursiveLinksError` for a cyclic link
+        structure.
+        """
+        return self._stat_many(self._stat._stat_many, paths, workers)
+
     def walk(self, top, topdown=True, onerror=None, followlinks=False):
         """
         Iterate over directory tree and return a tuple (dirpath,
@@ -980,9 +2293,62 @@ class FTPHost:
             with ftputil.error.ftplib_error_to_ftp_os_error:
                 self._session.voidcmd("SITE CHMOD 0{0:o} {1}".format(mode, path))
 
-        self._robust_ftp_command(command, path)
+        self._robust_ftp_command(command, path, idempotent=True)
         self.stat_cache.invalidate(path)
 
+    # Reply codes for commands the server doesn't know or doesn't
+    # implement
+    _not_implemented_reply_codes = frozenset([500, 502, 504])
+
+    # Reply codes for a data connection that couldn't be opened or was
+    # closed during the transfer
+    _data_connection_reply_codes = frozenset([425, 426])
+
+    def utime(self, path, times=None):
+        """
+        Set the modification time of the remote file `path` (a
+        string).
+
+        Like for `os.utime`, `times` is either `None` (use the current
+        time) or a tuple `(atime, mtime)`. FTP servers can't set the
+        access time, so `atime` is ignored.
+
+        The modification time is set with the `MFMT` command or, if
+        the server doesn't support it, with `SITE UTIME`. The command
+        that works is remembered for later calls. If the server
+        supports neither command, raise a `CommandNotImplementedError`.
+        """
+        path = ftputil.tool.as_str_path(path)
+        path = self.path.abspath(path)
+        if times is None:
+            mtime = time.time()
+        else:
+            _atime, mtime = times
+        # Both commands expect the time in UTC, so the time shift
+        # doesn't matter here.
+        timestamp = time.strftime("%Y%m%d%H%M%S", time.gmtime(mtime))
+        for command_format in self._utime_command_formats[:]:
+
+            def command(self, path):
+                """Callback function."""
+                with ftputil.error.ftplib_error_to_ftp_os_error:
+                    self._session.voidcmd(
+                        command_format.format(timestamp=timestamp, path=path)
+                    )
+
+            try:
+                self._robust_ftp_command(command, path, idempotent=True)
+            except ftputil.error.PermanentError as exc:
+                if exc.errno not in self._not_implemented_reply_codes:
+                    raise
+                self._utime_command_formats.remove(command_format)
+            else:
+                self.stat_cache.invalidate(path)
+                return
+        raise ftputil.error.CommandNotImplementedError(
+            "server supports neither MFMT nor SITE UTIME"
+        )
+
     def __getstate__(self):
         raise TypeError("cannot serialize FTPHost object")
 
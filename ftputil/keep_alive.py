@@ -0,0 +1,231 @@
+# Copyright (C) 2020, Stefan Schwarzer <sschwarzer@sschwarzer.net>
+# and ftputil contributors (see `doc/contributors.txt`)
+# See the file LICENSE for licensing terms.
+
+"""
+keep_alive.py - send `NOOP` commands to idle sessions in the background
+
+`FTPHost.keep_alive` has to be called explicitly and only affects the
+session of the `FTPHost` object itself. A `KeepAlive` object runs a
+thread which sends `NOOP` commands to all idle sessions of an
+`FTPHost` object, including the sessions for remote files and the
+sessions of `HostPool` workers.
+
+The thread mustn't interfere with the commands sent by the threads
+which use the sessions. Therefore, while the keep-alive thread runs,
+the sessions are wrapped in `_GuardedSession` objects, which serialize
+the session method calls and remember the time of the last call.
+
+A single method call isn't enough for sequences of commands whose
+replies are read later, for example `putcmd`/`getresp`, or during
+which the session waits for the end of a transfer. Code which sends
+such a sequence must hold the session with `busy_session`, so that
+the thread doesn't send a `NOOP` in the middle of the sequence and
+take a reply meant for another command.
+"""
+
+import contextlib
+import ftplib
+import inspect
+import threading
+import time
+
+
+# This module is for internal use by other ftputil modules.
+__all__ = []
+
+
+class _GuardedSession:
+    """
+    Wrapper around a session object which holds a lock while a
+    session method is called and records the time of the last call.
+    """
+
+    def __init__(self, session):
+        self._session = session
+        # Reentrant because a session method may call other session
+        # methods via the wrapper (not with `ftplib.FTP`, but maybe
+        # with other session classes).
+        self._lock = threading.RLock()
+        # Value of `time.monotonic()` after the last method call
+        self.last_used = time.monotonic()
+
+    def __getattr__(self, name):
+        attribute = getattr(self._session, name)
+        # Only wrap methods, not for example the `sock` attribute.
+        if not inspect.isroutine(attribute):
+            return attribute
+
+        def guarded_method(*args, **kwargs):
+            """Call the session method while holding the lock."""
+            with self._lock:
+                try:
+                    return attribute(*args, **kwargs)
+                finally:
+                    self.last_used = time.monotonic()
+
+        return guarded_method
+
+
+def unwrapped_session(session):
+    """
+    Return the session wrapped by `session` if it's a
+    `_GuardedSession`, else `session` itself.
+    """
+    if isinstance(session, _GuardedSession):
+        return session._session
+    return session
+
+
+@contextlib.contextmanager
+def busy_session(host):
+    """
+    Context manager which keeps the keep-alive thread from using the
+    session of the `FTPHost` object `host` until the `with` block is
+    left.
+    """
+    # pylint: disable=protected-access
+    session = host._session
+    if isinstance(session, _GuardedSession):
+        with session._lock:
+            yield
+    else:
+        yield
+
+
+class KeepAlive:
+    """
+    Thread which sends a `NOOP` command to each session of `host`
+    (see `FTPHost.start_keep_alive`) which hasn't been used for
+    `interval` seconds.
+
+    A session isn't touched while it's used by another thread or while
+    a remote file is open on it.
+    """
+
+    def __init__(self, host, interval):
+        if interval <= 0:
+            raise ValueError("interval must be positive, not {!r}".format(interval))
+        self._host = host
+        self._interval = interval
+        # `FTPHost` objects of `HostPool`s, see `add_host`
+        self._pool_hosts = []
+        self._pool_hosts_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="ftputil-keep-alive", daemon=True
+        )
+
+    @staticmethod
+    def guard(host):
+        """
+        Wrap the session of the `FTPHost` object `host` in a
+        `_GuardedSession` unless it's already wrapped.
+        """
+        # pylint: disable=protected-access
+        if isinstance(host._session, _GuardedSession):
+            return
+        host._session = _GuardedSession(host._session)
+        # A child host for a remote file shares its session with the
+        # `FTPFile` object.
+        if host._file is not None:
+            host._file._session = host._session
+
+    @staticmethod
+    def unguard(host):
+        """Undo `guard` for the `FTPHost` object `host`."""
+        # pylint: disable=protected-access
+        if not isinstance(host._session, _GuardedSession):
+            return
+        host._session = host._session._session
+        if host._file is not None:
+            host._file._session = host._session
+
+    def add_host(self, host):
+        """
+        Keep the session of the `FTPHost` object `host` alive, too.
+        This is used for the hosts of a `HostPool`.
+        """
+        self.guard(host)
+        with self._pool_hosts_lock:
+            self._pool_hosts.append(host)
+
+    def _hosts(self):
+        """Return a list of the hosts whose sessions to keep alive."""
+        # pylint: disable=protected-access
+        with self._pool_hosts_lock:
+            # Forget closed pool hosts.
+            self._pool_hosts = [host for host in self._pool_hosts if not host.closed]
+            pool_hosts = self._pool_hosts[:]
+        hosts = []
+        # Copy `_children` because the list may be modified by the
+        # thread using the parent host.
+        for host in [self._host] + pool_hosts:
+            hosts.append(host)
+            hosts.extend(list(host._children))
+        return hosts
+
+    def start(self):
+        """Guard the sessions and start the thread."""
+        # pylint: disable=protected-access
+        self.guard(self._host)
+        for child in self._host._children:
+            self.guard(child)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop the thread, wait until it has finished and unwrap the
+        sessions.
+        """
+        # pylint: disable=protected-access
+        self._stop_event.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        with self._pool_hosts_lock:
+            pool_hosts = self._pool_hosts[:]
+        # Don't let pool hosts guard new children for a stopped thread.
+        for host in pool_hosts:
+            host._keep_alive = None
+        for host in self._hosts():
+            self.unguard(host)
+
+    def _run(self):
+        """Check the sessions until `stop` is called."""
+        # With this wait time, a session is idle for at most 1.5 times
+        # the interval.
+        while not self._stop_event.wait(self._interval / 2):
+            self.ping_idle_sessions()
+
+    def ping_idle_sessions(self):
+        """
+        Send a `NOOP` command to each session which hasn't been used
+        for `interval` seconds and isn't used at the moment.
+        """
+        # pylint: disable=protected-access
+        for host in self._hosts():
+            if self._stop_event.is_set():
+                return
+            session = host._session
+            if host.closed or not isinstance(session, _GuardedSession):
+                continue
+            # Don't wait for a session which is in use; it's
+            # obviously alive.
+            if not session._lock.acquire(blocking=False):
+                continue
+            try:
+                # Never send a command during a transfer.
+                if (host._file is not None) and not host._file.closed:
+                    continue
+                if time.monotonic() - session.last_used < self._interval:
+                    continue
+                try:
+                    session._session.voidcmd("NOOP")
+                # The session may have timed out already. That's
+                # handled when the session is used the next time, for
+                # example in `FTPHost._available_child`.
+                except ftplib.all_errors:
+                    pass
+                session.last_used = time.monotonic()
+            finally:
+                session._lock.release()
@@ -237,6 +237,24 @@ class LRUCache:
             del self.__dict[key]
             return node.obj
 
+    def move(self, old_key, new_key):
+        """Store the item stored under `old_key` under `new_key`.
+
+        The access and modification times of the item are kept. An
+        item previously stored under `new_key` is replaced. If no
+        item is stored under `old_key`, raise a `CacheKeyError`.
+        """
+        dict_ = self.__dict
+        if not old_key in dict_:
+            raise CacheKeyError(old_key)
+        if old_key == new_key:
+            return
+        if new_key in dict_:
+            del self[new_key]
+        node = dict_.pop(old_key)
+        node.key = new_key
+        dict_[new_key] = node
+
     def __iter__(self):
         """Iterate over the cache, from the least to the most
         recently accessed item.
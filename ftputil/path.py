@@ -38,6 +38,7 @@ class _Path:
         # pylint: disable=invalid-name
         pp = posixpath
         self.basename = pp.basename
+        self.commonpath = pp.commonpath
         self.commonprefix = pp.commonprefix
         self.dirname = pp.dirname
         self.isabs = pp.isabs
@@ -0,0 +1,144 @@
+# Copyright (C) 2003-2020, Stefan Schwarzer <sschwarzer@sschwarzer.net>
+# and ftputil contributors (see `doc/contributors.txt`)
+# See the file LICENSE for licensing terms.
+
+"""
+rate_limit.py - bandwidth throttling for file transfers
+"""
+
+import threading
+import time
+
+
+__all__ = ["RateLimiter"]
+
+
+class RateLimiter:
+    """
+    Token bucket to limit the throughput of one or more transfers to
+    `rate` bytes per second.
+
+    Transfers report each transferred chunk with `acquire`, which
+    sleeps as long as necessary to keep the throughput at or below the
+    rate. Up to `burst` bytes may be transferred without delay after
+    an idle period. If `burst` isn't given, it defaults to the amount
+    of data for `DEFAULT_BURST_DURATION` seconds.
+
+    A `RateLimiter` can be shared by several transfers, also in
+    different threads. Each `acquire` call reserves its share of the
+    bandwidth in the order of the calls, so transfers that use the
+    same limiter (and similar chunk sizes) get about the same share
+    of the bandwidth.
+
+    To avoid many tiny sleeps, which cost throughput, `acquire`
+    doesn't sleep for less than `MIN_SLEEP_DURATION` seconds. Shorter
+    delays accumulate until they're worth a sleep.
+    """
+
+    # Durations in seconds
+    DEFAULT_BURST_DURATION = 0.25
+    MIN_SLEEP_DURATION = 0.05
+
+    def __init__(self, rate, burst=None):
+        if rate <= 0:
+            raise ValueError("rate must be positive, not {!r}".format(rate))
+        if burst is None:
+            burst = rate * self.DEFAULT_BURST_DURATION
+        if burst < 0:
+            raise ValueError("burst must not be negative, not {!r}".format(burst))
+        self.rate = rate
+        self.burst = burst
+        self._lock = threading.Lock()
+        # Point in time when the bucket would be full again if there were
+        # no further transfers. The bucket is full at the start.
+        self._full_time = time.monotonic()
+
+    def reserve(self, byte_count):
+        """
+        Reserve bandwidth for `byte_count` bytes and return the delay in
+        seconds before the bytes may be transferred. Don't sleep.
+
+        Note that the reservation is made regardless of the delay; the
+        caller is expected to wait before the next transfer.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._full_time = max(self._full_time, now) + byte_count / self.rate
+            # The bytes may be transferred as soon as the bucket has
+            # enough room for the data beyond the burst allowance.
+            return max(0.0, self._full_time - self.burst / self.rate - now)
+
+    def acquire(self, byte_count):
+        """
+        Account for the transfer of `byte_count` bytes and sleep if the
+        transfer is ahead of the rate.
+        """
+        _sleep(self.reserve(byte_count), self.MIN_SLEEP_DURATION)
+
+
+class _RateLimiterGroup:
+    """
+    Combination of several `RateLimiter`s, for example a limit for a
+    single transfer and a limit for all transfers of an `FTPHost`.
+    """
+
+    def __init__(self, rate_limiters):
+        self._rate_limiters = rate_limiters
+        self._min_sleep_duration = min(
+            rate_limiter.MIN_SLEEP_DURATION for rate_limiter in rate_limiters
+        )
+
+    def reserve(self, byte_count):
+        """
+        Reserve bandwidth for `byte_count` bytes with all limiters and
+        return the longest delay.
+        """
+        return max(
+            rate_limiter.reserve(byte_count) for rate_limiter in self._rate_limiters
+        )
+
+    def acquire(self, byte_count):
+        """
+        Account for the transfer of `byte_count` bytes with all limiters
+        and sleep for the longest delay.
+        """
+        _sleep(self.reserve(byte_count), self._min_sleep_duration)
+
+
+def _sleep(delay, min_sleep_duration):
+    """
+    Sleep for `delay` seconds unless the delay is shorter than
+    `min_sleep_duration`.
+    """
+    if delay >= min_sleep_duration:
+        time.sleep(delay)
+
+
+def rate_limiter(rate_limit):
+    """
+    Return a `RateLimiter` for `rate_limit`.
+
+    If `rate_limit` is `None`, return `None` (no limit). If it's a
+    `RateLimiter` (or a return value of `combined_rate_limiter`),
+    return it unchanged, so that it can be shared. Otherwise
+    `rate_limit` is the maximum rate in bytes per second.
+    """
+    if (rate_limit is None) or isinstance(rate_limit, (RateLimiter, _RateLimiterGroup)):
+        return rate_limit
+    return RateLimiter(rate_limit)
+
+
+def combined_rate_limiter(*rate_limits):
+    """
+    Return an object with an `acquire` method which applies all the
+    rate limits in `rate_limits` (see `rate_limiter` for the allowed
+    values), or `None` if there isn't any limit.
+    """
+    rate_limiters = [
+        rate_limiter(rate_limit) for rate_limit in rate_limits if rate_limit is not None
+    ]
+    if not rate_limiters:
+        return None
+    if len(rate_limiters) == 1:
+        return rate_limiters[0]
+    return _RateLimiterGroup(rate_limiters)
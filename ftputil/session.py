@@ -8,9 +8,114 @@ for ftputil.
 """
 
 import ftplib
+import socket
 
 
-__all__ = ["session_factory"]
+__all__ = ["NetworkProfile", "session_factory"]
+
+
+class NetworkProfile:
+    """
+    Socket settings for the command and data connections of sessions
+    created by `session_factory`.
+
+    tcp_nodelay: If `True` (the default), disable Nagle's algorithm,
+    so that short commands are sent immediately.
+
+    bandwidth_delay_product: If not `None`, the product of the
+    bandwidth (in bytes per second) and the round trip time (in
+    seconds) of the network path to the server. The receive and send
+    buffers of the sockets are set to this size, so that a transfer
+    can use the full bandwidth. If `None` (the default), keep the
+    buffer sizes of the operating system, which usually adapts them
+    automatically. Since the sockets are created by the session base
+    class, the buffer sizes can only be set after the connection has
+    been established (see `configure_socket`).
+
+    tcp_keepalive: If `True`, enable TCP keepalive probes. The
+    default is `False`. `keepalive_idle` is the idle time in seconds
+    before the first probe, `keepalive_interval` the time in seconds
+    between probes and `keepalive_count` the number of unanswered
+    probes after which the connection is considered broken. If one of
+    these is `None` (the default) or the platform doesn't support the
+    setting, the system default is used.
+
+    connect_timeout: Timeout in seconds for establishing the command
+    and data connections. If `None` (the default), use the default of
+    the session base class.
+
+    read_timeout: Timeout in seconds for blocking socket operations
+    after the connection has been established. If `None` (the
+    default), keep the timeout of the connection.
+    """
+
+    # pylint: disable=too-many-instance-attributes,too-few-public-methods
+
+    def __init__(
+        self,
+        *,
+        tcp_nodelay=True,
+        bandwidth_delay_product=None,
+        tcp_keepalive=False,
+        keepalive_idle=None,
+        keepalive_interval=None,
+        keepalive_count=None,
+        connect_timeout=None,
+        read_timeout=None,
+    ):
+        # pylint: disable=too-many-arguments
+        for name, value in [
+            ("bandwidth_delay_product", bandwidth_delay_product),
+            ("keepalive_idle", keepalive_idle),
+            ("keepalive_interval", keepalive_interval),
+            ("keepalive_count", keepalive_count),
+            ("connect_timeout", connect_timeout),
+            ("read_timeout", read_timeout),
+        ]:
+            if (value is not None) and (value <= 0):
+                raise ValueError(
+                    "{} must be positive or None, not {!r}".format(name, value)
+                )
+        self.tcp_nodelay = tcp_nodelay
+        self.bandwidth_delay_product = bandwidth_delay_product
+        self.tcp_keepalive = tcp_keepalive
+        self.keepalive_idle = keepalive_idle
+        self.keepalive_interval = keepalive_interval
+        self.keepalive_count = keepalive_count
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+
+    def configure_socket(self, sock):
+        """Apply the settings to the connected socket `sock`."""
+        if self.tcp_nodelay:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if self.bandwidth_delay_product is not None:
+            # The base class connects the sockets itself, so the
+            # buffer sizes can't be set before the connect. However,
+            # the TCP window scale is negotiated during the connect.
+            # Depending on the operating system, a receive buffer set
+            # afterwards may therefore not result in a larger window.
+            # Also, the operating system caps the sizes (on Linux at
+            # `net.core.rmem_max` and `net.core.wmem_max`) and stops
+            # adapting the buffer sizes automatically.
+            buffer_size = int(self.bandwidth_delay_product)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, buffer_size)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, buffer_size)
+        if self.tcp_keepalive:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            # `TCP_KEEPIDLE` is called `TCP_KEEPALIVE` on macOS.
+            idle_option = getattr(
+                socket, "TCP_KEEPIDLE", getattr(socket, "TCP_KEEPALIVE", None)
+            )
+            for option, value in [
+                (idle_option, self.keepalive_idle),
+                (getattr(socket, "TCP_KEEPINTVL", None), self.keepalive_interval),
+                (getattr(socket, "TCP_KEEPCNT", None), self.keepalive_count),
+            ]:
+                if (option is not None) and (value is not None):
+                    sock.setsockopt(socket.IPPROTO_TCP, option, int(value))
+        if self.read_timeout is not None:
+            sock.settimeout(self.read_timeout)
 
 
 # In a way, it would be appropriate to call this function
@@ -23,6 +128,8 @@ def session_factory(
     use_passive_mode=None,
     *,
     encrypt_data_channel=True,
+    reuse_tls_session=True,
+    network_profile=None,
     debug_level=None,
 ):
     """
@@ -46,6 +153,17 @@ def session_factory(
     method of the base class if it has the method. If `False` or
     `None` (`None` is the default), don't call the method.
 
+    reuse_tls_session: If `True` (the default) and `base_class` is
+    `ftplib.FTP_TLS` or derived from it, encrypted data connections
+    reuse the TLS session of the command channel. This avoids a full
+    TLS handshake for each data connection (directory listings and
+    file transfers) and is required by many FTPS servers. If `False`,
+    use the data connections of the base class.
+
+    network_profile: If not `None`, a `NetworkProfile` object with
+    the settings for the sockets of the command and data connections.
+    The default is `None`, meaning that the sockets aren't changed.
+
     debug_level: Debug level (integer) to be set on a session
     instance. The default is `None`, meaning no debugging output.
 
@@ -64,12 +182,20 @@ def session_factory(
         ...
     """
 
+    reuse_session_for_data = reuse_tls_session and _is_ftplib_tls_class(base_class)
+
     class Session(base_class):
         """Session factory class created by `session_factory`."""
 
         def __init__(self, host, user, password):
             super().__init__()
-            self.connect(host, port)
+            if (network_profile is None) or (network_profile.connect_timeout is None):
+                self.connect(host, port)
+            else:
+                # The timeout is also used for the data connections.
+                self.connect(host, port, network_profile.connect_timeout)
+            if network_profile is not None:
+                network_profile.configure_socket(self.sock)
             if debug_level is not None:
                 self.set_debuglevel(debug_level)
             self.login(user, password)
@@ -80,4 +206,40 @@ def session_factory(
             if encrypt_data_channel and hasattr(base_class, "prot_p"):
                 self.prot_p()
 
+        if reuse_session_for_data or (network_profile is not None):
+
+            def ntransfercmd(self, cmd, rest=None):
+                """
+                Like `ntransfercmd` of the base class, but reuse the TLS
+                session of the command channel for the data connection
+                (if `reuse_tls_session` is true) and configure the socket
+                of the data connection according to `network_profile`.
+                """
+                if not reuse_session_for_data:
+                    conn, size = super().ntransfercmd(cmd, rest)
+                    if network_profile is not None:
+                        network_profile.configure_socket(conn)
+                    return conn, size
+                # Skip `FTP_TLS.ntransfercmd`, which wraps the socket
+                # without a session.
+                # pylint: disable=bad-super-call
+                conn, size = super(ftplib.FTP_TLS, self).ntransfercmd(cmd, rest)
+                # Configure the socket before the TLS handshake.
+                if network_profile is not None:
+                    network_profile.configure_socket(conn)
+                if self._prot_p:
+                    conn = self.context.wrap_socket(
+                        conn, server_hostname=self.host, session=self.sock.session
+                    )
+                return conn, size
+
     return Session
+
+
+def _is_ftplib_tls_class(class_):
+    """
+    Return `True` if `class_` is `ftplib.FTP_TLS` or derived from it.
+    `ftplib.FTP_TLS` doesn't exist if Python was built without `ssl`.
+    """
+    ftp_tls_class = getattr(ftplib, "FTP_TLS", None)
+    return (ftp_tls_class is not None) and issubclass(class_, ftp_tls_class)
@@ -0,0 +1,136 @@
+# Copyright (C) 2020, Stefan Schwarzer <sschwarzer@sschwarzer.net>
+# and ftputil contributors (see `doc/contributors.txt`)
+# See the file LICENSE for licensing terms.
+
+"""
+session_pool.py - pool of `FTPHost` connections for worker threads
+
+An `FTPHost` object must not be used by several threads at the same
+time. To run operations in parallel, each worker thread borrows its
+own `FTPHost` object from a `HostPool`.
+"""
+
+import contextlib
+import queue
+import threading
+
+import ftputil.host
+
+
+# This module is for internal use by other ftputil modules.
+__all__ = []
+
+
+def _clone(host):
+    """
+    Return a new `FTPHost` object with its own connection to the
+    server of `host` and the same settings as `host`.
+    """
+    # pylint: disable=protected-access
+    new_host = host._copy()
+    new_host._time_shift = host._time_shift
+    new_host.use_list_a_option = host.use_list_a_option
+    new_host.use_compression = host.use_compression
+    # Share the limiter, so that a host-wide limit applies to all
+    # connections together.
+    new_host._rate_limiter = host._rate_limiter
+    new_host._stat._parser = host._stat._parser
+    new_host._stat._allow_parser_switching = host._stat._allow_parser_switching
+    new_host._stat._parser_detection = host._stat._parser_detection
+    # Keep the pooled connection warm while it's idle. The clone
+    # shares the keep-alive thread of `host`, so that the sessions of
+    # its children for remote files are guarded, too.
+    if host._keep_alive is not None:
+        host._keep_alive.add_host(new_host)
+        new_host._keep_alive = host._keep_alive
+    return new_host
+
+
+class HostPool:
+    """
+    Pool of up to `size` `FTPHost` objects connected to the same
+    server as `host`.
+
+    The connections are made on demand. Use the pool like
+
+      with pool.host() as worker_host:
+          worker_host.stat(path)
+
+    Objects which aren't `FTPHost`s (for example `sync.LocalHost`)
+    don't have state that would make them unsafe for threads, so the
+    pool hands out `host` itself for them.
+    """
+
+    def __init__(self, host, size):
+        self._host = host
+        self._size = size
+        self._is_ftp_host = isinstance(host, ftputil.host.FTPHost)
+        self._lock = threading.Lock()
+        # All hosts created by the pool
+        self._hosts = []
+        self._idle_hosts = queue.LifoQueue()
+
+    def _acquire(self):
+        """
+        Return an idle host, connecting a new one if there's no idle
+        host and the pool isn't full yet. Otherwise wait for a host.
+        """
+        try:
+            return self._idle_hosts.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            can_connect = len(self._hosts) < self._size
+            if can_connect:
+                # Reserve the place in the pool before connecting, so
+                # that other threads don't exceed the size.
+                self._hosts.append(None)
+        if not can_connect:
+            return self._idle_hosts.get()
+        try:
+            new_host = _clone(self._host)
+        except BaseException:
+            with self._lock:
+                self._hosts.remove(None)
+            raise
+        with self._lock:
+            self._hosts[self._hosts.index(None)] = new_host
+        return new_host
+
+    @contextlib.contextmanager
+    def host(self):
+        """
+        Context manager to borrow a host from the pool. The host is
+        returned to the pool when the context is left.
+        """
+        if not self._is_ftp_host:
+            yield self._host
+            return
+        borrowed_host = self._acquire()
+        try:
+            yield borrowed_host
+        finally:
+            self._idle_hosts.put(borrowed_host)
+
+    def close(self):
+        """
+        Close all hosts created by the pool. Don't use the pool after
+        closing it.
+        """
+        # pylint: disable=protected-access
+        with self._lock:
+            hosts, self._hosts = self._hosts, []
+        for host in hosts:
+            if host is not None:
+                # The keep-alive thread belongs to the host the pool
+                # was made for, so closing a pool host mustn't stop it.
+                host._keep_alive = None
+                host.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        # pylint: disable=unused-argument
+        self.close()
+        return False
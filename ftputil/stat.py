@@ -135,6 +135,22 @@ class Parser:
         """
         raise NotImplementedError("must be defined by subclass")
 
+    # Derived classes may use `self`.
+    # pylint: disable=no-self-use,unused-argument
+    def parse_name(self, line):
+        """
+        Return the name of the directory entry in the string `line`,
+        without parsing the other fields of the line. For a link, return
+        the name of the link, not of the target.
+
+        If the given text line can't be parsed, raise a `ParserError`.
+
+        If the parser can't extract the name without parsing the whole
+        line, return `None`. This is the default implementation. In
+        this case, ftputil uses `parse_line` instead.
+        """
+        return None
+
     #
     # Helper methods for parts of a directory listing line
     #
@@ -212,9 +228,8 @@ class Parser:
                 year, month, day, hour, minute, second, tzinfo=datetime.timezone.utc
             )
         except ValueError:
-            invalid_datetime = (
-                f"{year:04d}-{month:02d}-{day:02d} "
-                f"{hour:02d}:{minute:02d}:{second:02d}"
+            invalid_datetime = "{:04d}-{:02d}-{:02d} {:02d}:{:02d}:{:02d}".format(
+                year, month, day, hour, minute, second
             )
             raise ftputil.error.ParserError(
                 "invalid datetime {0!r}".format(invalid_datetime)
@@ -430,6 +445,42 @@ class UnixParser(Parser):
             line_parts.insert(USER_FIELD_INDEX, None)
         return line_parts
 
+    @staticmethod
+    def _split_name(name):
+        """
+        Return a tuple `(st_name, st_target)` from the name field of a
+        directory line. If `name` isn't a link, `st_target` is `None`.
+        """
+        if name.count(" -> ") > 1:
+            # If we have more than one arrow we can't tell where the link name
+            # ends and the target name starts.
+            raise ftputil.error.ParserError(
+                '''name '{}' contains more than one "->"'''.format(name)
+            )
+        elif name.count(" -> ") == 1:
+            st_name, st_target = name.split(" -> ")
+        else:
+            st_name, st_target = name, None
+        return st_name, st_target
+
+    def parse_name(self, line):
+        """
+        Return the name of the directory entry in the given text line.
+
+        If the line can't be parsed, raise a `ParserError`.
+        """
+        line_parts = self._split_line(line)
+        # Compare `parse_line`. The name is blank if there are fewer parts.
+        if len(line_parts) != 9:
+            raise ftputil.error.ParserError("line '{}' can't be parsed".format(line))
+        mode_string, name = line_parts[0], line_parts[8]
+        if len(mode_string) != 10:
+            raise ftputil.error.ParserError(
+                "invalid mode string '{}'".format(mode_string)
+            )
+        st_name, _ = self._split_name(name)
+        return st_name
+
     def parse_line(self, line, time_shift=0.0):
         """
         Return a `StatResult` instance corresponding to the given text line.
@@ -474,16 +525,7 @@ class UnixParser(Parser):
         # st_ctime
         st_ctime = None
         # st_name
-        if name.count(" -> ") > 1:
-            # If we have more than one arrow we can't tell where the link name
-            # ends and the target name starts.
-            raise ftputil.error.ParserError(
-                '''name '{}' contains more than one "->"'''.format(name)
-            )
-        elif name.count(" -> ") == 1:
-            st_name, st_target = name.split(" -> ")
-        else:
-            st_name, st_target = name, None
+        st_name, st_target = self._split_name(name)
         stat_result = StatResult(
             (
                 st_mode,
@@ -512,6 +554,19 @@ class MSParser(Parser):
     `Parser` class for MS-specific directory format.
     """
 
+    def parse_name(self, line):
+        """
+        Return the name of the directory entry in the given text line.
+
+        If the line can't be parsed, raise a `ParserError`.
+        """
+        try:
+            _, _, _, name = line.split(None, 3)
+        except ValueError:
+            # "unpack list of wrong size"
+            raise ftputil.error.ParserError("line '{}' can't be parsed".format(line))
+        return name
+
     def parse_line(self, line, time_shift=0.0):
         """
         Return a `StatResult` instance corresponding to the given text line
@@ -599,6 +654,18 @@ class _Stat:
         # Allow one chance to switch to another parser if the default doesn't
         # work.
         self._allow_parser_switching = True
+        # `None` before the parser has been detected from a directory
+        # listing, then a tuple `(parser, confidence)`, see `_detect_parser`
+        self._parser_detection = None
+        # During a call of `__call_with_parser_retry`, a dictionary which maps
+        # directory paths to the lines of their listing, so that a retry with
+        # another parser doesn't need another `LIST` command. Otherwise
+        # `None`.
+        self._listing_memo = None
+        # Directories whose entries were cached while parser switching was
+        # still allowed. After a switch, their cache entries may have been
+        # made with the wrong parser.
+        self._dirs_with_unconfirmed_parser = set()
         # Cache only lstat results. `stat` works locally on `lstat` results.
         self._lstat_cache = ftputil.stat_cache.StatCache()
 
@@ -606,38 +673,144 @@ class _Stat:
         """
         Return a list of lines, as fetched by FTP's `LIST` command, when
         applied to `path`.
+
+        Within a call of `__call_with_parser_retry`, list each directory only
+        once.
         """
-        return self._host._dir(path)
+        if self._listing_memo is None:
+            return self._host._dir(path)
+        try:
+            return self._listing_memo[path]
+        except KeyError:
+            lines = self._host._dir(path)
+            self._listing_memo[path] = lines
+            return lines
+
+    # Parsers to choose from in `_detect_parser` and when switching parsers
+    # after a `ParserError`
+    _detection_parser_classes = (UnixParser, MSParser)
+
+    # Maximum number of lines `_detect_parser` tries to parse
+    _DETECTION_SAMPLE_SIZE = 10
 
-    def _stat_results_from_dir(self, path):
+    def _detect_parser(self, lines):
         """
-        Yield stat results extracted from the directory listing `path`. Omit
+        Choose the parser from `_detection_parser_classes` which can parse
+        the most lines of a sample from the directory listing `lines`.
+
+        If a sample is available, store the parser and the fraction of the
+        sample lines it could parse (the "confidence") in
+        `_parser_detection`. If only the chosen parser could parse all
+        sample lines, don't switch parsers anymore.
+        """
+        time_shift = self._host.time_shift()
+        confidences = []
+        for parser_class in self._detection_parser_classes:
+            if isinstance(self._parser, parser_class):
+                parser = self._parser
+            else:
+                parser = parser_class()
+            sample = [line for line in lines if not parser.ignores_line(line)][
+                : self._DETECTION_SAMPLE_SIZE
+            ]
+            if not sample:
+                continue
+            parsed_line_count = 0
+            for line in sample:
+                try:
+                    parser.parse_line(line, time_shift)
+                except ftputil.error.ParserError:
+                    pass
+                else:
+                    parsed_line_count += 1
+            confidences.append((parsed_line_count / len(sample), parser))
+        if not confidences:
+            # Only empty listings or summary lines, try again next time.
+            return
+        # Prefer the current parser if the confidences are the same.
+        best_confidence, best_parser = max(
+            confidences, key=lambda item: (item[0], item[1] is self._parser)
+        )
+        self._parser = best_parser
+        self._parser_detection = (best_parser, best_confidence)
+        perfect_parser_count = sum(
+            1 for confidence, _ in confidences if confidence == 1.0
+        )
+        if (best_confidence == 1.0) and (perfect_parser_count == 1):
+            self._allow_parser_switching = False
+
+    def _alternative_parser(self):
+        """
+        Return a parser from `_detection_parser_classes` which isn't an
+        instance of the class of the current parser.
+        """
+        for parser_class in self._detection_parser_classes:
+            if not isinstance(self._parser, parser_class):
+                return parser_class()
+        return MSParser()
+
+    def _entries_from_dir(self, path):
+        """
+        Yield tuples `(name, entry)` for the directory listing `path`. Omit
         the special entries for the directory itself and its parent directory.
+
+        If the parser can extract the name from a directory line without
+        parsing the whole line, `entry` is a `ftputil.stat_cache.LazyEntry`,
+        which parses the line when its value is needed (see `_parse_line`).
+        Otherwise `entry` is the `StatResult` for the line.
         """
         lines = self._host_dir(path)
+        if self._allow_parser_switching and (self._parser_detection is None):
+            self._detect_parser(lines)
         # `cache` is the "high-level" `StatCache` object whereas `cache._cache`
         # is the "low-level" `LRUCache` object.
         cache = self._lstat_cache
+        if cache._enabled:
+            cache.note_listing(path, lines)
+            if self._allow_parser_switching:
+                self._dirs_with_unconfirmed_parser.add(path)
         # Auto-grow cache if the cache up to now can't hold as many entries as
         # there are in the directory `path`.
         if cache._enabled and len(lines) >= cache._cache.size:
             new_size = int(math.ceil(1.1 * len(lines)))
             cache.resize(new_size)
-        # Yield stat results from lines.
+        parser = self._parser
+        # Yield entries from lines.
         for line in lines:
-            if self._parser.ignores_line(line):
+            if parser.ignores_line(line):
                 continue
-            # Although for a `listdir` call we're only interested in the names,
-            # use the `time_shift` parameter to store the correct timestamp
-            # values in the cache.
-            stat_result = self._parser.parse_line(line, self._host.time_shift())
+            name = parser.parse_name(line)
+            if name is None:
+                entry = self._parse_line(parser, line)
+                name = entry._st_name
+            else:
+                entry = ftputil.stat_cache.LazyEntry(self._parse_line, parser, line)
             # Skip entries "." and "..".
-            if stat_result._st_name in [self._host.curdir, self._host.pardir]:
+            if name in [self._host.curdir, self._host.pardir]:
                 continue
-            loop_path = self._path.join(path, stat_result._st_name)
+            loop_path = self._path.join(path, name)
             # No-op if cache is disabled.
-            cache[loop_path] = stat_result
-            yield stat_result
+            cache[loop_path] = entry
+            yield name, entry
+
+    def _parse_line(self, parser, line):
+        """
+        Return the `StatResult` for the directory line `line`, parsed with
+        `parser`.
+
+        Use the time shift at the time of the call, so that a lazy entry
+        uses the current time shift, not the one at the time of the listing.
+        """
+        return parser.parse_line(line, self._host.time_shift())
+
+    @staticmethod
+    def _stat_result(entry):
+        """
+        Return the `StatResult` for an `entry` from `_entries_from_dir`.
+        """
+        if isinstance(entry, ftputil.stat_cache.LazyEntry):
+            return entry.value()
+        return entry
 
     # The methods `listdir`, `lstat` and `stat` come in two variants. The
     # methods `_real_listdir`, `_real_lstat` and `_real_stat` use the currently
@@ -668,8 +841,9 @@ class _Stat:
         Like `os.listdir` the returned list elements have the type of the path
         argument.
 
-        If the directory listing from the server can't be parsed, raise a
-        `ParserError`.
+        If the names can't be extracted from the directory listing, raise a
+        `ParserError`. The other fields of the lines are parsed later, when
+        their stat results are needed.
         """
         # We _can't_ put this check into `FTPHost._dir`; see its docstring.
         path = self._path.abspath(path)
@@ -678,12 +852,10 @@ class _Stat:
             raise ftputil.error.PermanentError(
                 "550 {}: no such directory or wrong directory parser used".format(path)
             )
-        # Set up for `for` loop.
-        names = []
-        for stat_result in self._stat_results_from_dir(path):
-            st_name = stat_result._st_name
-            names.append(st_name)
-        return names
+        # Only the names are needed, so lazy entries stay unparsed. A line
+        # the parser can't make sense of still results in a `ParserError`
+        # from `parse_name`, which also detects a wrong parser.
+        return [name for name, _ in self._entries_from_dir(path)]
 
     def _real_lstat(self, path, _exception_for_missing_path=True):
         """
@@ -718,17 +890,17 @@ class _Stat:
         # Loop through all lines of the directory listing. We probably won't
         # need all lines for the particular path but we want to collect as many
         # stat results in the cache as possible.
-        lstat_result_for_path = None
+        entry_for_path = None
         # FIXME: Here we try to list the contents of `dirname` even though the
         # above `isdir` call might/could have shown that the directory doesn't
         # exist. This may be related to ticket #108. That said, we may need to
         # consider virtual directories here (see tickets #86 / #87).
-        for stat_result in self._stat_results_from_dir(dirname):
+        for name, entry in self._entries_from_dir(dirname):
             # Needed to work without cache or with disabled cache.
-            if stat_result._st_name == basename:
-                lstat_result_for_path = stat_result
-        if lstat_result_for_path is not None:
-            return lstat_result_for_path
+            if name == basename:
+                entry_for_path = entry
+        if entry_for_path is not None:
+            return self._stat_result(entry_for_path)
         # Path was not found during the loop.
         if _exception_for_missing_path:
             # TODO: Use FTP `LIST` command on the file to implicitly use the
@@ -785,29 +957,142 @@ class _Stat:
             # Remember the path we have encountered.
             visited_paths.add(path)
 
+    def _real_lstat_many(self, paths, listings=None):
+        """
+        Return a dictionary which maps the absolute paths in the iterable
+        `paths` to their lstat results, or to `None` if a path doesn't exist.
+
+        List each parent directory of the paths which aren't in the cache only
+        once. `listings` optionally maps directory paths to the lines of their
+        listings, as fetched beforehand, or to `None` if the directory couldn't
+        be listed.
+
+        If a directory listing can't be parsed, raise a `ParserError`.
+        """
+        listings = listings or {}
+        for dir_path, lines in listings.items():
+            if lines is not None:
+                self._listing_memo[dir_path] = lines
+        results = {}
+        # Map parent directories to the names to look up in them
+        names_by_dir = {}
+        for path in paths:
+            if path in results:
+                continue
+            if path == "/":
+                raise ftputil.error.RootDirError("can't stat remote root directory")
+            if path in self._lstat_cache:
+                results[path] = self._lstat_cache[path]
+                continue
+            results[path] = None
+            dirname, basename = self._path.split(path)
+            names_by_dir.setdefault(dirname, []).append(basename)
+        for dirname, basenames in names_by_dir.items():
+            if (dirname in listings) and (listings[dirname] is None):
+                continue
+            try:
+                entries = dict(self._entries_from_dir(dirname))
+            except ftputil.error.PermanentError:
+                # `dirname` doesn't exist or isn't a directory.
+                continue
+            for basename in basenames:
+                if basename in entries:
+                    results[self._path.join(dirname, basename)] = self._stat_result(
+                        entries[basename]
+                    )
+        return results
+
+    def _real_stat_many(self, paths, listings=None):
+        """
+        Return a dictionary which maps the absolute paths in the iterable
+        `paths` to their stat results, or to `None` if a path doesn't exist,
+        also if it's a link to a path which doesn't exist.
+
+        The links are followed for all paths together, so that again each
+        directory is listed only once per link level.
+
+        For `listings` see `_real_lstat_many`. If a link chain is cyclic,
+        raise a `RecursiveLinksError`.
+        """
+        results = self._real_lstat_many(paths, listings)
+        # Map the original paths of links to tuples `(link_path,
+        # lstat_result, visited_paths)` for the link to follow next
+        pending_links = {
+            path: (path, lstat_result, set())
+            for path, lstat_result in results.items()
+            if (lstat_result is not None) and stat.S_ISLNK(lstat_result.st_mode)
+        }
+        while pending_links:
+            targets = {}
+            for path, (link_path, lstat_result, visited_paths) in pending_links.items():
+                dirname, _ = self._path.split(link_path)
+                target = self._path.join(dirname, lstat_result._st_target)
+                target = self._path.abspath(self._path.normpath(target))
+                if target in visited_paths:
+                    raise ftputil.error.RecursiveLinksError(
+                        "recursive link structure detected for remote path "
+                        "'{}'".format(path)
+                    )
+                visited_paths.add(target)
+                targets[path] = target
+            target_results = self._real_lstat_many(targets.values())
+            next_pending_links = {}
+            for path, target in targets.items():
+                lstat_result = target_results[target]
+                if (lstat_result is not None) and stat.S_ISLNK(lstat_result.st_mode):
+                    next_pending_links[path] = (
+                        target,
+                        lstat_result,
+                        pending_links[path][2],
+                    )
+                else:
+                    results[path] = lstat_result
+            pending_links = next_pending_links
+        return results
+
     def __call_with_parser_retry(self, method, *args, **kwargs):
         """
         Call `method` with the `args` and `kwargs` once. If that results in a
         `ParserError` and only one parser has been used yet, try the other
         parser. If that still fails, propagate the `ParserError`.
+
+        The retry with the other parser reuses the directory listings fetched
+        by the first call.
         """
-        # Do _not_ set `_allow_parser_switching` in a `finally` clause! This
-        # would cause a `PermanentError` due to a not-found file in an empty
-        # directory to finally establish the parser - which is wrong.
+        # Nested calls (for example via `isdir` in `_real_listdir`) share the
+        # listings of the outermost call.
+        is_outermost_call = self._listing_memo is None
+        if is_outermost_call:
+            self._listing_memo = {}
         try:
-            result = method(*args, **kwargs)
-            # If a `listdir` call didn't find anything, we can't say anything
-            # about the usefulness of the parser.
-            if (method is not self._real_listdir) and result:
-                self._allow_parser_switching = False
-            return result
-        except ftputil.error.ParserError:
-            if self._allow_parser_switching:
-                self._allow_parser_switching = False
-                self._parser = MSParser()
-                return method(*args, **kwargs)
-            else:
-                raise
+            # Do _not_ set `_allow_parser_switching` in a `finally` clause!
+            # This would cause a `PermanentError` due to a not-found file in
+            # an empty directory to finally establish the parser - which is
+            # wrong.
+            try:
+                result = method(*args, **kwargs)
+                # If a `listdir` call didn't find anything, we can't say
+                # anything about the usefulness of the parser.
+                if (method is not self._real_listdir) and result:
+                    self._allow_parser_switching = False
+                    self._dirs_with_unconfirmed_parser.clear()
+                return result
+            except ftputil.error.ParserError:
+                if self._allow_parser_switching:
+                    self._allow_parser_switching = False
+                    self._parser = self._alternative_parser()
+                    # The cached entries from listings made while switching
+                    # was allowed may come from the previous parser, possibly
+                    # still unparsed. Entries for other directories stay.
+                    for path in self._dirs_with_unconfirmed_parser:
+                        self._lstat_cache.invalidate_tree(path)
+                    self._dirs_with_unconfirmed_parser.clear()
+                    return method(*args, **kwargs)
+                else:
+                    raise
+        finally:
+            if is_outermost_call:
+                self._listing_memo = None
 
     # Client code should never use these methods, but only the corresponding
     # methods without the leading underscore in the `FTPHost` class.
@@ -842,3 +1127,17 @@ class _Stat:
         return self.__call_with_parser_retry(
             self._real_stat, path, _exception_for_missing_path
         )
+
+    def _lstat_many(self, paths, listings=None):
+        """
+        Return a dictionary which maps the absolute `paths` to `StatResult`s
+        without following links, or to `None` for missing paths.
+        """
+        return self.__call_with_parser_retry(self._real_lstat_many, paths, listings)
+
+    def _stat_many(self, paths, listings=None):
+        """
+        Return a dictionary which maps the absolute `paths` to `StatResult`s
+        with following links, or to `None` for missing paths.
+        """
+        return self.__call_with_parser_retry(self._real_stat_many, paths, listings)
@@ -6,6 +6,7 @@
 ftp_stat_cache.py - cache for (l)stat data
 """
 
+import posixpath
 import time
 
 import ftputil.error
@@ -16,6 +17,31 @@ import ftputil.lrucache
 __all__ = []
 
 
+class LazyEntry:
+    """
+    Cache entry whose value is computed by calling `function` with
+    `args` on the first access with `value`.
+
+    The arguments are released after the call, so for example a raw
+    directory line is only kept until it has been parsed.
+    """
+
+    __slots__ = ("_function", "_args", "_value")
+
+    def __init__(self, function, *args):
+        self._function = function
+        self._args = args
+        self._value = None
+
+    def value(self):
+        """Return the value of the entry, computing it if necessary."""
+        if self._function is not None:
+            self._value = self._function(*self._args)
+            self._function = None
+            self._args = None
+        return self._value
+
+
 class StatCache:
     """
     Implement an LRU (least-recently-used) cache.
@@ -32,6 +58,20 @@ class StatCache:
     that, the entry will be treated as if it had never been in the
     cache and should be fetched again from the remote host.
 
+    The maximum age can be set for directory trees with
+    `set_max_age`, for example to let entries for an archive never
+    expire. With `enable_adaptive_max_age`, the maximum age of the
+    entries of each directory adapts to how often the directory
+    changes.
+
+    An index from directories to the cached paths in them makes it
+    possible to invalidate or rename a whole directory tree with
+    `invalidate_tree` and `rename_tree` in time proportional to the
+    number of cached paths in the tree.
+
+    Entries may be stored as `LazyEntry` objects. Their values are
+    computed when they're retrieved for the first time.
+
     Note that the `__len__` method does no age tests and thus may
     include some or many already expired entries.
     """
@@ -44,6 +84,17 @@ class StatCache:
         self._cache = ftputil.lrucache.LRUCache(self._DEFAULT_CACHE_SIZE)
         # Never expire
         self.max_age = None
+        # Map directory prefixes to the maximum age of the entries in
+        # and below the directory, see `set_max_age`
+        self._max_age_rules = {}
+        # `None` or a tuple `(min_age, max_age)`, see
+        # `enable_adaptive_max_age`
+        self._adaptive_age_range = None
+        # Map directory paths to tuples `(fingerprint, max_age)` with
+        # a fingerprint of the last directory listing and the current
+        # maximum age of the directory entries
+        self._dir_states = ftputil.lrucache.LRUCache(self._DEFAULT_CACHE_SIZE)
+        self._clear_index()
         self.enable()
 
     def enable(self):
@@ -70,6 +121,7 @@ class StatCache:
         relatively long-unused elements will be removed.
         """
         self._cache.size = new_size
+        self._index_size_limit = 2 * max(self._index_size, new_size)
 
     def _age(self, path):
         """
@@ -83,9 +135,219 @@ class StatCache:
                 "no entry for path {} in cache".format(path)
             )
 
+    @staticmethod
+    def _normalized_dir(path):
+        """
+        Return the absolute directory path `path` without trailing
+        slash. If `path` isn't absolute, raise a `ValueError`.
+        """
+        if not path.startswith("/"):
+            raise ValueError("{!r} must be an absolute path".format(path))
+        return posixpath.normpath(path)
+
+    def set_max_age(self, prefix, max_age):
+        """
+        Set the maximum age of entries in the absolute directory
+        `prefix` and its subdirectories to `max_age` seconds. If
+        `max_age` is `None`, these entries never expire.
+
+        If several rules match a path, the rule for the longest
+        prefix is used. Rules take precedence over the adaptive
+        maximum age and the `max_age` attribute.
+        """
+        self._max_age_rules[self._normalized_dir(prefix)] = max_age
+
+    def remove_max_age(self, prefix):
+        """
+        Remove the rule for `prefix` set with `set_max_age`. If there's
+        no such rule, do nothing.
+        """
+        self._max_age_rules.pop(self._normalized_dir(prefix), None)
+
+    def enable_adaptive_max_age(self, min_age=5.0, max_age=3600.0):
+        """
+        Adapt the maximum age of the entries of each directory to how
+        often the directory changes.
+
+        When a directory is listed for the first time, the maximum age
+        of its entries is `min_age` seconds. Each time the directory
+        is listed again, the maximum age is doubled if the listing
+        hasn't changed and halved if it has, but stays between
+        `min_age` and `max_age`.
+        """
+        if not 0 < min_age <= max_age:
+            raise ValueError("invalid age range {!r} to {!r}".format(min_age, max_age))
+        self._adaptive_age_range = (min_age, max_age)
+
+    def disable_adaptive_max_age(self):
+        """
+        Use the `max_age` attribute again for directories without a
+        rule set with `set_max_age`.
+        """
+        self._adaptive_age_range = None
+        self._dir_states.clear()
+
+    def note_listing(self, dir_path, lines):
+        """
+        Update the adaptive maximum age for the absolute directory
+        `dir_path` after it has been listed with the result `lines`.
+        """
+        if self._adaptive_age_range is None:
+            return
+        min_age, max_age = self._adaptive_age_range
+        dir_path = self._normalized_dir(dir_path)
+        fingerprint = hash(tuple(lines))
+        try:
+            old_fingerprint, dir_max_age = self._dir_states[dir_path]
+        except ftputil.lrucache.CacheKeyError:
+            dir_max_age = min_age
+        else:
+            if fingerprint == old_fingerprint:
+                dir_max_age = min(2 * dir_max_age, max_age)
+            else:
+                dir_max_age = max(dir_max_age / 2, min_age)
+        self._dir_states[dir_path] = (fingerprint, dir_max_age)
+
+    def max_age_for(self, path):
+        """
+        Return the maximum age of the cache entry for the absolute
+        `path` in seconds or `None` if the entry doesn't expire.
+        """
+        if (not self._max_age_rules) and (self._adaptive_age_range is None):
+            return self.max_age
+        dir_path = posixpath.dirname(path)
+        if self._max_age_rules:
+            prefix = dir_path
+            while True:
+                if prefix in self._max_age_rules:
+                    return self._max_age_rules[prefix]
+                if prefix == "/":
+                    break
+                prefix = posixpath.dirname(prefix)
+        if self._adaptive_age_range is not None:
+            try:
+                return self._dir_states[dir_path][1]
+            except ftputil.lrucache.CacheKeyError:
+                return self._adaptive_age_range[0]
+        return self.max_age
+
+    #
+    # Index of directories and the cached paths in them
+    #
+    # The LRU cache silently drops entries when it's full, so the index
+    # may contain paths which aren't in the cache anymore. These don't
+    # do any harm, but to limit the memory usage, the index is rebuilt
+    # from the cached paths when it grows too large. Directories of
+    # indexed paths are always indexed, too, so that a tree can be
+    # traversed from its root even if some directories aren't cached.
+    #
+    def _clear_index(self):
+        """Remove all paths from the index."""
+        # Map directory paths to sets of paths in the directory
+        self._children = {}
+        # Number of paths in all sets of `_children`
+        self._index_size = 0
+        # If `_index_size` exceeds this value, rebuild the index.
+        self._index_size_limit = 2 * self._cache.size
+
+    def _index(self, path):
+        """Add the absolute `path` and its parent directories to the index."""
+        while path != "/":
+            parent = posixpath.dirname(path)
+            children = self._children.setdefault(parent, set())
+            if path in children:
+                break
+            children.add(path)
+            self._index_size += 1
+            path = parent
+
+    def _unindex(self, path):
+        """Remove `path` from the index, but not the paths below it."""
+        parent = posixpath.dirname(path)
+        children = self._children.get(parent)
+        if (children is not None) and (path in children):
+            children.remove(path)
+            self._index_size -= 1
+            if not children:
+                del self._children[parent]
+
+    def _rebuild_index(self):
+        """Rebuild the index from the paths in the cache."""
+        self._clear_index()
+        for path in self._cache:
+            self._index(path)
+        self._index_size_limit = 2 * max(self._index_size, self._cache.size)
+
+    def _tree_paths(self, top):
+        """
+        Return a list of `top` and the indexed paths below it,
+        parents before their children.
+        """
+        paths = [top]
+        for path in paths:
+            paths.extend(self._children.get(path, ()))
+        return paths
+
+    def invalidate_tree(self, top):
+        """
+        Invalidate the cache entries for the absolute path `top` and
+        all paths below it. Unlike `clear`, this keeps the entries for
+        other paths.
+        """
+        top = self._normalized_dir(top)
+        for path in self._tree_paths(top):
+            try:
+                del self._cache[path]
+            except ftputil.lrucache.CacheKeyError:
+                pass
+            try:
+                del self._dir_states[path]
+            except ftputil.lrucache.CacheKeyError:
+                pass
+            children = self._children.pop(path, None)
+            if children:
+                self._index_size -= len(children)
+        self._unindex(top)
+
+    def rename_tree(self, old_top, new_top):
+        """
+        Update the cache after the absolute path `old_top` has been
+        renamed to `new_top`.
+
+        The entries below `old_top` are moved below `new_top`, keeping
+        their age. The entries for `old_top` and `new_top` themselves
+        are invalidated because their names (and possibly the type of
+        `new_top`) changed. Entries which were below `new_top` before
+        are invalidated as well.
+        """
+        old_top = self._normalized_dir(old_top)
+        new_top = self._normalized_dir(new_top)
+        if old_top == new_top:
+            return
+        self.invalidate_tree(new_top)
+        if new_top.startswith(old_top + "/"):
+            # Invalid rename into itself; don't try to be clever.
+            self.invalidate_tree(old_top)
+            return
+        old_paths = self._tree_paths(old_top)[1:]
+        for old_path in old_paths:
+            new_path = new_top + old_path[len(old_top) :]
+            try:
+                self._cache.move(old_path, new_path)
+            except ftputil.lrucache.CacheKeyError:
+                pass
+            else:
+                self._index(new_path)
+            try:
+                self._dir_states.move(old_path, new_path)
+            except ftputil.lrucache.CacheKeyError:
+                pass
+        self.invalidate_tree(old_top)
+
     def clear(self):
         """Clear (invalidate) all cache entries."""
         self._cache.clear()
+        self._clear_index()
 
     def invalidate(self, path):
         """
@@ -105,16 +367,22 @@ class StatCache:
         except ftputil.lrucache.CacheKeyError:
             # Ignore errors
             pass
+        # Keep the path in the index if there are indexed paths below
+        # it, so that they can still be found from its parent.
+        if path not in self._children:
+            self._unindex(path)
 
-    def __getitem__(self, path):
+    def _entry(self, path):
         """
-        Return the stat entry for the `path`. If there's no stored
-        stat entry or the cache is disabled, raise `CacheMissError`.
+        Return the stored entry for the `path`, possibly a `LazyEntry`.
+        If there's no stored entry or the cache is disabled, raise
+        `CacheMissError`.
         """
         if not self._enabled:
             raise ftputil.error.CacheMissError("cache is disabled")
+        max_age = self.max_age_for(path)
         # Possibly raise a `CacheMissError` in `_age`
-        if (self.max_age is not None) and (self._age(path) > self.max_age):
+        if (max_age is not None) and (self._age(path) > max_age):
             self.invalidate(path)
             raise ftputil.error.CacheMissError(
                 "entry for path {} has expired".format(path)
@@ -129,6 +397,23 @@ class StatCache:
                     "entry for path {} not found".format(path)
                 )
 
+    def __getitem__(self, path):
+        """
+        Return the stat entry for the `path`. If there's no stored
+        stat entry or the cache is disabled, raise `CacheMissError`.
+
+        If the value of a `LazyEntry` can't be computed, remove the
+        entry and propagate the exception.
+        """
+        entry = self._entry(path)
+        if not isinstance(entry, LazyEntry):
+            return entry
+        try:
+            return entry.value()
+        except Exception:
+            self.invalidate(path)
+            raise
+
     def __setitem__(self, path, stat_result):
         """
         Put the stat data for the absolute `path` into the cache,
@@ -138,6 +423,9 @@ class StatCache:
         if not self._enabled:
             return
         self._cache[path] = stat_result
+        self._index(path)
+        if self._index_size > self._index_size_limit:
+            self._rebuild_index()
 
     def __contains__(self, path):
         """
@@ -146,7 +434,8 @@ class StatCache:
         """
         try:
             # Implicitly do an age test which may raise `CacheMissError`.
-            self[path]
+            # Don't compute the value of a lazy entry.
+            self._entry(path)
         except ftputil.error.CacheMissError:
             return False
         else:
@@ -14,13 +14,23 @@ Tools for syncing combinations of local and remote directories.
 # - remote -> remote
 # - local -> local (maybe implicitly possible due to design, but not targeted)
 
+import concurrent.futures
+import json
 import os
 import shutil
+import stat
+import tempfile
+import threading
 
 from ftputil import FTPHost
 import ftputil.error
+import ftputil.file_transfer
+import ftputil.rate_limit
+import ftputil.session_pool
+import ftputil.stat
 
-__all__ = ["FTPHost", "LocalHost", "Syncer"]
+
+__all__ = ["FTPHost", "LocalHost", "Manifest", "Syncer"]
 
 
 # Used for copying file objects; value is 64 KB.
@@ -49,17 +59,204 @@ class LocalHost:
         """
         return 0.0
 
+    def rmtree(self, path):
+        """Remove the local directory tree `path`."""
+        shutil.rmtree(path)
+
     def __getattr__(self, attr):
         return getattr(os, attr)
 
 
+class Manifest:
+    """
+    State of the last synchronization of a local source directory,
+    stored in a local JSON file.
+
+    For each directory and file under the source directory, the
+    manifest records the relative path (with "/" as separator) and,
+    for files, the size, the modification time and optionally a hash
+    of the content. Comparing a scan of the local tree with the
+    manifest tells which items changed since the last synchronization
+    without looking at the target.
+
+    If `hash_name` is given (one of the algorithms in
+    `ftputil.file_transfer.CHECKSUM_ALGORITHMS`, for example "sha256"),
+    the manifest also records content hashes. Files whose modification
+    time changed but whose size and hash are the same aren't
+    considered changed.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path, hash_name=None):
+        if (hash_name is not None) and (
+            hash_name not in ftputil.file_transfer.CHECKSUM_ALGORITHMS
+        ):
+            raise ValueError("unsupported hash algorithm {!r}".format(hash_name))
+        self.path = os.path.abspath(path)
+        self.hash_name = hash_name
+        # Map relative paths to dictionaries describing the item.
+        self.entries = {}
+
+    def load(self, source_dir, target_dir):
+        """
+        Load the manifest for the synchronization of `source_dir` to
+        `target_dir`.
+
+        If the manifest file doesn't exist, can't be read or belongs
+        to a synchronization of other directories, start with an
+        empty manifest, so that all items are considered changed.
+        """
+        self.entries = {}
+        try:
+            with open(self.path, encoding="UTF-8") as fobj:
+                state = json.load(fobj)
+        except (OSError, ValueError):
+            return
+        if (
+            (state.get("version") != self.VERSION)
+            or (state.get("source") != source_dir)
+            or (state.get("target") != target_dir)
+        ):
+            return
+        self.entries = state["entries"]
+
+    def save(self, source_dir, target_dir):
+        """
+        Write the manifest for the synchronization of `source_dir` to
+        `target_dir`.
+
+        The manifest is written to a temporary file which then
+        replaces the manifest file, so an interrupted write never
+        leaves a corrupt manifest.
+        """
+        state = {
+            "version": self.VERSION,
+            "source": source_dir,
+            "target": target_dir,
+            "entries": self.entries,
+        }
+        manifest_dir, manifest_name = os.path.split(self.path)
+        fd, temp_path = tempfile.mkstemp(
+            dir=manifest_dir, prefix=self._temp_file_prefix(manifest_name)
+        )
+        try:
+            with open(fd, "w", encoding="UTF-8") as fobj:
+                json.dump(state, fobj, indent=1, sort_keys=True)
+                fobj.flush()
+                os.fsync(fobj.fileno())
+            os.replace(temp_path, self.path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+    @staticmethod
+    def _temp_file_prefix(manifest_name):
+        """
+        Return the name prefix of temporary files for the manifest
+        file name `manifest_name`.
+        """
+        return ".{}-".format(manifest_name)
+
+    def _is_manifest_file(self, path):
+        """
+        Return `True` if the local `path` is the manifest file or one
+        of its temporary files, else `False`.
+        """
+        dir_path, name = os.path.split(os.path.abspath(path))
+        manifest_dir, manifest_name = os.path.split(self.path)
+        return (dir_path == manifest_dir) and (
+            (name == manifest_name)
+            or name.startswith(self._temp_file_prefix(manifest_name))
+        )
+
+    def file_hash(self, path):
+        """
+        Return the hex digest of the content of the local file `path`
+        or `None` if the manifest doesn't use hashes.
+        """
+        if self.hash_name is None:
+            return None
+        return ftputil.file_transfer.local_checksum(path, self.hash_name)
+
+    def scan(self, source_dir):
+        """
+        Return a dictionary of the items under the local directory
+        `source_dir`, in the format of `entries` but without hashes.
+
+        The tree is scanned with `os.scandir`, which needs only a
+        single `stat` call per file on most platforms.
+        """
+        items = {}
+        # Directories still to scan, as tuples of the absolute path and
+        # the relative path
+        unscanned_dirs = [(source_dir, "")]
+        while unscanned_dirs:
+            dir_path, relative_dir_path = unscanned_dirs.pop()
+            with os.scandir(dir_path) as dir_entries:
+                for dir_entry in dir_entries:
+                    # Don't synchronize the manifest itself.
+                    if self._is_manifest_file(dir_entry.path):
+                        continue
+                    relative_path = relative_dir_path + dir_entry.name
+                    if dir_entry.is_dir(follow_symlinks=False):
+                        items[relative_path] = {"type": "dir"}
+                        unscanned_dirs.append((dir_entry.path, relative_path + "/"))
+                    elif dir_entry.is_file():
+                        stat_result = dir_entry.stat()
+                        items[relative_path] = {
+                            "type": "file",
+                            "size": stat_result.st_size,
+                            "mtime": stat_result.st_mtime,
+                        }
+        return items
+
+    def is_unchanged(self, relative_path, item, source_path):
+        """
+        Return `True` if the scanned `item` for `relative_path` is the
+        same as the item in the manifest, else `False`.
+
+        If the manifest uses hashes and only the modification time of
+        a file changed, compare the hash of the file `source_path`.
+        In this case, `item` gets the hash of the file.
+        """
+        entry = self.entries.get(relative_path)
+        if (entry is None) or (entry["type"] != item["type"]):
+            return False
+        if item["type"] == "dir":
+            return True
+        if entry["size"] != item["size"]:
+            return False
+        if entry["mtime"] == item["mtime"]:
+            return True
+        if entry.get("hash") is None:
+            return False
+        item["hash"] = self.file_hash(source_path)
+        return item["hash"] == entry["hash"]
+
+
 class Syncer:
     """
     Control synchronization between combinations of local and remote
     directories and files.
     """
 
-    def __init__(self, source, target):
+    def __init__(
+        self,
+        source,
+        target,
+        *,
+        conditional=False,
+        compare="mtime",
+        checksum_algorithm="sha256",
+        delete=False,
+        preserve_mtime=False,
+        manifest=None,
+        workers=1,
+        fxp=True,
+        chunk_size=CHUNK_SIZE,
+        rate_limit=None,
+    ):
         """
         Init the `FTPSyncer` instance.
 
@@ -69,47 +266,363 @@ class Syncer:
         in. The semantics is so that the items under the source
         directory will show up under the target directory after the
         synchronization (unless there's an error).
+
+        If `conditional` is true, only copy files which are missing on
+        the target or whose size or modification time differs from
+        the source file. The check considers the precision of the
+        timestamps and copies a file "if in doubt". So if the source
+        timestamps are less precise than the target timestamps, for
+        example only to the minute or day for a remote source, files
+        whose modification time was preserved (see `preserve_mtime`)
+        are copied again. Use `compare="checksum"` in this case.
+
+        `compare` determines how `conditional` decides whether files
+        of the same size differ. With "mtime", the modification times
+        are compared. With "checksum", the checksums of the files are
+        compared, using the algorithm `checksum_algorithm` (see
+        `FTPHost.checksum`). This is more reliable, but requires that
+        remote servers support calculating checksums. If they don't,
+        the syncer falls back to comparing modification times.
+
+        If `delete` is true, remove files and directories on the
+        target which don't exist on the source.
+
+        If `preserve_mtime` is true, set the modification time of
+        copied target files to that of the source file. For a remote
+        target, this requires that the server supports the `MFMT` or
+        `SITE UTIME` command (see `FTPHost.utime`). If it doesn't, the
+        modification times aren't preserved. Preserving modification
+        times makes conditional copies more reliable since copied
+        files don't look newer than the source.
+
+        `manifest` is the path of a local state file or a `Manifest`
+        object. If given, the source must be a `LocalHost`. The
+        manifest records the state of the source tree after each
+        synchronization. The next synchronization compares the source
+        tree with the manifest and only touches the target for items
+        which changed since then. Note that changes made directly on
+        the target aren't noticed in this mode.
+
+        `workers` is the number of threads which create directories
+        and copy files in parallel. Each thread uses its own
+        connection to remote hosts. With more than one worker, the
+        source tree is walked in the calling thread while the workers
+        already process the directories and files found so far.
+
+        If `fxp` is true and both the source and the target are
+        `FTPHost`s, copy files directly between the servers (see
+        `FTPHost.copy_to`). If the servers refuse this for a file,
+        fall back to copying the file via the client. Since a rate limit can't be
+        applied to server-to-server transfers, they're only used
+        without a rate limit.
+
+        `chunk_size` is the maximum size of the chunks in bytes for
+        copying files. If it's "auto", the chunk size adapts to the
+        throughput.
+
+        `rate_limit` limits the throughput of the whole
+        synchronization. It's either the maximum rate in bytes per
+        second or a `ftputil.rate_limit.RateLimiter`, which may be
+        shared with other transfers. Host-wide limits of `FTPHost`
+        objects (see `FTPHost.rate_limit`) apply in addition.
         """
         self._source = source
         self._target = target
+        self._conditional = conditional
+        if compare not in ("mtime", "checksum"):
+            raise ValueError(
+                "compare must be 'mtime' or 'checksum', not {!r}".format(compare)
+            )
+        self._compare = compare
+        if checksum_algorithm not in ftputil.file_transfer.CHECKSUM_ALGORITHMS:
+            raise ValueError(
+                "unsupported checksum algorithm {!r}".format(checksum_algorithm)
+            )
+        self._checksum_algorithm = checksum_algorithm
+        self._delete = delete
+        self._preserve_mtime = preserve_mtime
+        if (manifest is not None) and (not isinstance(manifest, Manifest)):
+            manifest = Manifest(manifest)
+        if (manifest is not None) and (not isinstance(source, LocalHost)):
+            raise ValueError("a manifest can only be used with a local source")
+        self._manifest = manifest
+        if workers < 1:
+            raise ValueError("workers must be at least 1, not {!r}".format(workers))
+        self._workers = workers
+        self._chunk_size = chunk_size
+        # Limiter for the whole synchronization. The host-wide limits
+        # are added for each transfer, see `_transfer_rate_limiter`.
+        self._rate_limiter = ftputil.rate_limit.rate_limiter(rate_limit)
+        self._use_fxp = (
+            fxp and isinstance(source, FTPHost) and isinstance(target, FTPHost)
+        )
 
-    def _mkdir(self, target_dir):
+    def _mkdir(self, target_dir, target_host=None):
         """
         Try to create the target directory `target_dir`. If it already
         exists, don't do anything. If the directory is present but
         it's actually a file, raise a `SyncError`.
+
+        Use `target_host` instead of the target host of the syncer if
+        it's given. Return `True` if the directory was created, else
+        `False`.
         """
         # TODO: Handle setting of target mtime according to source mtime
         # (beware of rootdir anomalies; try to handle them as well).
         # print("Making", target_dir)
-        if self._target.path.isfile(target_dir):
+        target_host = target_host or self._target
+        if target_host.path.isfile(target_dir):
             raise ftputil.error.SyncError(
                 "target dir '{}' is actually a file".format(target_dir)
             )
         # Deliberately use an `isdir` test instead of `try/except`. The
         #  latter approach might mask other errors we want to see, e. g.
         #  insufficient permissions.
-        if not self._target.path.isdir(target_dir):
-            self._target.mkdir(target_dir)
+        if not target_host.path.isdir(target_dir):
+            target_host.mkdir(target_dir)
+            return True
+        return False
 
-    def _sync_file(self, source_file, target_file):
+    @staticmethod
+    def _mtime_precision(stat_result):
+        """
+        Return the precision of the modification time in `stat_result`
+        in seconds.
+        """
+        # Only `FTPHost` stat results have a `_st_mtime_precision`
+        # attribute. Like in `file_transfer.LocalFile`, assume local
+        # timestamps are precise up to a second.
+        return getattr(stat_result, "_st_mtime_precision", 1.0)
+
+    def _is_up_to_date(self, source_stat, target_stat):
+        """
+        Return `True` if the target file with the stat result
+        `target_stat` has the same size as the source file with the
+        stat result `source_stat` and isn't older than the source
+        file. Otherwise return `False`.
+
+        As in `file_transfer.source_is_newer_than_target`, consider
+        the precision of the timestamps and return `False` if in
+        doubt.
+        """
+        if source_stat.st_size != target_stat.st_size:
+            return False
+        source_precision = self._mtime_precision(source_stat)
+        target_precision = self._mtime_precision(target_stat)
+        if ftputil.stat.UNKNOWN_PRECISION in (source_precision, target_precision):
+            return False
+        # The actual mtimes may be up to the precision later than the
+        # reported mtimes (which are truncated). The target is only up
+        # to date if the latest possible source mtime isn't later than
+        # the latest possible target mtime.
+        return (
+            source_stat.st_mtime + source_precision
+            <= target_stat.st_mtime + target_precision
+        )
+
+    def _checksum(self, host, path):
+        """
+        Return the checksum of the file `path` on `host`.
+        """
+        if isinstance(host, LocalHost):
+            return ftputil.file_transfer.local_checksum(path, self._checksum_algorithm)
+        return host.checksum(path, self._checksum_algorithm)
+
+    def _checksums_match(self, source_host, target_host, source_file, target_file):
+        """
+        Return `True` if the checksums of the source and the target
+        file are the same, else `False`. If a server can't calculate
+        checksums, return `None`.
+        """
+        # `FTPHost.checksum` remembers commands which the server
+        # doesn't implement, so a failing check is cheap.
+        try:
+            return self._checksum(source_host, source_file) == self._checksum(
+                target_host, target_file
+            )
+        except ftputil.error.CommandNotImplementedError:
+            return None
+
+    def _is_same_file(
+        self,
+        source_host,
+        target_host,
+        source_file,
+        target_file,
+        source_stat,
+        target_stat,
+        compare,
+    ):
+        """
+        Return `True` if the target file is up to date with the source
+        file, else `False`.
+
+        Depending on `compare` ("mtime" or "checksum", see the
+        constructor), compare the checksums of files with the same
+        size or use `_is_up_to_date`. If a server can't calculate
+        checksums, use `_is_up_to_date`, too.
+        """
+        if (compare == "checksum") and (source_stat.st_size == target_stat.st_size):
+            checksums_match = self._checksums_match(
+                source_host, target_host, source_file, target_file
+            )
+            if checksums_match is not None:
+                return checksums_match
+        return self._is_up_to_date(source_stat, target_stat)
+
+    def _target_is_up_to_date(self, source_file, target_file):
+        """
+        Return `True` if the target file exists and is up to date with
+        the source file (see `_is_same_file`), else `False`.
+        """
+        if not self._target.path.isfile(target_file):
+            return False
+        return self._is_same_file(
+            self._source,
+            self._target,
+            source_file,
+            target_file,
+            self._source.stat(source_file),
+            self._target.stat(target_file),
+            self._compare,
+        )
+
+    def _set_target_mtime(self, target_host, target_file, mtime):
+        """
+        Set the modification time of `target_file` on `target_host`
+        to `mtime`, if the host supports it.
+        """
+        # `FTPHost.utime` remembers if the server can't set
+        # modification times and then fails without sending commands.
+        try:
+            target_host.utime(target_file, (mtime, mtime))
+        except ftputil.error.CommandNotImplementedError:
+            pass
+
+    def _transfer_rate_limiter(self):
+        """
+        Return the combined rate limiter of the syncer and the source
+        and target hosts, or `None` if there's no limit.
+
+        The host-wide limits are read for each transfer, so that a
+        changed `rate_limit` of a host is used for the next transfer.
+        The worker hosts share the limiters of these hosts.
+        """
+        # `LocalHost`s don't have a `rate_limit` attribute.
+        return ftputil.rate_limit.combined_rate_limiter(
+            self._rate_limiter,
+            getattr(self._source, "rate_limit", None),
+            getattr(self._target, "rate_limit", None),
+        )
+
+    def _copy_file_with_fxp(self, source_host, target_host, source_file, target_file):
+        """
+        Try to copy `source_file` on `source_host` to `target_file` on
+        `target_host` directly between the servers.
+
+        Return `True` if the file was copied. If the servers refuse
+        the server-to-server transfer or the data connection between
+        them fails, return `False`.
+        """
+        try:
+            source_host.copy_to(target_host, source_file, target_file)
+        except ftputil.error.CommandNotImplementedError:
+            return False
+        return True
+
+    def _copy_file(
+        self,
+        source_host,
+        target_host,
+        source_file,
+        target_file,
+        use_fxp,
+        preserve_mtime,
+        source_stat=None,
+    ):
+        """
+        Copy `source_file` on `source_host` to `target_file` on
+        `target_host`.
+
+        If `use_fxp` is true, try a server-to-server transfer first.
+        If the servers refuse it, copy the file via the client. This
+        is decided for each file.
+
+        If `preserve_mtime` is true, take the modification time from
+        `source_stat` or, if that's `None`, from a `stat` call.
+        """
         # XXX: This duplicates code from `FTPHost._copyfileobj`. Maybe
         # implement the upload and download methods in terms of
         # `_sync_file`, or maybe not?
         # TODO: Handle `IOError`s
-        # TODO: Handle conditional copy
-        # TODO: Handle setting of target mtime according to source mtime
-        # (beware of rootdir anomalies; try to handle them as well).
-        # print("Syncing", source_file, "->", target_file)
-        source = self._source.open(source_file, "rb")
-        try:
-            target = self._target.open(target_file, "wb")
+        rate_limiter = self._transfer_rate_limiter()
+        # A rate limit can't be applied to server-to-server transfers.
+        if not (
+            use_fxp
+            and (rate_limiter is None)
+            and self._copy_file_with_fxp(
+                source_host, target_host, source_file, target_file
+            )
+        ):
+            source = source_host.open(source_file, "rb")
             try:
-                shutil.copyfileobj(source, target, length=CHUNK_SIZE)
+                target = target_host.open(target_file, "wb")
+                try:
+                    ftputil.file_transfer.copyfileobj(
+                        source, target, self._chunk_size, rate_limit=rate_limiter
+                    )
+                finally:
+                    target.close()
             finally:
-                target.close()
-        finally:
-            source.close()
+                source.close()
+        if preserve_mtime:
+            if source_stat is None:
+                source_stat = source_host.stat(source_file)
+            self._set_target_mtime(target_host, target_file, source_stat.st_mtime)
+
+    def _sync_file(self, source_file, target_file):
+        """
+        Copy the file `source_file` to `target_file`.
+
+        If the syncer was created with `conditional=True` and the
+        target file is up to date, don't copy the file. Return `True`
+        if the file was copied, else `False`.
+        """
+        if self._conditional and self._target_is_up_to_date(source_file, target_file):
+            return False
+        self._copy_file(
+            self._source,
+            self._target,
+            source_file,
+            target_file,
+            self._use_fxp,
+            self._preserve_mtime,
+        )
+        return True
+
+    def _delete_extraneous_items(self, source_names, target_dir, target_host=None):
+        """
+        Remove the files and directories in `target_dir` whose names
+        aren't in `source_names`. Use `target_host` instead of the
+        target host of the syncer if it's given.
+
+        Return the names of the remaining items in `target_dir`.
+        """
+        target_host = target_host or self._target
+        source_names = set(source_names)
+        remaining_names = []
+        for name in target_host.listdir(target_dir):
+            if name in source_names:
+                remaining_names.append(name)
+                continue
+            target_path = target_host.path.join(target_dir, name)
+            if target_host.path.isdir(target_path) and not target_host.path.islink(
+                target_path
+            ):
+                target_host.rmtree(target_path)
+            else:
+                target_host.remove(target_path)
+        return remaining_names
 
     def _fix_sep_for_target(self, path):
         """
@@ -124,15 +637,16 @@ class Syncer:
         updating the target to match the source as far as possible.
 
         Current limitations:
-        - _don't_ delete items which are on the target path but not on the
-          source path
-        - files are always copied, the modification timestamps are not
-          compared
+        - modification times of directories aren't preserved
         - all files are copied in binary mode, never in ASCII/text mode
         - incomplete error handling
         """
         self._mkdir(target_dir)
         for dirpath, dir_names, file_names in self._source.walk(source_dir):
+            if self._delete:
+                target_dirpath = dirpath.replace(source_dir, target_dir, 1)
+                target_dirpath = self._fix_sep_for_target(target_dirpath)
+                self._delete_extraneous_items(dir_names + file_names, target_dirpath)
             for dir_name in dir_names:
                 inner_source_dir = self._source.path.join(dirpath, dir_name)
                 inner_target_dir = inner_source_dir.replace(source_dir, target_dir, 1)
@@ -144,6 +658,290 @@ class Syncer:
                 target_file = self._fix_sep_for_target(target_file)
                 self._sync_file(source_file, target_file)
 
+    # Maximum number of submitted, but unfinished tasks per worker. This
+    # keeps the walk of the source tree from running too far ahead of the
+    # workers.
+    _PENDING_TASKS_PER_WORKER = 4
+
+    def _sync_dir_task(self, target_pool, parent_future, target_dir, source_names):
+        """
+        Create the directory `target_dir` on the target after the
+        parent directory has been handled (see `parent_future`). With
+        `delete=True`, remove items in `target_dir` which aren't in
+        `source_names`.
+
+        If needed for conditional copying, return a dictionary which
+        maps the names of the items in the target directory to their
+        stat results. Otherwise return `None`.
+        """
+        if parent_future is not None:
+            parent_future.result()
+        with target_pool.host() as target_host:
+            if self._mkdir(target_dir, target_host):
+                # The new directory is empty.
+                return {}
+            if self._delete:
+                names = self._delete_extraneous_items(
+                    source_names, target_dir, target_host
+                )
+            elif self._conditional:
+                names = target_host.listdir(target_dir)
+            else:
+                return None
+            if not self._conditional:
+                return None
+            # For remote hosts, the `listdir` call above has put the stat
+            # results into the stat cache, so this doesn't cause more
+            # network traffic.
+            return {
+                name: target_host.lstat(target_host.path.join(target_dir, name))
+                for name in names
+            }
+
+    def _sync_file_task(
+        self,
+        source_pool,
+        target_pool,
+        dir_future,
+        source_file,
+        target_file,
+        source_stat,
+        compare,
+        use_fxp,
+        preserve_mtime,
+    ):
+        """
+        Copy `source_file` to `target_file` after the target directory
+        has been handled (see `dir_future`). With `conditional=True`,
+        don't copy the file if the target is up to date.
+
+        `compare`, `use_fxp` and `preserve_mtime` are the settings of
+        the syncer. They're passed explicitly, so that the worker
+        threads don't access the shared state of the syncer.
+
+        Return `True` if the file was copied, else `False`.
+        """
+        target_stats = dir_future.result()
+        with source_pool.host() as source_host, target_pool.host() as target_host:
+            if self._conditional:
+                target_name = self._target.path.split(target_file)[1]
+                target_stat = target_stats.get(target_name)
+                if (
+                    (target_stat is not None)
+                    and stat.S_ISREG(target_stat.st_mode)
+                    and self._is_same_file(
+                        source_host,
+                        target_host,
+                        source_file,
+                        target_file,
+                        source_stat,
+                        target_stat,
+                        compare,
+                    )
+                ):
+                    return False
+            self._copy_file(
+                source_host,
+                target_host,
+                source_file,
+                target_file,
+                use_fxp,
+                preserve_mtime,
+                source_stat,
+            )
+        return True
+
+    def _sync_tree_in_parallel(self, source_dir, target_dir):
+        """
+        Synchronize the source and the target directory tree with
+        several worker threads.
+
+        The synchronization is a pipeline:
+
+        - The calling thread walks the source tree (source scan) and
+          submits a task for each directory and each file.
+
+        - A directory task waits for the task of the parent directory,
+          creates the target directory if necessary and, for
+          conditional copying or deletion, lists the target directory
+          (target scan).
+
+        - A file task waits for the task of its directory, compares
+          the source and target file (diff) and copies the file if
+          necessary.
+
+        Since the tasks are started in the order they were submitted,
+        a task only waits for tasks which already run or are done, so
+        waiting can't block all workers.
+        """
+        self._mkdir(target_dir)
+        compare = self._compare
+        use_fxp = self._use_fxp
+        preserve_mtime = self._preserve_mtime
+        pending_tasks = threading.BoundedSemaphore(
+            self._workers * self._PENDING_TASKS_PER_WORKER
+        )
+        errors = []
+        # Futures of the tasks which aren't done yet
+        unfinished_futures = set()
+
+        def task_done(future):
+            unfinished_futures.discard(future)
+            if (not future.cancelled()) and (future.exception() is not None):
+                errors.append(future.exception())
+            pending_tasks.release()
+
+        with ftputil.session_pool.HostPool(
+            self._source, self._workers
+        ) as source_pool, ftputil.session_pool.HostPool(
+            self._target, self._workers
+        ) as target_pool:
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=self._workers)
+
+            def submit(function, *args):
+                pending_tasks.acquire()
+                future = executor.submit(function, *args)
+                unfinished_futures.add(future)
+                future.add_done_callback(task_done)
+                return future
+
+            # Cancel the remaining tasks if the walk fails.
+            cancel_remaining_tasks = True
+            try:
+                # Map source directories to the futures of their parent
+                # directories
+                parent_futures = {source_dir: None}
+                for dirpath, dir_names, file_names in self._source.walk(source_dir):
+                    if errors:
+                        break
+                    target_dirpath = dirpath.replace(source_dir, target_dir, 1)
+                    target_dirpath = self._fix_sep_for_target(target_dirpath)
+                    dir_future = submit(
+                        self._sync_dir_task,
+                        target_pool,
+                        parent_futures.pop(dirpath, None),
+                        target_dirpath,
+                        dir_names + file_names,
+                    )
+                    for dir_name in dir_names:
+                        inner_source_dir = self._source.path.join(dirpath, dir_name)
+                        parent_futures[inner_source_dir] = dir_future
+                    for file_name in file_names:
+                        source_file = self._source.path.join(dirpath, file_name)
+                        target_file = source_file.replace(source_dir, target_dir, 1)
+                        target_file = self._fix_sep_for_target(target_file)
+                        # The walk has already listed the directory, so
+                        # for remote hosts the stat result is cached.
+                        if self._conditional or preserve_mtime:
+                            source_stat = self._source.stat(source_file)
+                        else:
+                            source_stat = None
+                        submit(
+                            self._sync_file_task,
+                            source_pool,
+                            target_pool,
+                            dir_future,
+                            source_file,
+                            target_file,
+                            source_stat,
+                            compare,
+                            use_fxp,
+                            preserve_mtime,
+                        )
+                cancel_remaining_tasks = bool(errors)
+            finally:
+                # `Executor.shutdown` only has a `cancel_futures`
+                # argument since Python 3.9.
+                if cancel_remaining_tasks:
+                    for future in list(unfinished_futures):
+                        future.cancel()
+                executor.shutdown(wait=True)
+        if errors:
+            raise errors[0]
+
+    def _delete_with_manifest(self, deleted_paths, target_dir):
+        """
+        Remove the items in `deleted_paths` (paths relative to
+        `target_dir`, using "/" as separator) from the target.
+
+        Directories are removed with their contents, so items below
+        deleted directories are skipped. Items which are already
+        missing on the target are ignored.
+        """
+        deleted_dirs = []
+        for relative_path in sorted(deleted_paths):
+            if any(relative_path.startswith(dir_ + "/") for dir_ in deleted_dirs):
+                continue
+            target_path = self._target_path(target_dir, relative_path)
+            try:
+                if self._manifest.entries[relative_path]["type"] == "dir":
+                    deleted_dirs.append(relative_path)
+                    self._target.rmtree(target_path)
+                else:
+                    self._target.remove(target_path)
+            except OSError:
+                if self._target.path.exists(target_path):
+                    raise
+        for relative_path in deleted_paths:
+            del self._manifest.entries[relative_path]
+
+    def _target_path(self, target_dir, relative_path):
+        """
+        Return the target path for the path `relative_path` (relative
+        to `target_dir`, using "/" as separator).
+        """
+        return self._target.path.join(target_dir, *relative_path.split("/"))
+
+    def _sync_tree_with_manifest(self, source_dir, target_dir):
+        """
+        Synchronize the source and the target directory tree, using
+        the manifest to find out which items changed since the last
+        synchronization.
+
+        Only changed items are stat'ed, copied or deleted on the
+        target. The manifest is saved even if the synchronization
+        fails, so that items synchronized so far aren't synchronized
+        again.
+        """
+        manifest = self._manifest
+        manifest.load(source_dir, target_dir)
+        items = manifest.scan(source_dir)
+        try:
+            # Delete items first, in case a file was replaced by a
+            # directory of the same name or vice versa.
+            deleted_paths = [
+                relative_path
+                for relative_path, entry in manifest.entries.items()
+                if (relative_path not in items)
+                or (items[relative_path]["type"] != entry["type"])
+            ]
+            if self._delete:
+                self._delete_with_manifest(deleted_paths, target_dir)
+            else:
+                for relative_path in deleted_paths:
+                    del manifest.entries[relative_path]
+            self._mkdir(target_dir)
+            # Sorting makes sure that directories are created before
+            # the items in them.
+            for relative_path in sorted(items):
+                item = items[relative_path]
+                source_path = os.path.join(source_dir, *relative_path.split("/"))
+                if manifest.is_unchanged(relative_path, item, source_path):
+                    # The content may be unchanged although the mtime
+                    # changed. Remember the new mtime.
+                    manifest.entries[relative_path].update(item)
+                    continue
+                target_path = self._target_path(target_dir, relative_path)
+                if item["type"] == "dir":
+                    self._mkdir(target_path)
+                else:
+                    self._sync_file(source_path, target_path)
+                    if manifest.hash_name is not None and ("hash" not in item):
+                        item["hash"] = manifest.file_hash(source_path)
+                manifest.entries[relative_path] = item
+        finally:
+            manifest.save(source_dir, target_dir)
+
     def sync(self, source_path, target_path):
         """
         Synchronize `source_path` and `target_path` (both are strings,
@@ -157,5 +955,9 @@ class Syncer:
         target_path = self._target.path.abspath(target_path)
         if self._source.path.isfile(source_path):
             self._sync_file(source_path, target_path)
+        elif self._manifest is not None:
+            self._sync_tree_with_manifest(source_path, target_path)
+        elif self._workers > 1:
+            self._sync_tree_in_parallel(source_path, target_path)
         else:
             self._sync_tree(source_path, target_path)
@@ -0,0 +1,91 @@
+#! /usr/bin/env python
+# Copyright (C) 2020, Stefan Schwarzer <sschwarzer@sschwarzer.net>
+# and ftputil contributors (see `doc/contributors.txt`)
+# See the file LICENSE for licensing terms.
+
+"""
+Compare `FTPHost.walk` over FTPS with and without reusing the TLS
+session of the command channel for the data connections.
+
+Usage:
+
+  python tls_session_benchmark.py host user password [directory]
+
+Each directory listing needs a data connection. Without TLS session
+reuse, each data connection needs a full TLS handshake.
+"""
+
+import ftplib
+import sys
+import time
+
+import ftputil
+import ftputil.session
+
+
+def timed_session_factory(reuse_tls_session, statistics):
+    """
+    Return a session factory for FTPS which records the number of data
+    connections, the number of reused TLS sessions and the time spent in
+    `ntransfercmd` (connection setup including the TLS handshake) in the
+    dictionary `statistics`.
+    """
+    base_factory = ftputil.session.session_factory(
+        base_class=ftplib.FTP_TLS,
+        encrypt_data_channel=True,
+        reuse_tls_session=reuse_tls_session,
+    )
+
+    class Session(base_factory):
+        def ntransfercmd(self, cmd, rest=None):
+            start_time = time.perf_counter()
+            conn, size = super().ntransfercmd(cmd, rest)
+            statistics["setup_time"] += time.perf_counter() - start_time
+            statistics["connections"] += 1
+            statistics["reused"] += bool(getattr(conn, "session_reused", False))
+            return conn, size
+
+    return Session
+
+
+def walk(host, user, password, directory, reuse_tls_session):
+    """Walk `directory` and print statistics."""
+    statistics = {"connections": 0, "reused": 0, "setup_time": 0.0}
+    factory = timed_session_factory(reuse_tls_session, statistics)
+    with ftputil.FTPHost(host, user, password, session_factory=factory) as ftp_host:
+        ftp_host.stat_cache.disable()
+        start_time = time.perf_counter()
+        dir_count = sum(1 for _ in ftp_host.walk(directory))
+        total_time = time.perf_counter() - start_time
+    connections = statistics["connections"]
+    print(
+        "reuse_tls_session={!s:5}: {} directories, {} data connections "
+        "({} with reused TLS session)".format(
+            reuse_tls_session, dir_count, connections, statistics["reused"]
+        )
+    )
+    print(
+        "  walk: {:8.3f} s, data connection setup: {:8.3f} s "
+        "({:6.1f} ms per connection)".format(
+            total_time,
+            statistics["setup_time"],
+            1000.0 * statistics["setup_time"] / max(connections, 1),
+        )
+    )
+
+
+def main(host, user, password, directory="."):
+    for reuse_tls_session in [False, True]:
+        try:
+            walk(host, user, password, directory, reuse_tls_session)
+        except ftputil.error.FTPError as exc:
+            # Servers which require TLS session reuse refuse the data
+            # connections without it.
+            print("reuse_tls_session={!s:5}: failed: {}".format(reuse_tls_session, exc))
+
+
+if __name__ == "__main__":
+    if not 4 <= len(sys.argv) <= 5:
+        print(__doc__.strip())
+        sys.exit(1)
+    main(*sys.argv[1:])
@@ -2,10 +2,12 @@
 # and ftputil contributors (see `doc/contributors.txt`)
 # See the file LICENSE for licensing terms.
 
+import collections
+import socket
 import unittest.mock
 
 
-__all__ = ["Call", "factory"]
+__all__ = ["Call", "factory", "SimulatedNetwork"]
 
 
 class Call:
@@ -81,6 +83,82 @@ class Call:
             return self.result
 
 
+class SimulatedNetwork:
+    """
+    Account for the FTP commands that scripted sessions send "over the
+    network".
+
+    Each `ftplib.FTP` method call on a `ScriptedSession` is mapped to the
+    FTP command(s) it would send, for example `cwd` to `CWD` or
+    `transfercmd("RETR file")` to `RETR`. Every command counts as one
+    round trip and adds a virtual cost (in seconds) to `elapsed`. By
+    default, each command costs `latency`, but costs for individual
+    commands can be set with `command_costs`, for example
+
+      network = SimulatedNetwork(latency=0.05,
+                                 command_costs={"LIST": 0.2, "RETR": 0.5})
+
+    No real time passes; `elapsed` only sums up the virtual costs. This
+    makes it possible to check in tests how many round trips an
+    operation needs and how long it would take over a slow connection.
+    """
+
+    # Map `ftplib.FTP` method names to the FTP commands they send. Methods
+    # that send a command given in their first argument (`voidcmd`,
+    # `transfercmd` etc.) are handled in `commands_for_call`. Methods which
+    # don't appear here (for example `voidresp`, which only reads a reply)
+    # don't cause any network traffic of their own.
+    _method_to_commands = {
+        "__init__": ("CONNECT",),
+        "close": ("QUIT",),
+        "cwd": ("CWD",),
+        "delete": ("DELE",),
+        "dir": ("LIST",),
+        "mkd": ("MKD",),
+        "pwd": ("PWD",),
+        "rename": ("RNFR", "RNTO"),
+        "rmd": ("RMD",),
+    }
+
+    _methods_with_command_argument = frozenset(
+        ["ntransfercmd", "sendcmd", "transfercmd", "voidcmd"]
+    )
+
+    def __init__(self, latency=0.05, command_costs=None):
+        self.latency = latency
+        self.command_costs = command_costs or {}
+        self.reset()
+
+    def reset(self):
+        """Forget all recorded commands."""
+        self.round_trips = collections.Counter()
+        self.elapsed = 0.0
+
+    def commands_for_call(self, method_name, args):
+        """
+        Return a tuple of the FTP commands the call of `method_name` with
+        the positional arguments `args` would send.
+        """
+        if method_name in self._methods_with_command_argument:
+            # For example, "SITE CHMOD 0755 file" results in "SITE".
+            return (args[0].split()[0].upper(),)
+        return self._method_to_commands.get(method_name, ())
+
+    def record(self, method_name, args):
+        """
+        Record the FTP commands for the call of `method_name` with the
+        positional arguments `args`.
+        """
+        for command in self.commands_for_call(method_name, args or ()):
+            self.round_trips[command] += 1
+            self.elapsed += self.command_costs.get(command, self.latency)
+
+    @property
+    def total_round_trips(self):
+        """Return the number of all recorded round trips."""
+        return sum(self.round_trips.values())
+
+
 class ScriptedSession:
     """
     "Scripted" `ftplib.FTP`-like class for testing.
@@ -110,12 +188,17 @@ class ScriptedSession:
     # to distinguish numbers like 1, 2, etc. than hexadecimal ids.
     _session_count = 0
 
+    # Like `ftplib.FTP`
+    trust_server_pasv_ipv4_address = False
+
     @classmethod
     def reset_session_count(cls):
         cls._session_count = 0
 
-    def __init__(self, script):
+    def __init__(self, script, network=None):
         self.script = script
+        # Optional `SimulatedNetwork` to account for the "sent" commands
+        self._network = network
         # `File.close` accesses the session `sock` object to set and reset the
         # timeout. `sock` itself is never _called_ though, so it doesn't make
         # sense to create a `sock` _call_.
@@ -126,6 +209,7 @@ class ScriptedSession:
         self._session_count = self.__class__._session_count
         # Always expect an entry for the constructor.
         init_call = self._next_script_call("__init__")
+        self._record_call("__init__")
         # The constructor isn't supposed to return anything. The only
         # reason to call it here is to raise an exception if that was
         # specified in the `script`.
@@ -134,6 +218,14 @@ class ScriptedSession:
     def __str__(self):
         return "{} {}".format(self.__class__.__name__, self._session_count)
 
+    def _record_call(self, method_name, args=None):
+        """
+        Record the call of `method_name` with `args` in the simulated
+        network, if there is one.
+        """
+        if self._network is not None:
+            self._network.record(method_name, args)
+
     def _next_script_call(self, requested_attribute):
         """
         Return next `Call` object.
@@ -154,6 +246,7 @@ class ScriptedSession:
         def dummy_method(*args, **kwargs):
             print(self, "(in `__getattr__`)")
             script_call.check_call(attribute_name, args, kwargs)
+            self._record_call(attribute_name, args)
             return script_call()
 
         return dummy_method
@@ -171,6 +264,7 @@ class ScriptedSession:
         # Check only the path. This requires that the corresponding `Call`
         # object also solely specifies the path as `args`.
         script_call.check_call("dir", (path,), None)
+        self._record_call("dir", (path,))
         # Give `dir` the chance to raise an exception if one was specified in
         # the `Call`'s `result` argument.
         call_result = script_call()
@@ -188,6 +282,7 @@ class ScriptedSession:
         """
         script_call = self._next_script_call("ntransfercmd")
         script_call.check_call("ntransfercmd", (cmd, rest), None)
+        self._record_call("ntransfercmd", (cmd, rest))
         # Give `ntransfercmd` the chance to raise an exception if one was
         # specified in the `Call`'s `result` argument.
         call_result = script_call()
@@ -205,12 +300,20 @@ class ScriptedSession:
         `transfercmd` returns a socket. The `result` value given when
         constructing an `transfercmd` call specifies an `io.TextIO` or
         `io.BytesIO` value to be used as the `Socket.makefile` result.
+
+        If the `result` value is a `socket.socket` (for example one end
+        of a `socket.socketpair`), it's returned as the data connection
+        as-is. This is useful to test code that works on the data socket
+        directly.
         """
         script_call = self._next_script_call("transfercmd")
         script_call.check_call("transfercmd", (cmd, rest), None)
+        self._record_call("transfercmd", (cmd, rest))
         # Give `transfercmd` the chance to raise an exception if one was
         # specified in the `Call`'s `result` argument.
         call_result = script_call()
+        if isinstance(call_result, socket.socket):
+            return call_result
         mock_socket = unittest.mock.Mock(name="socket")
         mock_socket.makefile.return_value = call_result
         return mock_socket
@@ -231,12 +334,25 @@ class MultisessionFactory:
     described by the script `script1`. When the `session_factory` is
     "instantiated" a second time, the factory object will use the
     behavior described by the script `script2`.
+
+    If a `SimulatedNetwork` is passed as `network`, all sessions created
+    by the factory record the FTP commands they would send in it. For
+    example,
+
+      network = scripted_session.SimulatedNetwork(latency=0.05)
+      factory = scripted_session.factory(script1, script2, network=network)
+      ...
+      assert network.round_trips["CWD"] == 3
+
+    The network is also available as the `network` attribute of the
+    factory.
     """
 
-    def __init__(self, *scripts):
+    def __init__(self, *scripts, network=None):
         ScriptedSession.reset_session_count()
         self._scripts = iter(scripts)
         self.scripted_sessions = []
+        self.network = network
 
     def __call__(self, host, user, password):
         """
@@ -246,7 +362,7 @@ class MultisessionFactory:
         `ftplib.FTP` in a real application).
         """
         script = next(self._scripts)
-        scripted_session = ScriptedSession(script)
+        scripted_session = ScriptedSession(script, network=self.network)
         self.scripted_sessions.append(scripted_session)
         return scripted_session
 
@@ -0,0 +1,188 @@
+# Copyright (C) 2020, Stefan Schwarzer <sschwarzer@sschwarzer.net>
+# and ftputil contributors (see `doc/contributors.txt`)
+# See the file LICENSE for licensing terms.
+
+import ftplib
+
+import pytest
+
+import ftputil.error
+
+from test import test_base
+import test.scripted_session as scripted_session
+
+
+Call = scripted_session.Call
+
+
+class TestCommandBatch:
+    def test_pipelined_commands(self):
+        """
+        The commands for the paths in a directory are sent in this
+        directory before the replies are read.
+        """
+        script = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            # Check that we can change back.
+            Call("cwd", args=("/",)),
+            Call("cwd", args=("/dir",)),
+            Call("putcmd", args=("DELE file",)),
+            Call("putcmd", args=("SITE CHMOD 0644 file2",)),
+            Call("getresp", result="250 DELE command successful"),
+            Call("getresp", result="200 SITE CHMOD command successful"),
+            Call("cwd", args=("/",)),
+            Call("putcmd", args=("MKD new_dir",)),
+            # The target is in another directory.
+            Call("putcmd", args=("RNFR old",)),
+            Call("putcmd", args=("RNTO /dir/new",)),
+            Call("getresp", result='257 "/new_dir" created'),
+            Call("getresp", result="350 ready for destination name"),
+            Call("getresp", result="250 rename successful"),
+            Call("close"),
+        ]
+        with test_base.ftp_host_factory(scripted_session.factory(script)) as host:
+            with host.batch() as batch:
+                batch.remove("/dir/file")
+                batch.mkdir("new_dir")
+                batch.chmod("/dir/file2", 0o644)
+                batch.rename("old", "/dir/new")
+            results = batch.execute()
+        # Nothing left to execute
+        assert results == []
+
+    def test_window(self):
+        """Not more than `window` commands are unanswered."""
+        script = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            Call("cwd", args=("/",)),
+            Call("putcmd", args=("DELE file1",)),
+            Call("putcmd", args=("DELE file2",)),
+            Call("getresp", result="250 ok"),
+            Call("putcmd", args=("DELE file3",)),
+            Call("getresp", result="250 ok"),
+            Call("getresp", result="250 ok"),
+            Call("close"),
+        ]
+        with test_base.ftp_host_factory(scripted_session.factory(script)) as host:
+            batch = host.batch(window=2)
+            for name in ["file1", "file2", "file3"]:
+                batch.remove(name)
+            results = batch.execute()
+        assert [result.reply for result in results] == ["250 ok"] * 3
+        assert all(result.ok for result in results)
+
+    def test_errors(self):
+        """
+        Failed commands don't stop the batch and are reported in a
+        `BatchError`.
+        """
+        script = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            Call("cwd", args=("/",)),
+            Call("putcmd", args=("DELE file1",)),
+            Call("putcmd", args=("RNFR missing",)),
+            Call("putcmd", args=("RNTO new",)),
+            Call("putcmd", args=("DELE file2",)),
+            Call("getresp", result="250 ok"),
+            Call("getresp", result=ftplib.error_perm("550 no such file")),
+            Call("getresp", result=ftplib.error_perm("503 bad sequence")),
+            Call("getresp", result=ftplib.error_temp("450 file busy")),
+            Call("close"),
+        ]
+        with test_base.ftp_host_factory(scripted_session.factory(script)) as host:
+            with pytest.raises(ftputil.error.BatchError) as exc_info:
+                with host.batch() as batch:
+                    batch.remove("file1")
+                    batch.rename("missing", "new")
+                    batch.remove("file2")
+        results = exc_info.value.results
+        assert [result.operation for result in results] == [
+            "remove",
+            "rename",
+            "remove",
+        ]
+        assert results[0].ok
+        # The first error of an operation is reported.
+        assert results[1].error.errno == 550
+        assert isinstance(results[2].error, ftputil.error.TemporaryError)
+        assert exc_info.value.errors == results[1:]
+
+    def test_whitespace_in_directory(self):
+        """
+        Paths with whitespace in the directory part are handled as in
+        `FTPHost._robust_ftp_command`.
+        """
+        script = [
+            Call("__init__"),
+            Call("pwd", result="/home"),
+            Call("cwd", args=("/home",)),
+            Call("cwd", args=("/home/dir with space",)),
+            Call("putcmd", args=("DELE file 1",)),
+            Call("putcmd", args=("RNFR file 2",)),
+            Call("putcmd", args=("RNTO file 3",)),
+            Call("getresp", result="250 ok"),
+            Call("getresp", result="350 ready for destination name"),
+            Call("getresp", result="250 ok"),
+            Call("cwd", args=("/home",)),
+            Call("close"),
+        ]
+        with test_base.ftp_host_factory(scripted_session.factory(script)) as host:
+            with host.batch() as batch:
+                batch.remove("dir with space/file 1")
+                batch.rename("dir with space/file 2", "dir with space/file 3")
+            assert host.getcwd() == "/home"
+
+    def test_inaccessible_directory(self):
+        """
+        If the batch can't change into a directory, the operations
+        for this directory fail, but the other operations are sent.
+        """
+        script = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            Call("cwd", args=("/",)),
+            Call("cwd", args=("/missing",), result=ftplib.error_perm("550 no dir")),
+            Call("putcmd", args=("DELE file2",)),
+            Call("getresp", result="250 ok"),
+            Call("close"),
+        ]
+        with test_base.ftp_host_factory(scripted_session.factory(script)) as host:
+            with pytest.raises(ftputil.error.BatchError) as exc_info:
+                with host.batch() as batch:
+                    batch.remove("/missing/file1")
+                    batch.remove("/file2")
+        results = exc_info.value.results
+        assert results[0].error.errno == 550
+        assert results[1].ok
+
+    def test_no_commands_after_exception(self):
+        script = [Call("__init__"), Call("pwd", result="/"), Call("close")]
+        with test_base.ftp_host_factory(scripted_session.factory(script)) as host:
+            with pytest.raises(RuntimeError):
+                with host.batch() as batch:
+                    batch.remove("file")
+                    raise RuntimeError("stop")
+
+    def test_cache_invalidation(self):
+        script = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            Call("cwd", args=("/",)),
+            Call("putcmd", args=("DELE file",)),
+            Call("getresp", result="250 ok"),
+            Call("close"),
+        ]
+        with test_base.ftp_host_factory(scripted_session.factory(script)) as host:
+            host.stat_cache["/file"] = object()
+            with host.batch() as batch:
+                batch.remove("file")
+            assert "/file" not in host.stat_cache
+
+    def test_invalid_window(self):
+        script = [Call("__init__"), Call("pwd", result="/"), Call("close")]
+        with test_base.ftp_host_factory(scripted_session.factory(script)) as host:
+            with pytest.raises(ValueError):
+                host.batch(window=0)
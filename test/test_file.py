@@ -4,11 +4,14 @@
 
 import ftplib
 import io
+import socket
 import unittest
+import zlib
 
 import pytest
 
 import ftputil.error
+import ftputil.file
 
 from test import scripted_session
 from test import test_base
@@ -192,6 +195,34 @@ class TestFileOperations:
                 data = fobj.read()
             assert data == BINARY_TEST_DATA
 
+    def test_binary_readinto(self):
+        """Read data from a binary file into a preallocated buffer."""
+        host_script = [Call("__init__"), Call("pwd", result="/"), Call("close")]
+        file_script = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            Call("cwd", args=("/",)),
+            Call("voidcmd", args=("TYPE I",)),
+            Call(
+                "transfercmd",
+                args=("RETR some_file", None),
+                result=io.BytesIO(BINARY_TEST_DATA),
+            ),
+            Call("voidresp"),
+            Call("close"),
+        ]
+        multisession_factory = scripted_session.factory(host_script, file_script)
+        with test_base.ftp_host_factory(multisession_factory) as host:
+            with host.open("some_file", "rb") as fobj:
+                buffer_ = bytearray(10)
+                count = fobj.readinto(buffer_)
+                assert count == 10
+                assert buffer_ == BINARY_TEST_DATA[:10]
+                count = fobj.readinto1(buffer_)
+                assert count == 10
+                assert buffer_ == BINARY_TEST_DATA[10:20]
+                assert fobj.read1() == BINARY_TEST_DATA[20:]
+
     def test_binary_write(self):
         """Write binary data with `write`."""
         host_script = [Call("__init__"), Call("pwd", result="/"), Call("close")]
@@ -252,6 +283,28 @@ class TestFileOperations:
                 data = input_.read()
                 assert data == ""
 
+    def test_text_readinto(self):
+        """Text files don't support `readinto`."""
+        host_script = [Call("__init__"), Call("pwd", result="/"), Call("close")]
+        file_script = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            Call("cwd", args=("/",)),
+            Call("voidcmd", args=("TYPE I",)),
+            Call(
+                "transfercmd",
+                args=("RETR dummy", None),
+                result=io.StringIO(TEXT_TEST_DATA, newline=None),
+            ),
+            Call("voidresp"),
+            Call("close"),
+        ]
+        multisession_factory = scripted_session.factory(host_script, file_script)
+        with test_base.ftp_host_factory(multisession_factory) as host:
+            with host.open("dummy", "r") as input_:
+                with pytest.raises(AttributeError):
+                    input_.readinto(bytearray(10))
+
     def test_text_write(self):
         """Write text with `write`."""
         host_script = [Call("__init__"), Call("pwd", result="/"), Call("close")]
@@ -487,6 +540,66 @@ class TestFileOperations:
                     pass
 
 
+class TestCompressedFile:
+    """Test the file objects for `MODE Z` data connections."""
+
+    def _reader(self, compressed_data, mode="rb", **kwargs):
+        """
+        Return a file object for reading from a socket which receives
+        `compressed_data`.
+        """
+        conn, peer = socket.socketpair()
+        with peer:
+            peer.sendall(compressed_data)
+        return conn, ftputil.file.compressed_file(conn, mode, **kwargs)
+
+    def test_bounded_reads(self):
+        """Each read decompresses at most the requested amount of data."""
+        data = b"\0" * 1000000
+        conn, fobj = self._reader(zlib.compress(data), buffering=0)
+        with conn, fobj:
+            chunks = []
+            while True:
+                chunk = fobj.read(65536)
+                if not chunk:
+                    break
+                assert len(chunk) <= 65536
+                chunks.append(chunk)
+        assert b"".join(chunks) == data
+
+    def test_text_mode(self):
+        data = "Zeile 1\nZeile 2\n"
+        conn, fobj = self._reader(
+            zlib.compress(data.encode("UTF-8")), "r", encoding="UTF-8"
+        )
+        with conn, fobj:
+            assert list(fobj) == ["Zeile 1\n", "Zeile 2\n"]
+
+    def test_incomplete_data(self):
+        compressed_data = zlib.compress(b"data" * 1000)
+        conn, fobj = self._reader(compressed_data[:-10])
+        with conn, fobj:
+            with pytest.raises(ftputil.error.FTPIOError):
+                fobj.read()
+
+    def test_invalid_data(self):
+        conn, fobj = self._reader(b"not compressed")
+        with conn, fobj:
+            with pytest.raises(ftputil.error.FTPIOError):
+                fobj.read()
+
+    def test_write(self):
+        """The compressed stream is finished when the file is closed."""
+        data = b"data" * 100000
+        conn, peer = socket.socketpair()
+        with peer:
+            with conn:
+                with ftputil.file.compressed_file(conn, "wb") as fobj:
+                    fobj.write(data)
+            with peer.makefile("rb") as peer_file:
+                assert zlib.decompress(peer_file.read()) == data
+
+
 class TestAvailableChild:
     def _failing_pwd(self, exception_class):
         """
@@ -160,3 +160,118 @@ class TestChunkwiseTransfer:
         iterator = ftputil.file_transfer.chunks(fobj, 256)
         with pytest.raises(FailingStringIO.expected_exception):
             next(iterator)
+
+
+class ReadintoOnlyBytesIO(io.BytesIO):
+    """
+    Mock class to test whether `copyfileobj` reads via `readinto` and
+    reuses the same buffer.
+    """
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.buffer_ids = set()
+
+    def read(self, count=-1):
+        raise AssertionError("`read` shouldn't be called")
+
+    def readinto(self, buffer_):
+        self.buffer_ids.add(id(buffer_))
+        return super().readinto(buffer_)
+
+
+class TestCopyFileObj:
+    def test_copy_with_readinto(self):
+        """Copy with a preallocated buffer if the source supports it."""
+        data = bytes(range(256)) * 40
+        source = ReadintoOnlyBytesIO(data)
+        target = io.BytesIO()
+        chunks = []
+        ftputil.file_transfer.copyfileobj(
+            source, target, max_chunk_size=1000, callback=chunks.append
+        )
+        assert target.getvalue() == data
+        # All chunks were read into the same buffer.
+        assert len(source.buffer_ids) == 1
+        # The callback gets copies of the data, not the reused buffer.
+        assert [len(chunk) for chunk in chunks] == [1000] * 10 + [240]
+        assert all(isinstance(chunk, bytes) for chunk in chunks)
+        assert b"".join(chunks) == data
+
+    def test_copy_without_readinto(self):
+        """Copy text files, which don't support `readinto`."""
+        data = "äöü" * 1000
+        source = io.StringIO(data)
+        target = io.StringIO()
+        chunks = []
+        ftputil.file_transfer.copyfileobj(
+            source, target, max_chunk_size=1000, callback=chunks.append
+        )
+        assert target.getvalue() == data
+        assert len(chunks) == 3
+
+    def test_copy_with_auto_chunk_size(self):
+        """Copy with a chunk size adapting to the throughput."""
+        data = bytes(range(256)) * 1000
+        source = io.BytesIO(data)
+        target = io.BytesIO()
+        ftputil.file_transfer.copyfileobj(
+            source, target, max_chunk_size=ftputil.file_transfer.AUTO_CHUNK_SIZE
+        )
+        assert target.getvalue() == data
+
+    def test_invalid_chunk_size(self):
+        """Reject chunk sizes that are neither positive integers nor "auto"."""
+        for invalid_chunk_size in [0, -1, 1.5, "1000", None]:
+            with pytest.raises(ValueError):
+                ftputil.file_transfer.copyfileobj(
+                    io.BytesIO(b"data"), io.BytesIO(), invalid_chunk_size
+                )
+
+
+class TestAdaptiveChunkSize:
+    def test_grow(self):
+        """The chunk size grows for fast transfers, at most by factor 2."""
+        chunk_size = ftputil.file_transfer._AdaptiveChunkSize()
+        start_size = chunk_size.size
+        # 1 GB/s would suggest a much larger chunk size.
+        chunk_size.update(start_size, start_size / 1e9)
+        assert chunk_size.size == 2 * start_size
+
+    def test_shrink(self):
+        """The chunk size shrinks for slow transfers, at most by factor 2."""
+        chunk_size = ftputil.file_transfer._AdaptiveChunkSize()
+        start_size = chunk_size.size
+        # 1 KB/s
+        chunk_size.update(start_size, start_size / 1e3)
+        assert chunk_size.size == start_size // 2
+
+    def test_limits(self):
+        """The chunk size stays between the minimum and maximum size."""
+        chunk_size = ftputil.file_transfer._AdaptiveChunkSize()
+        for _ in range(20):
+            chunk_size.update(chunk_size.size, 0.0)
+        assert chunk_size.size == chunk_size.MAX_SIZE
+        for _ in range(20):
+            chunk_size.update(chunk_size.size, 1000.0)
+        assert chunk_size.size == chunk_size.MIN_SIZE
+
+
+class TestLocalChecksum:
+    def test_checksums(self, tmp_path):
+        path = tmp_path / "file"
+        path.write_bytes(b"test")
+        assert (
+            ftputil.file_transfer.local_checksum(path, "md5")
+            == "098f6bcd4621d373cade4e832627b4f6"
+        )
+        assert ftputil.file_transfer.local_checksum(path, "crc32") == "d87f7e0c"
+        assert ftputil.file_transfer.local_checksum(path, "sha256") == (
+            "9f86d081884c7d659a2feaa0c55ad015a3bf4f1b2b0b822cd15d6c15b0f00a08"
+        )
+
+    def test_invalid_algorithm(self, tmp_path):
+        path = tmp_path / "file"
+        path.write_bytes(b"test")
+        with pytest.raises(ValueError):
+            ftputil.file_transfer.local_checksum(path, "sha3")
@@ -2,6 +2,7 @@
 # and ftputil contributors (see `doc/contributors.txt`)
 # See the file LICENSE for licensing terms.
 
+import concurrent.futures
 import datetime
 import ftplib
 import io
@@ -10,15 +11,20 @@ import os
 import pickle
 import posixpath
 import random
+import socket
+import stat
 import time
 import unittest
+import unittest.mock
 import warnings
+import zlib
 
 import pytest
 
 import ftputil
 import ftputil.error
 import ftputil.file
+import ftputil.rate_limit
 import ftputil.tool
 import ftputil.stat
 
@@ -116,6 +122,117 @@ class TestKeepAlive:
                 host.keep_alive()
 
 
+class TestReconnect:
+    def test_reconnect(self):
+        """The new session changes to the current directory of the old one."""
+        script1 = [Call("__init__"), Call("pwd", result="/home"), Call("close")]
+        script2 = [Call("__init__"), Call("cwd", args=("/home",)), Call("close")]
+        multisession_factory = scripted_session.factory(script1, script2)
+        with test_base.ftp_host_factory(multisession_factory) as host:
+            host.set_time_shift(3600.0)
+            host.stat_cache["/home/file"] = "stat result"
+            host.reconnect()
+            assert host.getcwd() == "/home"
+            assert host.time_shift() == 3600.0
+            assert host.stat_cache["/home/file"] == "stat result"
+
+    def test_retry_listing(self):
+        """A directory listing is repeated after reconnecting."""
+        script1 = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            Call("cwd", args=("/",), result=EOFError()),
+            Call("close"),
+        ]
+        script2 = [
+            Call("__init__"),
+            # Restore current directory.
+            Call("cwd", args=("/",)),
+            Call("cwd", args=("/",)),
+            Call("cwd", args=("/",)),
+            Call(
+                "dir",
+                args=("",),
+                result="-rw-r--r--   1 45854   200   4604 Jan 19 23:11 file",
+            ),
+            Call("cwd", args=("/",)),
+            Call("close"),
+        ]
+        multisession_factory = scripted_session.factory(script1, script2)
+        with test_base.ftp_host_factory(multisession_factory) as host:
+            host.enable_auto_reconnect(initial_delay=0.25)
+            with unittest.mock.patch("time.sleep") as sleep_mock:
+                assert host.listdir("/") == ["file"]
+            sleep_mock.assert_called_once_with(0.25)
+
+    def test_give_up(self):
+        """After `max_attempts` attempts, the last error is raised."""
+        script1 = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            Call("cwd", args=("/",), result=socket.timeout("timed out")),
+            Call("close"),
+        ]
+        script2 = [
+            Call("__init__"),
+            Call("cwd", args=("/",), result=ftplib.error_temp("421 too many users")),
+            Call("close"),
+        ]
+        multisession_factory = scripted_session.factory(script1, script2)
+        with test_base.ftp_host_factory(multisession_factory) as host:
+            host.enable_auto_reconnect(max_attempts=2, initial_delay=1.0)
+            with unittest.mock.patch("time.sleep") as sleep_mock:
+                with pytest.raises(ftputil.error.TemporaryError):
+                    host.chdir("/")
+            sleep_mock.assert_called_once_with(1.0)
+
+    def test_no_retry_for_non_idempotent_operation(self):
+        """
+        A `mkdir` isn't repeated, but the next operation reconnects.
+        """
+        script1 = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            Call("cwd", args=("/",)),
+            Call("cwd", args=("/",)),
+            Call("mkd", args=("dir",), result=ftplib.error_temp("421 shutting down")),
+            Call("cwd", args=("/",)),
+            Call("close"),
+        ]
+        script2 = [
+            Call("__init__"),
+            Call("cwd", args=("/",)),
+            Call("cwd", args=("/",)),
+            Call("close"),
+        ]
+        multisession_factory = scripted_session.factory(script1, script2)
+        with test_base.ftp_host_factory(multisession_factory) as host:
+            host.enable_auto_reconnect()
+            with pytest.raises(ftputil.error.TemporaryError):
+                host.mkdir("/dir")
+            host.chdir("/")
+
+    def test_other_errors(self):
+        """Errors which don't mean a lost connection are just raised."""
+        script = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            Call("cwd", args=("/missing",), result=ftplib.error_perm("550 no")),
+            Call("close"),
+        ]
+        with test_base.ftp_host_factory(scripted_session.factory(script)) as host:
+            host.enable_auto_reconnect()
+            with pytest.raises(ftputil.error.PermanentError):
+                host.chdir("/missing")
+            assert not host._needs_reconnect
+
+    def test_invalid_max_attempts(self):
+        script = [Call("__init__"), Call("pwd", result="/"), Call("close")]
+        with test_base.ftp_host_factory(scripted_session.factory(script)) as host:
+            with pytest.raises(ValueError):
+                host.enable_auto_reconnect(max_attempts=0)
+
+
 class TestSetParser:
     class TrivialParser(ftputil.stat.Parser):
         """
@@ -251,6 +368,21 @@ class TestRecursiveListingForDotAsPath:
             assert files == ["bin", "dev", "etc", "pub", "usr"]
 
 
+class RecordingRateLimiter(ftputil.rate_limit.RateLimiter):
+    """
+    Rate limiter which records the byte counts of the reservations
+    but never delays a transfer.
+    """
+
+    def __init__(self):
+        super().__init__(1)
+        self.byte_counts = []
+
+    def reserve(self, byte_count):
+        self.byte_counts.append(byte_count)
+        return 0.0
+
+
 class TestUploadAndDownload:
     """Test upload and download."""
 
@@ -292,6 +424,169 @@ class TestUploadAndDownload:
         )
         assert local_target.read_bytes() == remote_file_content
 
+    def test_download_with_chunk_size(self, tmp_path):
+        """Download with a given chunk size."""
+        remote_file_content = bytes(range(256)) * 10
+        local_target = tmp_path / "test_target"
+        host_script = [Call("__init__"), Call("pwd", result="/"), Call("close")]
+        file_script = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            Call("cwd", args=("/",)),
+            Call("voidcmd", args=("TYPE I",)),
+            Call(
+                "transfercmd",
+                args=("RETR dummy_name", None),
+                result=io.BytesIO(remote_file_content),
+            ),
+            Call("voidresp"),
+            Call("close"),
+        ]
+        multisession_factory = scripted_session.factory(host_script, file_script)
+        chunks = []
+        with test_base.ftp_host_factory(multisession_factory) as host:
+            host.download(
+                "dummy_name", str(local_target), chunks.append, chunk_size=1000
+            )
+        assert [len(chunk) for chunk in chunks] == [1000, 1000, 560]
+        assert local_target.read_bytes() == remote_file_content
+
+    def test_host_wide_rate_limit(self):
+        """The host-wide rate limit is stored as a `RateLimiter`."""
+        script = [Call("__init__"), Call("pwd", result="/"), Call("close")]
+        with test_base.ftp_host_factory(scripted_session.factory(script)) as host:
+            assert host.rate_limit is None
+            host.rate_limit = 1000
+            assert isinstance(host.rate_limit, ftputil.rate_limit.RateLimiter)
+            assert host.rate_limit.rate == 1000
+            rate_limiter = RecordingRateLimiter()
+            host.rate_limit = rate_limiter
+            assert host.rate_limit is rate_limiter
+            # Per-transfer and host-wide limits are combined.
+            combined_rate_limiter = host._transfer_rate_limiter(2000)
+            combined_rate_limiter.acquire(100)
+            assert rate_limiter.byte_counts == [100]
+
+    def _upload_over_socket(self, tmp_path, callback=None, **upload_kwargs):
+        """
+        Upload binary data over a real (local) socket and return the
+        data received on the other end.
+        """
+        local_source = tmp_path / "test_source"
+        data = binary_data()
+        local_source.write_bytes(data)
+        data_socket, peer_socket = socket.socketpair()
+        host_script = [Call("__init__"), Call("pwd", result="/"), Call("close")]
+        file_script = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            Call("cwd", args=("/",)),
+            Call("voidcmd", args=("TYPE I",)),
+            Call("transfercmd", args=("STOR target", None), result=data_socket),
+            Call("voidresp"),
+            Call("close"),
+        ]
+        multisession_factory = scripted_session.factory(host_script, file_script)
+        with peer_socket:
+            with test_base.ftp_host_factory(multisession_factory) as host:
+                host.upload(
+                    str(local_source), "target", callback=callback, **upload_kwargs
+                )
+            with peer_socket.makefile("rb") as peer_file:
+                received_data = peer_file.read()
+        assert received_data == data
+
+    def test_upload_with_sendfile(self, tmp_path):
+        """
+        Without a callback, uploads over plain sockets should use
+        `socket.sendfile`.
+        """
+        with unittest.mock.patch.object(
+            socket.socket, "sendfile", autospec=True, side_effect=socket.socket.sendfile
+        ) as sendfile_mock:
+            self._upload_over_socket(tmp_path)
+        sendfile_mock.assert_called_once()
+
+    def test_upload_with_sendfile_and_rate_limit(self, tmp_path):
+        """
+        With a rate limit, uploads use `socket.sendfile` in chunks, so
+        that the rate limiter sees each chunk.
+        """
+        rate_limiter = RecordingRateLimiter()
+        with unittest.mock.patch.object(
+            socket.socket, "sendfile", autospec=True, side_effect=socket.socket.sendfile
+        ) as sendfile_mock:
+            self._upload_over_socket(tmp_path, chunk_size=4096, rate_limit=rate_limiter)
+        # The last call returns 0, signaling the end of the file.
+        assert sendfile_mock.call_count == 4
+        assert rate_limiter.byte_counts == [4096, 4096, 1808]
+
+    def test_upload_with_callback_without_sendfile(self, tmp_path):
+        """
+        The callback needs the transferred data, so `sendfile` can't be
+        used for uploads with a callback.
+        """
+        chunks = []
+        with unittest.mock.patch.object(
+            socket.socket, "sendfile", autospec=True, side_effect=socket.socket.sendfile
+        ) as sendfile_mock:
+            self._upload_over_socket(tmp_path, callback=chunks.append)
+        sendfile_mock.assert_not_called()
+        assert len(b"".join(chunks)) == 10000
+
+    def _download_over_socket(self, tmp_path, callback=None):
+        """
+        Download binary data over a real (local) socket and check the
+        data in the local target file.
+        """
+        local_target = tmp_path / "test_target"
+        data = binary_data()
+        data_socket, peer_socket = socket.socketpair()
+        with peer_socket:
+            peer_socket.sendall(data)
+        host_script = [Call("__init__"), Call("pwd", result="/"), Call("close")]
+        file_script = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            Call("cwd", args=("/",)),
+            Call("voidcmd", args=("TYPE I",)),
+            Call("transfercmd", args=("RETR source", None), result=data_socket),
+            Call("voidresp"),
+            Call("close"),
+        ]
+        multisession_factory = scripted_session.factory(host_script, file_script)
+        with test_base.ftp_host_factory(multisession_factory) as host:
+            host.download("source", str(local_target), callback=callback)
+        assert local_target.read_bytes() == data
+
+    @pytest.mark.skipif(not hasattr(os, "splice"), reason="requires `os.splice`")
+    def test_download_with_splice(self, tmp_path):
+        """
+        Without a callback, downloads over plain sockets into regular
+        files should use `os.splice`.
+        """
+        with unittest.mock.patch("os.splice", wraps=os.splice) as splice_mock:
+            self._download_over_socket(tmp_path)
+        assert splice_mock.called
+
+    def test_download_with_recv_into(self, tmp_path):
+        """
+        With a callback, downloads over sockets should read from the
+        socket directly with `recv_into`.
+        """
+        chunks = []
+        recv_into_calls = []
+        original_recv_into = socket.socket.recv_into
+
+        def recv_into(self, *args, **kwargs):
+            recv_into_calls.append(args)
+            return original_recv_into(self, *args, **kwargs)
+
+        with unittest.mock.patch.object(socket.socket, "recv_into", recv_into):
+            self._download_over_socket(tmp_path, callback=chunks.append)
+        assert recv_into_calls
+        assert len(b"".join(chunks)) == 10000
+
     def test_conditional_upload_without_upload(self, tmp_path):
         """
         If the target file is newer, no upload should happen.
@@ -337,151 +632,1017 @@ class TestUploadAndDownload:
             date_=datetime.date.today() - datetime.timedelta(days=1),
             name="older",
         )
-        host_script = [
-            Call("__init__"),
-            Call("pwd", result="/"),
+        host_script = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            Call("cwd", args=("/",)),
+            Call("cwd", args=("/",)),
+            Call("dir", args=("",), result=dir_result),
+            Call("cwd", args=("/",)),
+            Call("close"),
+        ]
+        file_script = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            Call("cwd", args=("/",)),
+            Call("voidcmd", args=("TYPE I",)),
+            Call(
+                "transfercmd",
+                args=("STOR older", None),
+                result=test_base.MockableBytesIO(),
+            ),
+            Call("voidresp"),
+            Call("close"),
+        ]
+        # Target is older, so upload.
+        multisession_factory = scripted_session.factory(host_script, file_script)
+        with unittest.mock.patch("test.test_base.MockableBytesIO.write") as write_mock:
+            with test_base.ftp_host_factory(multisession_factory) as host:
+                flag = host.upload_if_newer(str(local_source), "/older")
+            write_mock.assert_called_with(file_content)
+        assert flag is True
+        # Target doesn't exist, so upload.
+        #  Use correct file name for this test.
+        file_script[4] = Call(
+            "transfercmd",
+            args=("STOR notthere", None),
+            result=test_base.MockableBytesIO(),
+        )
+        multisession_factory = scripted_session.factory(host_script, file_script)
+        with unittest.mock.patch("test.test_base.MockableBytesIO.write") as write_mock:
+            with test_base.ftp_host_factory(multisession_factory) as host:
+                flag = host.upload_if_newer(str(local_source), "/notthere")
+            write_mock.assert_called_with(file_content)
+        assert flag is True
+
+    def test_conditional_download_without_target(self, tmp_path):
+        """
+        Test conditional binary mode download when no target file
+        exists.
+        """
+        local_target = tmp_path / "test_target"
+        data = binary_data()
+        # Target does not exist, so download.
+        #  There isn't a `dir` call to compare the datetimes of the
+        #  remote and the target file because the local `exists` call
+        #  for the local target returns `False` and the datetime
+        #  comparison therefore isn't done.
+        host_script = [Call("__init__"), Call("pwd", result="/"), Call("close")]
+        file_script = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            Call("cwd", args=("/",)),
+            Call("voidcmd", args=("TYPE I",)),
+            Call("transfercmd", args=("RETR newer", None), result=io.BytesIO(data)),
+            Call("voidresp"),
+            Call("close"),
+        ]
+        multisession_factory = scripted_session.factory(host_script, file_script)
+        with test_base.ftp_host_factory(multisession_factory) as host:
+            flag = host.download_if_newer("/newer", str(local_target))
+        assert flag is True
+        assert local_target.read_bytes() == data
+
+    def test_conditional_download_with_older_target(self, tmp_path):
+        """Test conditional binary mode download with newer source file."""
+        local_target = tmp_path / "test_target"
+        # Make sure file exists for the timestamp comparison.
+        local_target.touch()
+        data = binary_data()
+        # Target is older, so download.
+        #  Use a date in the future. That isn't realistic, but for the
+        #  purpose of the test it's an easy way to make sure the source
+        #  file is newer than the target file.
+        dir_result = test_base.dir_line(
+            mode_string="-rw-r--r--",
+            date_=datetime.date.today() + datetime.timedelta(days=1),
+            name="newer",
+        )
+        host_script = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            Call("cwd", args=("/",)),
+            Call("cwd", args=("/",)),
+            Call("dir", args=("",), result=dir_result),
+            Call("cwd", args=("/",)),
+            Call("close"),
+        ]
+        file_script = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            Call("cwd", args=("/",)),
+            Call("voidcmd", args=("TYPE I",)),
+            Call("transfercmd", args=("RETR newer", None), result=io.BytesIO(data)),
+            Call("voidresp"),
+            Call("close"),
+        ]
+        multisession_factory = scripted_session.factory(host_script, file_script)
+        with test_base.ftp_host_factory(multisession_factory) as host:
+            flag = host.download_if_newer("/newer", str(local_target))
+        assert flag is True
+        assert local_target.read_bytes() == data
+
+    def test_conditional_download_with_newer_target(self, tmp_path):
+        """Test conditional binary mode download with older source file."""
+        local_target = tmp_path / "test_target"
+        # Make sure file exists for timestamp comparison.
+        local_target.touch()
+        data = binary_data()
+        # Use date in the past, so the target file is newer and no
+        # download happens.
+        dir_result = test_base.dir_line(
+            mode_string="-rw-r--r--",
+            date_=datetime.date.today() - datetime.timedelta(days=1),
+            name="newer",
+        )
+        host_script = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            Call("cwd", args=("/",)),
+            Call("cwd", args=("/",)),
+            Call("dir", args=("",), result=dir_result),
+            Call("cwd", args=("/",)),
+            Call("close"),
+        ]
+        file_script = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            Call("cwd", args=("/",)),
+            Call("voidcmd", args=("TYPE I",)),
+            Call("transfercmd", args=("RETR newer", None), result=io.BytesIO(data)),
+            Call("voidresp"),
+            Call("close"),
+        ]
+        multisession_factory = scripted_session.factory(host_script, file_script)
+        with test_base.ftp_host_factory(multisession_factory) as host:
+            flag = host.download_if_newer("/newer", str(local_target))
+        assert flag is False
+
+
+class TestCompression:
+    """Test `MODE Z` transfers and listings."""
+
+    feat_reply = "211-Features:\n MDTM\n MODE Z\n211 End"
+
+    # Compressible data, like a log file
+    data = b"2020-01-01 12:00:00 INFO Something happened\n" * 1000
+
+    def test_download(self, tmp_path):
+        """
+        With `use_compression`, a download uses `MODE Z`. The data is
+        decompressed and the callback gets the decompressed data. A
+        later download without compression switches back to `MODE S`.
+        """
+        local_target = tmp_path / "test_target"
+        data_socket, peer_socket = socket.socketpair()
+        with peer_socket:
+            peer_socket.sendall(zlib.compress(self.data))
+        host_script = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            Call("sendcmd", args=("FEAT",), result=self.feat_reply),
+            Call("close"),
+        ]
+        file_script = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            Call("cwd", args=("/",)),
+            Call("voidcmd", args=("TYPE I",)),
+            Call("voidcmd", args=("MODE Z",)),
+            Call("transfercmd", args=("RETR source", None), result=data_socket),
+            Call("voidresp"),
+            # Second download
+            Call("pwd", result="/"),
+            Call("cwd", args=("/",)),
+            Call("voidcmd", args=("TYPE I",)),
+            Call("voidcmd", args=("MODE S",)),
+            Call("transfercmd", args=("RETR source", None), result=io.BytesIO(b"")),
+            Call("voidresp"),
+            Call("close"),
+        ]
+        multisession_factory = scripted_session.factory(host_script, file_script)
+        chunks = []
+        with test_base.ftp_host_factory(multisession_factory) as host:
+            host.use_compression = True
+            with unittest.mock.patch("os.splice", create=True) as splice_mock:
+                host.download("source", str(local_target), chunks.append)
+            # The data socket carries compressed data, so it can't be
+            # used directly.
+            splice_mock.assert_not_called()
+            assert local_target.read_bytes() == self.data
+            assert b"".join(chunks) == self.data
+            host.download("source", str(local_target), compress=False)
+
+    def test_upload(self, tmp_path):
+        """An upload with `compress=True` sends compressed data."""
+        local_source = tmp_path / "test_source"
+        local_source.write_bytes(self.data)
+        data_socket, peer_socket = socket.socketpair()
+        host_script = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            Call("sendcmd", args=("FEAT",), result=self.feat_reply),
+            Call("close"),
+        ]
+        file_script = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            Call("cwd", args=("/",)),
+            Call("voidcmd", args=("TYPE I",)),
+            Call("voidcmd", args=("MODE Z",)),
+            Call("transfercmd", args=("STOR target", None), result=data_socket),
+            Call("voidresp"),
+            Call("close"),
+        ]
+        multisession_factory = scripted_session.factory(host_script, file_script)
+        with peer_socket:
+            with test_base.ftp_host_factory(multisession_factory) as host:
+                with unittest.mock.patch.object(
+                    socket.socket, "sendfile", autospec=True
+                ) as sendfile_mock:
+                    host.upload(str(local_source), "target", compress=True)
+                sendfile_mock.assert_not_called()
+            with peer_socket.makefile("rb") as peer_file:
+                received_data = peer_file.read()
+        assert len(received_data) < len(self.data)
+        assert zlib.decompress(received_data) == self.data
+
+    def test_unsupported(self):
+        """
+        Without `MODE Z` in the `FEAT` reply, `use_compression` is
+        ignored, but an explicit `compress=True` fails.
+        """
+        host_script = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            Call("sendcmd", args=("FEAT",), result="211-Features:\n MDTM\n211 End"),
+            Call("close"),
+        ]
+        file_script = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            Call("cwd", args=("/",)),
+            Call("voidcmd", args=("TYPE I",)),
+            Call("transfercmd", args=("RETR file", None), result=io.BytesIO(b"")),
+            Call("voidresp"),
+            Call("close"),
+        ]
+        multisession_factory = scripted_session.factory(host_script, file_script)
+        with test_base.ftp_host_factory(multisession_factory) as host:
+            host.use_compression = True
+            with host.open("file", "rb") as fobj:
+                assert fobj.read() == b""
+            with pytest.raises(ftputil.error.CommandNotImplementedError):
+                host.open("file", "rb", compress=True)
+
+    def test_rest(self):
+        """`rest` can't be used with compression."""
+        host_script = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            Call("sendcmd", args=("FEAT",), result=self.feat_reply),
+            Call("close"),
+        ]
+        file_script = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            Call("cwd", args=("/",)),
+            Call("close"),
+        ]
+        multisession_factory = scripted_session.factory(host_script, file_script)
+        with test_base.ftp_host_factory(multisession_factory) as host:
+            with pytest.raises(ftputil.error.CommandNotImplementedError):
+                host.open("file", "rb", rest=100, compress=True)
+
+    def test_listing(self):
+        """Directory listings are decompressed line by line."""
+        dir_lines = [
+            "-rw-r--r--   1 45854    200          4604 Jan 19 23:11 file1",
+            "drwxr-sr-x   2 45854    200           512 May  4  2000 dir",
+        ]
+        data_socket, peer_socket = socket.socketpair()
+        with peer_socket:
+            peer_socket.sendall(
+                zlib.compress("".join(line + "\r\n" for line in dir_lines).encode())
+            )
+        script = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            Call("sendcmd", args=("FEAT",), result=self.feat_reply),
+            Call("cwd", args=("/",)),
+            Call("cwd", args=("/",)),
+            Call("voidcmd", args=("MODE Z",)),
+            Call("voidcmd", args=("TYPE A",)),
+            Call("transfercmd", args=("LIST", None), result=data_socket),
+            Call("voidresp"),
+            Call("cwd", args=("/",)),
+            Call("close"),
+        ]
+        with test_base.ftp_host_factory(scripted_session.factory(script)) as host:
+            host.use_compression = True
+            assert host.listdir("/") == ["file1", "dir"]
+        assert data_socket.fileno() == -1
+
+
+class TestUtime:
+    """Test setting the modification time of remote files."""
+
+    def _utime_calls(self, command, result=None):
+        return [
+            Call("cwd", args=("/",)),
+            Call("cwd", args=("/",)),
+            Call("voidcmd", args=(command,), result=result),
+            Call("cwd", args=("/",)),
+        ]
+
+    def test_mfmt(self):
+        script = (
+            [Call("__init__"), Call("pwd", result="/")]
+            + self._utime_calls("MFMT 19700102000000 file")
+            + [Call("close")]
+        )
+        with test_base.ftp_host_factory(scripted_session.factory(script)) as host:
+            host.utime("file", (0, 86400))
+
+    def test_fallback_to_site_utime(self):
+        """
+        If `MFMT` isn't supported, use `SITE UTIME`, also for later
+        calls.
+        """
+        script = (
+            [Call("__init__"), Call("pwd", result="/")]
+            + self._utime_calls(
+                "MFMT 19700102000000 file",
+                result=ftplib.error_perm("500 command not understood"),
+            )
+            + self._utime_calls("SITE UTIME 19700102000000 file")
+            + self._utime_calls("SITE UTIME 19700103000000 file")
+            + [Call("close")]
+        )
+        with test_base.ftp_host_factory(scripted_session.factory(script)) as host:
+            host.utime("file", (0, 86400))
+            host.utime("file", (0, 2 * 86400))
+
+    def test_not_implemented(self):
+        script = (
+            [Call("__init__"), Call("pwd", result="/")]
+            + self._utime_calls(
+                "MFMT 19700102000000 file",
+                result=ftplib.error_perm("502 command not implemented"),
+            )
+            + self._utime_calls(
+                "SITE UTIME 19700102000000 file",
+                result=ftplib.error_perm("500 command not understood"),
+            )
+            + [Call("close")]
+        )
+        with test_base.ftp_host_factory(scripted_session.factory(script)) as host:
+            with pytest.raises(ftputil.error.CommandNotImplementedError):
+                host.utime("file", (0, 86400))
+            # Don't try the commands again.
+            with pytest.raises(ftputil.error.CommandNotImplementedError):
+                host.utime("file", (0, 86400))
+
+    def test_other_error(self):
+        """Errors other than "not implemented" are passed to the caller."""
+        script = (
+            [Call("__init__"), Call("pwd", result="/")]
+            + self._utime_calls(
+                "MFMT 19700102000000 nonexistent",
+                result=ftplib.error_perm("550 no such file"),
+            )
+            + [Call("close")]
+        )
+        with test_base.ftp_host_factory(scripted_session.factory(script)) as host:
+            with pytest.raises(ftputil.error.PermanentError):
+                host.utime("nonexistent", (0, 86400))
+
+
+class TestCopyTo:
+    """Test server-to-server transfers."""
+
+    pasv_reply = "227 Entering Passive Mode (10,0,0,1,8,73)."
+
+    @staticmethod
+    def _set_peer_address(host, address):
+        """Set the address the command connection of `host` is connected to."""
+        host._session.sock.getpeername.return_value = (address, 21)
+
+    def test_copy_to(self):
+        """
+        As in `ftplib.ftpcp`, the source server gets `PASV` and the
+        target server gets `PORT` and the `STOR` command first.
+        """
+        source_script = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            Call("cwd", args=("/dir",)),
+            Call("voidcmd", args=("TYPE I",)),
+            Call("sendcmd", args=("PASV",), result=self.pasv_reply),
+            Call("sendcmd", args=("RETR source",), result="150 sending"),
+            Call("voidresp", result="226 done"),
+            Call("cwd", args=("/",)),
+            Call("close"),
+        ]
+        target_script = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            Call("cwd", args=("/",)),
+            Call("voidcmd", args=("TYPE I",)),
+            # The address of the source server's command connection,
+            # not the address from the `PASV` reply
+            Call("sendport", args=("192.0.2.1", 2121)),
+            Call("sendcmd", args=("STOR target",), result="150 receiving"),
+            Call("voidresp", result="226 done"),
+            Call("cwd", args=("/",)),
+            Call("close"),
+        ]
+        with test_base.ftp_host_factory(
+            scripted_session.factory(source_script)
+        ) as source_host, test_base.ftp_host_factory(
+            scripted_session.factory(target_script)
+        ) as target_host:
+            self._set_peer_address(source_host, "192.0.2.1")
+            source_host.copy_to(target_host, "/dir/source", "target")
+
+    def test_trusted_pasv_address(self):
+        """
+        With `trust_server_pasv_ipv4_address`, use the address from
+        the `PASV` reply.
+        """
+        source_script = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            Call("sendcmd", args=("PASV",), result=self.pasv_reply),
+            Call("close"),
+        ]
+        with test_base.ftp_host_factory(
+            scripted_session.factory(source_script)
+        ) as source_host:
+            session = source_host._session
+            session.trust_server_pasv_ipv4_address = True
+            assert source_host._passive_address(session) == ("10.0.0.1", 2121)
+
+    def test_port_refused(self):
+        """
+        If the target server refuses the `PORT` command, FXP isn't
+        possible. The passive connection of the source server is
+        aborted.
+        """
+        source_script = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            Call("cwd", args=("/dir",)),
+            Call("voidcmd", args=("TYPE I",)),
+            Call("sendcmd", args=("PASV",), result=self.pasv_reply),
+            Call("abort", result="225 no transfer to abort"),
+            Call("cwd", args=("/",)),
+            Call("close"),
+        ]
+        target_script = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            Call("cwd", args=("/",)),
+            Call("voidcmd", args=("TYPE I",)),
+            Call(
+                "sendport",
+                args=("192.0.2.1", 2121),
+                result=ftplib.error_perm("500 Illegal PORT command"),
+            ),
+            Call("cwd", args=("/",)),
+            Call("close"),
+        ]
+        with test_base.ftp_host_factory(
+            scripted_session.factory(source_script)
+        ) as source_host, test_base.ftp_host_factory(
+            scripted_session.factory(target_script)
+        ) as target_host:
+            self._set_peer_address(source_host, "192.0.2.1")
+            with pytest.raises(ftputil.error.CommandNotImplementedError):
+                source_host.copy_to(target_host, "/dir/source", "target")
+
+    def test_data_connection_refused(self):
+        """
+        If the target server accepts the `PORT` command, but can't
+        open the data connection, FXP isn't possible either. A partial
+        target file is removed.
+        """
+        source_script = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            Call("cwd", args=("/dir",)),
+            Call("voidcmd", args=("TYPE I",)),
+            Call("sendcmd", args=("PASV",), result=self.pasv_reply),
+            Call("abort", result="225 no transfer to abort"),
+            Call("cwd", args=("/",)),
+            Call("close"),
+        ]
+        target_script = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            Call("cwd", args=("/",)),
+            Call("voidcmd", args=("TYPE I",)),
+            Call("sendport", args=("192.0.2.1", 2121)),
+            Call(
+                "sendcmd",
+                args=("STOR target",),
+                result=ftplib.error_temp("425 Can't open data connection"),
+            ),
+            Call("delete", args=("target",), result="250 deleted"),
+            Call("cwd", args=("/",)),
+            Call("close"),
+        ]
+        with test_base.ftp_host_factory(
+            scripted_session.factory(source_script)
+        ) as source_host, test_base.ftp_host_factory(
+            scripted_session.factory(target_script)
+        ) as target_host:
+            self._set_peer_address(source_host, "192.0.2.1")
+            with pytest.raises(ftputil.error.CommandNotImplementedError):
+                source_host.copy_to(target_host, "/dir/source", "target")
+
+
+class TestCopyAndMove:
+    """Test copying and moving files on the same server."""
+
+    feat_reply = "211-Features:\n MDTM\n SITE COPY\n SIZE\n211 End"
+
+    def test_copy_with_feat(self):
+        """Copy on the server if `FEAT` lists `SITE COPY`."""
+        script = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            Call("sendcmd", args=("FEAT",), result=self.feat_reply),
+            Call("cwd", args=("/",)),
+            Call("cwd", args=("/",)),
+            Call("sendcmd", args=("SITE CPFR source",), result="350 ok"),
+            Call("voidcmd", args=("SITE CPTO /dir/target",), result="250 ok"),
+            Call("cwd", args=("/",)),
+            # The server-side copy support is cached.
+            Call("cwd", args=("/",)),
+            Call("cwd", args=("/",)),
+            Call("sendcmd", args=("SITE CPFR source",), result="350 ok"),
+            # Same directory as the source
+            Call("voidcmd", args=("SITE CPTO target",), result="250 ok"),
+            Call("cwd", args=("/",)),
+            Call("close"),
+        ]
+        with test_base.ftp_host_factory(scripted_session.factory(script)) as host:
+            host.stat_cache["/dir/target"] = "stat result"
+            host.copy("source", "/dir/target")
+            assert "/dir/target" not in host.stat_cache
+            host.copy("source", "target")
+            assert host._has_feature("size")
+            assert not host._has_feature("MFMT")
+
+    def test_copy_with_site_help(self):
+        """Copy on the server if `SITE HELP` lists `CPFR` and `CPTO`."""
+        script = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            Call("sendcmd", args=("FEAT",), result="211-Features:\n MDTM\n211 End"),
+            Call(
+                "sendcmd",
+                args=("SITE HELP",),
+                result="214-The following SITE commands are recognized\n"
+                " CHMOD CPFR CPTO HELP\n214 Direct comments to root",
+            ),
+            Call("cwd", args=("/",)),
+            Call("cwd", args=("/",)),
+            Call("sendcmd", args=("SITE CPFR source",), result="350 ok"),
+            Call("voidcmd", args=("SITE CPTO target",), result="250 ok"),
+            Call("cwd", args=("/",)),
+            Call("close"),
+        ]
+        with test_base.ftp_host_factory(scripted_session.factory(script)) as host:
+            host.copy("source", "target")
+
+    def test_streamed_copy(self):
+        """Without server support, stream the data between two children."""
+        data = bytes(range(256)) * 10
+        target_fobj = io.BytesIO()
+        # Keep the data after the file is closed.
+        target_fobj.close = lambda: None
+        host_script = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            Call("sendcmd", args=("FEAT",), result=ftplib.error_perm("500 FEAT?")),
+            Call(
+                "sendcmd",
+                args=("SITE HELP",),
+                result=ftplib.error_perm("500 SITE HELP?"),
+            ),
+            Call("close"),
+        ]
+        source_script = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            Call("cwd", args=("/",)),
+            Call("voidcmd", args=("TYPE I",)),
+            Call("transfercmd", args=("RETR source", None), result=io.BytesIO(data)),
+            Call("voidresp"),
+            Call("close"),
+        ]
+        target_script = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            Call("cwd", args=("/",)),
+            Call("voidcmd", args=("TYPE I",)),
+            Call("transfercmd", args=("STOR target", None), result=target_fobj),
+            Call("voidresp"),
+            Call("close"),
+        ]
+        multisession_factory = scripted_session.factory(
+            host_script, source_script, target_script
+        )
+        with test_base.ftp_host_factory(multisession_factory) as host:
+            host.copy("source", "target")
+        assert target_fobj.getvalue() == data
+
+    def test_move_with_rename(self):
+        script = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            Call("cwd", args=("/",)),
+            Call("rename", args=("/source", "/dir/target")),
+            Call("close"),
+        ]
+        with test_base.ftp_host_factory(scripted_session.factory(script)) as host:
+            host.move("/source", "/dir/target")
+
+    def test_move_with_copy(self):
+        """If the server refuses the rename, copy and remove the file."""
+        script = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            Call("cwd", args=("/",)),
+            Call(
+                "rename",
+                args=("/source", "/dir/target"),
+                result=ftplib.error_perm("553 can't rename across file systems"),
+            ),
+            Call("close"),
+        ]
+        with test_base.ftp_host_factory(scripted_session.factory(script)) as host:
+            with unittest.mock.patch.object(
+                host, "copy"
+            ) as copy_mock, unittest.mock.patch.object(host, "remove") as remove_mock:
+                host.move("/source", "/dir/target")
+            copy_mock.assert_called_once_with("/source", "/dir/target")
+            remove_mock.assert_called_once_with("/source")
+
+    def _move_with_rename_error(self, error):
+        """
+        Call `move` with a failing rename and return the mocks for
+        `copy` and `remove`.
+        """
+        script = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            Call("cwd", args=("/",)),
+            Call("rename", args=("/source", "/dir/target"), result=error),
+            Call("close"),
+        ]
+        with test_base.ftp_host_factory(scripted_session.factory(script)) as host:
+            with unittest.mock.patch.object(
+                host, "copy"
+            ) as copy_mock, unittest.mock.patch.object(host, "remove") as remove_mock:
+                host.move("/source", "/dir/target")
+        return copy_mock, remove_mock
+
+    def test_move_without_rename_command(self):
+        copy_mock, remove_mock = self._move_with_rename_error(
+            ftplib.error_perm("502 command not implemented")
+        )
+        copy_mock.assert_called_once_with("/source", "/dir/target")
+        remove_mock.assert_called_once_with("/source")
+
+    def test_move_with_other_error(self):
+        """Errors other than a cross-device rename are raised."""
+        with pytest.raises(ftputil.error.PermanentError) as exc_info:
+            self._move_with_rename_error(ftplib.error_perm("550 no such file"))
+        assert exc_info.value.errno == 550
+
+
+class TestChecksum:
+    """Test checksums calculated by the server."""
+
+    feat_reply = "211-Features:\n HASH SHA-256*;SHA-1;MD5\n SIZE\n211 End"
+
+    def _checksum_calls(self, command, result):
+        return [
             Call("cwd", args=("/",)),
             Call("cwd", args=("/",)),
-            Call("dir", args=("",), result=dir_result),
+            Call("sendcmd", args=(command,), result=result),
             Call("cwd", args=("/",)),
-            Call("close"),
         ]
-        file_script = [
-            Call("__init__"),
-            Call("pwd", result="/"),
+
+    def test_hash_command(self):
+        """Use `HASH` if `FEAT` lists the algorithm."""
+        digest = "9F86D081884C7D659A2FEAA0C55AD015A3BF4F1B2B0B822CD15D6C15B0F00A08"
+        script = (
+            [
+                Call("__init__"),
+                Call("pwd", result="/"),
+                Call("sendcmd", args=("FEAT",), result=self.feat_reply),
+            ]
+            + [
+                Call("cwd", args=("/",)),
+                Call("cwd", args=("/",)),
+                Call("sendcmd", args=("OPTS HASH SHA-256",), result="200 SHA-256"),
+                Call(
+                    "sendcmd",
+                    args=("HASH file",),
+                    result="213 SHA-256 0-3 {} file".format(digest),
+                ),
+                Call("cwd", args=("/",)),
+            ]
+            # The algorithm is only selected once.
+            + self._checksum_calls(
+                "HASH file", "213 SHA-256 0-3 {} file".format(digest)
+            )
+            + [Call("close")]
+        )
+        with test_base.ftp_host_factory(scripted_session.factory(script)) as host:
+            assert host.checksum("file") == digest.lower()
+            assert host.checksum("file", "sha256") == digest.lower()
+
+    def test_x_command(self):
+        """If `HASH` doesn't support the algorithm, use the `X*` command."""
+        script = (
+            [
+                Call("__init__"),
+                Call("pwd", result="/"),
+                Call("sendcmd", args=("FEAT",), result="211-Features:\n211 End"),
+            ]
+            + self._checksum_calls("XMD5 file", "250 098F6BCD4621D373CADE4E832627B4F6")
+            + self._checksum_calls("XCRC file", "250 D87F7E0C")
+            + self._checksum_calls("XCRC file", "250 7E0C")
+            + [Call("close")]
+        )
+        with test_base.ftp_host_factory(scripted_session.factory(script)) as host:
+            assert host.checksum("file", "md5") == "098f6bcd4621d373cade4e832627b4f6"
+            assert host.checksum("file", "crc32") == "d87f7e0c"
+            # Leading zeros may be missing.
+            assert host.checksum("file", "crc32") == "00007e0c"
+
+    def test_not_implemented(self):
+        script = (
+            [
+                Call("__init__"),
+                Call("pwd", result="/"),
+                Call("sendcmd", args=("FEAT",), result=ftplib.error_perm("500 FEAT?")),
+            ]
+            + self._checksum_calls(
+                "XSHA1 file", ftplib.error_perm("500 command not understood")
+            )
+            + [Call("close")]
+        )
+        with test_base.ftp_host_factory(scripted_session.factory(script)) as host:
+            with pytest.raises(ftputil.error.CommandNotImplementedError):
+                host.checksum("file", "sha1")
+            with pytest.raises(ValueError):
+                host.checksum("file", "sha3")
+
+    def _hash_calls(self, result):
+        return [
+            Call("cwd", args=("/",)),
+            Call("cwd", args=("/",)),
+            Call("sendcmd", args=("OPTS HASH SHA-256",), result="200 SHA-256"),
+            Call("sendcmd", args=("HASH file",), result=result),
             Call("cwd", args=("/",)),
-            Call("voidcmd", args=("TYPE I",)),
-            Call(
-                "transfercmd",
-                args=("STOR older", None),
-                result=test_base.MockableBytesIO(),
-            ),
-            Call("voidresp"),
-            Call("close"),
         ]
-        # Target is older, so upload.
-        multisession_factory = scripted_session.factory(host_script, file_script)
-        with unittest.mock.patch("test.test_base.MockableBytesIO.write") as write_mock:
-            with test_base.ftp_host_factory(multisession_factory) as host:
-                flag = host.upload_if_newer(str(local_source), "/older")
-            write_mock.assert_called_with(file_content)
-        assert flag is True
-        # Target doesn't exist, so upload.
-        #  Use correct file name for this test.
-        file_script[4] = Call(
-            "transfercmd",
-            args=("STOR notthere", None),
-            result=test_base.MockableBytesIO(),
+
+    def test_failing_hash_command(self):
+        """
+        If `HASH` isn't implemented although `FEAT` lists it, use the
+        `X*` command and don't try `HASH` again.
+        """
+        digest = "9F86D081884C7D659A2FEAA0C55AD015A3BF4F1B2B0B822CD15D6C15B0F00A08"
+        script = (
+            [
+                Call("__init__"),
+                Call("pwd", result="/"),
+                Call("sendcmd", args=("FEAT",), result=self.feat_reply),
+            ]
+            + self._hash_calls(ftplib.error_perm("502 not implemented"))
+            + self._checksum_calls("XSHA256 file", "250 {}".format(digest))
+            + self._checksum_calls("XSHA256 file", "250 {}".format(digest))
+            + [Call("close")]
         )
-        multisession_factory = scripted_session.factory(host_script, file_script)
-        with unittest.mock.patch("test.test_base.MockableBytesIO.write") as write_mock:
-            with test_base.ftp_host_factory(multisession_factory) as host:
-                flag = host.upload_if_newer(str(local_source), "/notthere")
-            write_mock.assert_called_with(file_content)
-        assert flag is True
+        with test_base.ftp_host_factory(scripted_session.factory(script)) as host:
+            assert host.checksum("file") == digest.lower()
+            assert host.checksum("file") == digest.lower()
 
-    def test_conditional_download_without_target(self, tmp_path):
+    def test_hash_error_is_reported(self):
         """
-        Test conditional binary mode download when no target file
-        exists.
+        If `HASH` fails because of the file and the `X*` command isn't
+        implemented, raise the `HASH` error. `X*` commands which aren't
+        implemented aren't tried again.
         """
-        local_target = tmp_path / "test_target"
-        data = binary_data()
-        # Target does not exist, so download.
-        #  There isn't a `dir` call to compare the datetimes of the
-        #  remote and the target file because the local `exists` call
-        #  for the local target returns `False` and the datetime
-        #  comparison therefore isn't done.
+        script = (
+            [
+                Call("__init__"),
+                Call("pwd", result="/"),
+                Call("sendcmd", args=("FEAT",), result=self.feat_reply),
+            ]
+            + self._hash_calls(ftplib.error_perm("550 no such file"))
+            + self._checksum_calls(
+                "XSHA256 file", ftplib.error_perm("500 command not understood")
+            )
+            + [
+                Call("cwd", args=("/",)),
+                Call("cwd", args=("/",)),
+                Call(
+                    "sendcmd",
+                    args=("HASH file",),
+                    result=ftplib.error_perm("550 no such file"),
+                ),
+                Call("cwd", args=("/",)),
+                Call("close"),
+            ]
+        )
+        with test_base.ftp_host_factory(scripted_session.factory(script)) as host:
+            for _ in range(2):
+                with pytest.raises(ftputil.error.PermanentError) as exc_info:
+                    host.checksum("file")
+                assert not isinstance(
+                    exc_info.value, ftputil.error.CommandNotImplementedError
+                )
+                assert exc_info.value.errno == 550
+
+    def test_upload_if_changed(self, tmp_path):
+        local_file = tmp_path / "file"
+        local_file.write_bytes(b"test")
+        local_digest = ftputil.file_transfer.local_checksum(local_file, "md5")
+        script = [Call("__init__"), Call("pwd", result="/"), Call("close")]
+        with test_base.ftp_host_factory(scripted_session.factory(script)) as host:
+            with unittest.mock.patch.object(
+                host.path, "isfile", return_value=True
+            ), unittest.mock.patch.object(
+                host.path, "getsize", return_value=4
+            ), unittest.mock.patch.object(
+                host, "checksum"
+            ) as checksum_mock, unittest.mock.patch.object(
+                host, "upload"
+            ) as upload_mock:
+                # Same content
+                checksum_mock.return_value = local_digest
+                assert not host.upload_if_changed(local_file, "file", algorithm="md5")
+                checksum_mock.assert_called_once_with("file", "md5")
+                assert not upload_mock.called
+                # Different content
+                checksum_mock.return_value = "0" * 32
+                assert host.upload_if_changed(local_file, "file", algorithm="md5")
+                assert upload_mock.called
+
+
+class TestParallelRmtree:
+    """Test `rmtree` with several workers."""
+
+    # Tree to remove
+    tree = {"/dir": ["file1", "sub"], "/dir/sub": ["file2"]}
+
+    def _patch_listing(self, host):
+        """Let `listdir` and `lstat` return data for `self.tree`."""
+
+        def listdir(path):
+            path = host.path.abspath(path)
+            if path not in self.tree:
+                raise ftputil.error.PermanentError("550 no such directory")
+            return self.tree[path]
+
+        def lstat(path):
+            path = host.path.abspath(path)
+            mode = stat.S_IFDIR if path in self.tree else stat.S_IFREG
+            return ftputil.stat.StatResult((mode,) + (0,) * 9)
+
+        return unittest.mock.patch.multiple(host, listdir=listdir, lstat=lstat)
+
+    def test_rmtree(self):
         host_script = [Call("__init__"), Call("pwd", result="/"), Call("close")]
-        file_script = [
+        worker_script = [
             Call("__init__"),
             Call("pwd", result="/"),
+            # Files first ...
             Call("cwd", args=("/",)),
-            Call("voidcmd", args=("TYPE I",)),
-            Call("transfercmd", args=("RETR newer", None), result=io.BytesIO(data)),
-            Call("voidresp"),
+            Call("cwd", args=("/dir",)),
+            Call("putcmd", args=("DELE file1",)),
+            Call("getresp", result="250 ok"),
+            Call("cwd", args=("/dir/sub",)),
+            Call("putcmd", args=("DELE file2",)),
+            Call("getresp", result="250 ok"),
+            Call("cwd", args=("/",)),
+            # ... then directories, deepest first
+            Call("cwd", args=("/",)),
+            Call("cwd", args=("/dir",)),
+            Call("putcmd", args=("RMD sub",)),
+            Call("getresp", result="250 ok"),
+            Call("cwd", args=("/",)),
+            Call("cwd", args=("/",)),
+            Call("putcmd", args=("RMD dir",)),
+            Call("getresp", result="250 ok"),
             Call("close"),
         ]
-        multisession_factory = scripted_session.factory(host_script, file_script)
+        multisession_factory = scripted_session.factory(host_script, worker_script)
         with test_base.ftp_host_factory(multisession_factory) as host:
-            flag = host.download_if_newer("/newer", str(local_target))
-        assert flag is True
-        assert local_target.read_bytes() == data
+            with self._patch_listing(host):
+                host.rmtree("/dir", workers=4)
 
-    def test_conditional_download_with_older_target(self, tmp_path):
-        """Test conditional binary mode download with newer source file."""
-        local_target = tmp_path / "test_target"
-        # Make sure file exists for the timestamp comparison.
-        local_target.touch()
-        data = binary_data()
-        # Target is older, so download.
-        #  Use a date in the future. That isn't realistic, but for the
-        #  purpose of the test it's an easy way to make sure the source
-        #  file is newer than the target file.
-        dir_result = test_base.dir_line(
-            mode_string="-rw-r--r--",
-            date_=datetime.date.today() + datetime.timedelta(days=1),
-            name="newer",
-        )
-        host_script = [
+    def test_onerror(self):
+        host_script = [Call("__init__"), Call("pwd", result="/"), Call("close")]
+        worker_script = [
             Call("__init__"),
             Call("pwd", result="/"),
             Call("cwd", args=("/",)),
+            Call("cwd", args=("/dir",)),
+            Call("putcmd", args=("DELE file1",)),
+            Call("getresp", result="250 ok"),
+            Call("cwd", args=("/dir/sub",)),
+            Call("putcmd", args=("DELE file2",)),
+            Call("getresp", result=ftplib.error_perm("550 permission denied")),
             Call("cwd", args=("/",)),
-            Call("dir", args=("",), result=dir_result),
             Call("cwd", args=("/",)),
-            Call("close"),
-        ]
-        file_script = [
-            Call("__init__"),
-            Call("pwd", result="/"),
+            Call("cwd", args=("/dir",)),
+            Call("putcmd", args=("RMD sub",)),
+            Call("getresp", result=ftplib.error_perm("550 directory not empty")),
             Call("cwd", args=("/",)),
-            Call("voidcmd", args=("TYPE I",)),
-            Call("transfercmd", args=("RETR newer", None), result=io.BytesIO(data)),
-            Call("voidresp"),
+            Call("cwd", args=("/",)),
+            Call("putcmd", args=("RMD dir",)),
+            Call("getresp", result=ftplib.error_perm("550 directory not empty")),
             Call("close"),
         ]
-        multisession_factory = scripted_session.factory(host_script, file_script)
+        multisession_factory = scripted_session.factory(host_script, worker_script)
+        errors = []
+
+        def onerror(func, path, exc_info):
+            errors.append((func.__name__, path, exc_info[1].errno))
+
         with test_base.ftp_host_factory(multisession_factory) as host:
-            flag = host.download_if_newer("/newer", str(local_target))
-        assert flag is True
-        assert local_target.read_bytes() == data
+            with self._patch_listing(host):
+                host.rmtree("dir", workers=2, onerror=onerror)
+        assert errors == [
+            ("remove", "dir/sub/file2", 550),
+            ("rmdir", "dir/sub", 550),
+            ("rmdir", "dir", 550),
+        ]
 
-    def test_conditional_download_with_newer_target(self, tmp_path):
-        """Test conditional binary mode download with older source file."""
-        local_target = tmp_path / "test_target"
-        # Make sure file exists for timestamp comparison.
-        local_target.touch()
-        data = binary_data()
-        # Use date in the past, so the target file is newer and no
-        # download happens.
-        dir_result = test_base.dir_line(
-            mode_string="-rw-r--r--",
-            date_=datetime.date.today() - datetime.timedelta(days=1),
-            name="newer",
-        )
-        host_script = [
+    def test_error_without_onerror(self):
+        """Without `onerror`, the first error is raised."""
+        host_script = [Call("__init__"), Call("pwd", result="/"), Call("close")]
+        worker_script = [
             Call("__init__"),
             Call("pwd", result="/"),
             Call("cwd", args=("/",)),
-            Call("cwd", args=("/",)),
-            Call("dir", args=("",), result=dir_result),
+            Call("cwd", args=("/dir",)),
+            Call("putcmd", args=("DELE file1",)),
+            Call("getresp", result=ftplib.error_perm("550 permission denied")),
+            Call("cwd", args=("/dir/sub",)),
+            Call("putcmd", args=("DELE file2",)),
+            Call("getresp", result="250 ok"),
             Call("cwd", args=("/",)),
             Call("close"),
         ]
-        file_script = [
+        multisession_factory = scripted_session.factory(host_script, worker_script)
+        with test_base.ftp_host_factory(multisession_factory) as host:
+            with self._patch_listing(host):
+                with pytest.raises(ftputil.error.PermanentError) as exc_info:
+                    host.rmtree("/dir", workers=2)
+        assert exc_info.value.errno == 550
+
+    def test_error_without_cancel_futures(self):
+        """
+        Pending batches are cancelled without the `cancel_futures`
+        argument of `Executor.shutdown`, which Python 3.8 and older
+        don't have.
+        """
+        host_script = [Call("__init__"), Call("pwd", result="/"), Call("close")]
+        worker_script = [
             Call("__init__"),
             Call("pwd", result="/"),
             Call("cwd", args=("/",)),
-            Call("voidcmd", args=("TYPE I",)),
-            Call("transfercmd", args=("RETR newer", None), result=io.BytesIO(data)),
-            Call("voidresp"),
+            Call("cwd", args=("/dir",)),
+            Call("putcmd", args=("DELE file1",)),
+            Call("getresp", result=ftplib.error_perm("550 permission denied")),
+            Call("cwd", args=("/dir/sub",)),
+            Call("putcmd", args=("DELE file2",)),
+            Call("getresp", result="250 ok"),
+            Call("cwd", args=("/",)),
             Call("close"),
         ]
-        multisession_factory = scripted_session.factory(host_script, file_script)
+        multisession_factory = scripted_session.factory(host_script, worker_script)
+        original_shutdown = concurrent.futures.ThreadPoolExecutor.shutdown
+
+        def shutdown(self, wait=True):
+            original_shutdown(self, wait)
+
         with test_base.ftp_host_factory(multisession_factory) as host:
-            flag = host.download_if_newer("/newer", str(local_target))
-        assert flag is False
+            with self._patch_listing(host), unittest.mock.patch.object(
+                concurrent.futures.ThreadPoolExecutor, "shutdown", shutdown
+            ):
+                with pytest.raises(ftputil.error.PermanentError) as exc_info:
+                    host.rmtree("/dir", workers=2)
+        assert exc_info.value.errno == 550
 
 
 class TestTimeShift:
@@ -839,10 +2000,9 @@ class TestAcceptEitherUnicodeOrBytes:
             Call("__init__"),
             Call("pwd", result="/"),
             # To deal with ticket #86 (virtual directories), `makedirs` tries to
-            # change into each directory and if it exists (changing doesn't raise
+            # change into the directory and if it exists (changing doesn't raise
             # an exception), doesn't try to create it. That's why you don't see
             # an `mkd` calls here despite originally having a `makedirs` call.
-            Call("cwd", args=("/ä",)),
             Call("cwd", args=("/ä/ö",)),
             Call("cwd", args=("/",)),
             Call("close"),
@@ -878,12 +2038,12 @@ class TestAcceptEitherUnicodeOrBytes:
             Call("dir", args=("",), result=dir_line),
             Call("cwd", args=("/",)),
             #      `host.path.isdir` end
-            #      `host._stat._stat_results_from_dir("/empty_ä")`
+            #      `host._stat._entries_from_dir("/empty_ä")`
             Call("cwd", args=("/",)),
             Call("cwd", args=("/empty_ä",)),
             Call("dir", args=("",), result=""),
             Call("cwd", args=("/",)),
-            #      `host._stat._stat_results_from_dir("/empty_ä")` end
+            #      `host._stat._entries_from_dir("/empty_ä")` end
             #  `host._session.rmd` in `host._robust_ftp_command`
             #   `host._check_inaccessible_login_directory()`
             Call("cwd", args=("/",)),
@@ -1014,6 +2174,227 @@ class TestAcceptEitherUnicodeOrBytes:
             result = list(host.walk(as_bytes("/ä")))
 
 
+class TestRoundTrips:
+    """
+    Test how many round trips typical operations need and how long they
+    would take over a slow connection.
+
+    If one of these tests fails after a change, check whether the change
+    deliberately changed the number of round trips. If it did, adapt the
+    expected values.
+    """
+
+    # Virtual costs of FTP commands in seconds
+    latency = 0.05
+    list_cost = 0.2
+
+    def _network(self):
+        return scripted_session.SimulatedNetwork(
+            latency=self.latency, command_costs={"LIST": self.list_cost}
+        )
+
+    def test_walk(self):
+        """
+        Test round trips for walking the tree
+
+        /a
+          b/
+          f
+        """
+        root_dir_line = test_base.dir_line(
+            mode_string="drwxr-xr-x", date_=datetime.date.today(), name="a"
+        )
+        a_dir_lines = "\n".join(
+            [
+                test_base.dir_line(
+                    mode_string="drwxr-xr-x", date_=datetime.date.today(), name="b"
+                ),
+                test_base.dir_line(
+                    mode_string="-rw-r--r--", date_=datetime.date.today(), name="f"
+                ),
+            ]
+        )
+        script = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            # `isdir("/a")`
+            Call("cwd", args=("/",)),
+            Call("cwd", args=("/",)),
+            Call("dir", args=("",), result=root_dir_line),
+            Call("cwd", args=("/",)),
+            # `listdir("/a")`
+            Call("cwd", args=("/",)),
+            Call("cwd", args=("/a",)),
+            Call("dir", args=("",), result=a_dir_lines),
+            Call("cwd", args=("/",)),
+            # `listdir("/a/b")`
+            Call("cwd", args=("/",)),
+            Call("cwd", args=("/a/b",)),
+            Call("dir", args=("",), result=""),
+            Call("cwd", args=("/",)),
+            Call("close"),
+        ]
+        network = self._network()
+        session_factory = scripted_session.factory(script, network=network)
+        with test_base.ftp_host_factory(session_factory) as host:
+            network.reset()
+            result = list(host.walk("/a"))
+        assert result == [("/a", ["b"], ["f"]), ("/a/b", [], [])]
+        assert network.round_trips == {"CWD": 9, "LIST": 3, "QUIT": 1}
+        assert network.elapsed == pytest.approx(10 * self.latency + 3 * self.list_cost)
+
+    def test_upload_if_newer_without_upload(self, tmp_path):
+        """
+        Test round trips for an `upload_if_newer` call that doesn't need
+        to upload the file.
+        """
+        local_source = tmp_path / "test_source"
+        local_source.write_bytes(b"dummy_content")
+        dir_line = test_base.dir_line(
+            mode_string="-rw-r--r--",
+            date_=datetime.date.today() + datetime.timedelta(days=1),
+            name="newer",
+        )
+        script = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            Call("cwd", args=("/",)),
+            Call("cwd", args=("/",)),
+            Call("dir", args=("",), result=dir_line),
+            Call("cwd", args=("/",)),
+            Call("close"),
+        ]
+        network = self._network()
+        session_factory = scripted_session.factory(script, network=network)
+        with test_base.ftp_host_factory(session_factory) as host:
+            network.reset()
+            assert host.upload_if_newer(str(local_source), "/newer") is False
+        assert network.round_trips == {"CWD": 3, "LIST": 1, "QUIT": 1}
+        assert network.elapsed == pytest.approx(4 * self.latency + self.list_cost)
+
+    def test_makedirs(self):
+        """
+        Test round trips for a `makedirs` call where only the first
+        directory of the path exists.
+        """
+        script = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            # Find the deepest existing directory.
+            Call("cwd", args=("/a/b/c",), result=ftplib.error_perm),
+            Call("cwd", args=("/a/b",), result=ftplib.error_perm),
+            Call("cwd", args=("/a",)),
+            # Make the missing directories like `mkdir` does.
+            Call("cwd", args=("/a",)),
+            Call("cwd", args=("/a",)),
+            Call("mkd", args=("b",)),
+            Call("cwd", args=("/a",)),
+            Call("cwd", args=("/a",)),
+            Call("cwd", args=("/a/b",)),
+            Call("mkd", args=("c",)),
+            Call("cwd", args=("/a",)),
+            # Restore original directory.
+            Call("cwd", args=("/",)),
+            Call("close"),
+        ]
+        network = self._network()
+        session_factory = scripted_session.factory(script, network=network)
+        with test_base.ftp_host_factory(session_factory) as host:
+            network.reset()
+            host.makedirs("/a/b/c")
+            # The directories are known now.
+            host.makedirs("/a/b/c")
+            host.makedirs("/a/b")
+        assert network.round_trips == {"CWD": 10, "MKD": 2, "QUIT": 1}
+        assert network.elapsed == pytest.approx(13 * self.latency)
+
+    def test_makedirs_with_existing_parent(self):
+        """
+        Test round trips for a `makedirs` call where only the last
+        directory of a deep path is missing.
+        """
+        script = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            Call("cwd", args=("/a/b/c/d/e",), result=ftplib.error_perm),
+            Call("cwd", args=("/a/b/c/d",)),
+            Call("cwd", args=("/a/b/c/d",)),
+            Call("cwd", args=("/a/b/c/d",)),
+            Call("mkd", args=("e",)),
+            Call("cwd", args=("/a/b/c/d",)),
+            Call("cwd", args=("/",)),
+            Call("close"),
+        ]
+        network = self._network()
+        session_factory = scripted_session.factory(script, network=network)
+        with test_base.ftp_host_factory(session_factory) as host:
+            network.reset()
+            host.makedirs("/a/b/c/d/e")
+        assert network.round_trips == {"CWD": 6, "MKD": 1, "QUIT": 1}
+
+    def test_known_dirs_expire(self):
+        """
+        Directories found by `makedirs` are forgotten after the
+        maximum age of the stat cache.
+        """
+        script = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            Call("cwd", args=("/a",)),
+            Call("cwd", args=("/",)),
+            # No commands for the second `makedirs` call, but the
+            # directory has expired for the third call.
+            Call("cwd", args=("/a",)),
+            Call("cwd", args=("/",)),
+            Call("close"),
+        ]
+        session_factory = scripted_session.factory(script)
+        with test_base.ftp_host_factory(session_factory) as host:
+            host.stat_cache.max_age = 10
+            with unittest.mock.patch("time.time", return_value=1000.0):
+                host.makedirs("/a")
+            with unittest.mock.patch("time.time", return_value=1005.0):
+                host.makedirs("/a")
+            with unittest.mock.patch("time.time", return_value=1020.0):
+                host.makedirs("/a")
+
+    def test_makedirs_many(self):
+        """
+        Test round trips for a `makedirs_many` call. The `MKD` commands
+        for each level are sent in one batch.
+        """
+        script = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            # `makedirs("/a")` for the common directory
+            Call("cwd", args=("/a",)),
+            Call("cwd", args=("/",)),
+            Call("cwd", args=("/",)),
+            Call("cwd", args=("/a",)),
+            Call("putcmd", args=("MKD b",)),
+            Call("putcmd", args=("MKD c",)),
+            Call("getresp", result='257 "/a/b" created'),
+            Call("getresp", result='257 "/a/c" created'),
+            Call("cwd", args=("/",)),
+            Call("cwd", args=("/",)),
+            Call("cwd", args=("/a/b",)),
+            Call("putcmd", args=("MKD d",)),
+            Call("putcmd", args=("MKD e",)),
+            Call("getresp", result='257 "/a/b/d" created'),
+            Call("getresp", result='257 "/a/b/e" created'),
+            Call("cwd", args=("/a/c",)),
+            Call("putcmd", args=("MKD f",)),
+            Call("getresp", result='257 "/a/c/f" created'),
+            Call("cwd", args=("/",)),
+            Call("close"),
+        ]
+        session_factory = scripted_session.factory(script)
+        with test_base.ftp_host_factory(session_factory) as host:
+            host.makedirs_many(["/a/b/d", "/a/b/e", "/a/c/f", "/a/b"])
+            # All directories are known now.
+            host.makedirs("/a/c/f")
+
+
 class TestFailingPickling:
     def test_failing_pickling(self):
         """Test if pickling (intentionally) isn't supported."""
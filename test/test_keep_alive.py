@@ -0,0 +1,232 @@
+# Copyright (C) 2020, Stefan Schwarzer <sschwarzer@sschwarzer.net>
+# and ftputil contributors (see `doc/contributors.txt`)
+# See the file LICENSE for licensing terms.
+
+import ftplib
+import io
+import threading
+
+import pytest
+
+import ftputil.host
+import ftputil.keep_alive
+import ftputil.session_pool
+
+from test import test_base
+import test.scripted_session as scripted_session
+
+
+Call = scripted_session.Call
+
+
+def make_idle(host, seconds=61.0):
+    """Pretend that the session of `host` hasn't been used for `seconds`."""
+    host._session.last_used -= seconds
+
+
+class TestKeepAlive:
+    def test_idle_session(self):
+        """Only sessions which are idle for `interval` seconds get a `NOOP`."""
+        script = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            Call("voidcmd", args=("NOOP",), result="200 NOOP ok"),
+            Call("close"),
+        ]
+        with test_base.ftp_host_factory(scripted_session.factory(script)) as host:
+            keep_alive = ftputil.keep_alive.KeepAlive(host, 60.0)
+            keep_alive.guard(host)
+            # Just used
+            keep_alive.ping_idle_sessions()
+            make_idle(host)
+            keep_alive.ping_idle_sessions()
+            # Not idle anymore after the `NOOP`.
+            keep_alive.ping_idle_sessions()
+
+    def test_failing_noop(self):
+        """A timed-out session is left alone."""
+        script = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            Call("voidcmd", args=("NOOP",), result=ftplib.error_temp("421 timeout")),
+            Call("close"),
+        ]
+        with test_base.ftp_host_factory(scripted_session.factory(script)) as host:
+            keep_alive = ftputil.keep_alive.KeepAlive(host, 60.0)
+            keep_alive.guard(host)
+            make_idle(host)
+            keep_alive.ping_idle_sessions()
+
+    def test_session_in_use(self):
+        """A session used by another thread isn't touched."""
+        script = [Call("__init__"), Call("pwd", result="/"), Call("close")]
+        with test_base.ftp_host_factory(scripted_session.factory(script)) as host:
+            keep_alive = ftputil.keep_alive.KeepAlive(host, 60.0)
+            keep_alive.guard(host)
+            make_idle(host)
+            locked = threading.Event()
+            release = threading.Event()
+
+            def use_session():
+                with host._session._lock:
+                    locked.set()
+                    release.wait()
+
+            thread = threading.Thread(target=use_session)
+            thread.start()
+            locked.wait()
+            try:
+                keep_alive.ping_idle_sessions()
+            finally:
+                release.set()
+                thread.join()
+
+    def test_busy_session(self):
+        """
+        A session held with `busy_session`, for example between
+        `putcmd` and `getresp`, isn't touched.
+        """
+        script = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            Call("voidcmd", args=("NOOP",), result="200 NOOP ok"),
+            Call("close"),
+        ]
+        with test_base.ftp_host_factory(scripted_session.factory(script)) as host:
+            keep_alive = ftputil.keep_alive.KeepAlive(host, 60.0)
+            keep_alive.guard(host)
+            with ftputil.keep_alive.busy_session(host):
+                make_idle(host)
+                # The lock is reentrant, so ping from another thread.
+                thread = threading.Thread(target=keep_alive.ping_idle_sessions)
+                thread.start()
+                thread.join()
+            make_idle(host)
+            keep_alive.ping_idle_sessions()
+
+    def test_busy_session_without_keep_alive(self):
+        script = [Call("__init__"), Call("pwd", result="/"), Call("close")]
+        with test_base.ftp_host_factory(scripted_session.factory(script)) as host:
+            with ftputil.keep_alive.busy_session(host):
+                pass
+
+    def test_uses_tls(self):
+        """A wrapped TLS session is still recognized as TLS session."""
+        session = ftputil.keep_alive._GuardedSession(ftplib.FTP_TLS())
+        assert ftputil.host.FTPHost._uses_tls(session)
+        session = ftputil.keep_alive._GuardedSession(ftplib.FTP())
+        assert not ftputil.host.FTPHost._uses_tls(session)
+
+    def test_children(self):
+        """Child sessions get a `NOOP`, but not during a transfer."""
+        host_script = [Call("__init__"), Call("pwd", result="/"), Call("close")]
+        file_script = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            Call("cwd", args=("/",)),
+            Call("voidcmd", args=("TYPE I",)),
+            Call("transfercmd", args=("RETR file", None), result=io.BytesIO(b"")),
+            Call("voidresp"),
+            Call("voidcmd", args=("NOOP",), result="200 NOOP ok"),
+            Call("close"),
+        ]
+        multisession_factory = scripted_session.factory(host_script, file_script)
+        with test_base.ftp_host_factory(multisession_factory) as host:
+            host.start_keep_alive(60.0)
+            keep_alive = host._keep_alive
+            make_idle(host, -1e9)
+            with host.open("/file", "rb"):
+                child = host._children[0]
+                assert isinstance(child._session, ftputil.keep_alive._GuardedSession)
+                # The file shares the guarded session.
+                assert child._file._session is child._session
+                make_idle(child)
+                # Transfer in progress
+                keep_alive.ping_idle_sessions()
+            make_idle(child)
+            keep_alive.ping_idle_sessions()
+
+    def test_start_and_stop(self):
+        script = [Call("__init__"), Call("pwd", result="/"), Call("close")]
+        with test_base.ftp_host_factory(scripted_session.factory(script)) as host:
+            session = host._session
+            host.start_keep_alive(60.0)
+            thread = host._keep_alive._thread
+            assert thread.is_alive()
+            assert isinstance(host._session, ftputil.keep_alive._GuardedSession)
+            with pytest.raises(RuntimeError):
+                host.start_keep_alive()
+            host.stop_keep_alive()
+            assert not thread.is_alive()
+            assert host._session is session
+            # No-op
+            host.stop_keep_alive()
+            host.start_keep_alive(60.0)
+            thread = host._keep_alive._thread
+        # `close` stops the thread.
+        assert not thread.is_alive()
+
+    def test_invalid_interval(self):
+        script = [Call("__init__"), Call("pwd", result="/"), Call("close")]
+        with test_base.ftp_host_factory(scripted_session.factory(script)) as host:
+            with pytest.raises(ValueError):
+                host.start_keep_alive(0)
+            assert host._keep_alive is None
+
+    def test_pool_hosts(self):
+        """Idle hosts of a `HostPool` are kept alive."""
+        host_script = [Call("__init__"), Call("pwd", result="/"), Call("close")]
+        clone_script = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            Call("voidcmd", args=("NOOP",), result="200 NOOP ok"),
+            Call("close"),
+        ]
+        multisession_factory = scripted_session.factory(host_script, clone_script)
+        with test_base.ftp_host_factory(multisession_factory) as host:
+            host.start_keep_alive(60.0)
+            keep_alive = host._keep_alive
+            make_idle(host, -1e9)
+            with ftputil.session_pool.HostPool(host, 1) as pool:
+                with pool.host() as worker_host:
+                    pass
+                make_idle(worker_host)
+                keep_alive.ping_idle_sessions()
+            # Closed pool hosts are forgotten.
+            assert worker_host not in keep_alive._hosts()
+
+    def test_children_of_pool_hosts(self):
+        """
+        The sessions for remote files of pool hosts are guarded and get
+        a `NOOP`, too.
+        """
+        host_script = [Call("__init__"), Call("pwd", result="/"), Call("close")]
+        clone_script = [Call("__init__"), Call("pwd", result="/"), Call("close")]
+        file_script = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            Call("cwd", args=("/",)),
+            Call("voidcmd", args=("TYPE I",)),
+            Call("transfercmd", args=("RETR file", None), result=io.BytesIO(b"")),
+            Call("voidresp"),
+            Call("voidcmd", args=("NOOP",), result="200 NOOP ok"),
+            Call("close"),
+        ]
+        multisession_factory = scripted_session.factory(
+            host_script, clone_script, file_script
+        )
+        with test_base.ftp_host_factory(multisession_factory) as host:
+            host.start_keep_alive(60.0)
+            keep_alive = host._keep_alive
+            make_idle(host, -1e9)
+            with ftputil.session_pool.HostPool(host, 1) as pool:
+                with pool.host() as worker_host:
+                    make_idle(worker_host, -1e9)
+                    with worker_host.open("/file", "rb"):
+                        pass
+                child = worker_host._children[0]
+                assert isinstance(child._session, ftputil.keep_alive._GuardedSession)
+                make_idle(child)
+                keep_alive.ping_idle_sessions()
+            # Closing the pool doesn't stop the thread of `host`.
+            assert keep_alive._thread.is_alive()
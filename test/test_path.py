@@ -162,22 +162,14 @@ class TestPath:
             #  Look for `/some_link`
             Call("dir", args=("",), result=dir_line),
             Call("cwd", args=("/",)),
-            Call("cwd", args=("/",)),
-            Call("cwd", args=("/",)),
-            #  Look for `/nonexistent`
-            Call("dir", args=("",), result=dir_line),
-            Call("cwd", args=("/",)),
+            #  Look for `/nonexistent` in the same listing
             # `isfile` call
             Call("cwd", args=("/",)),
             Call("cwd", args=("/",)),
             #  Look for `/some_link`
             Call("dir", args=("",), result=dir_line),
             Call("cwd", args=("/",)),
-            Call("cwd", args=("/",)),
-            Call("cwd", args=("/",)),
-            #  Look for `/nonexistent`
-            Call("dir", args=("",), result=dir_line),
-            Call("cwd", args=("/",)),
+            #  Look for `/nonexistent` in the same listing
             # `islink` call
             Call("cwd", args=("/",)),
             Call("cwd", args=("/",)),
@@ -0,0 +1,135 @@
+# Copyright (C) 2020, Stefan Schwarzer <sschwarzer@sschwarzer.net>
+# and ftputil contributors (see `doc/contributors.txt`)
+# See the file LICENSE for licensing terms.
+
+import io
+import unittest.mock
+
+import pytest
+
+import ftputil.file_transfer
+import ftputil.rate_limit
+
+
+class FakeClock:
+    """
+    Replacement for `time.monotonic` and `time.sleep`. Sleeping
+    advances the clock without actually sleeping.
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, duration):
+        self.sleeps.append(duration)
+        self.now += duration
+
+
+@pytest.fixture
+def clock():
+    fake_clock = FakeClock()
+    with unittest.mock.patch(
+        "time.monotonic", fake_clock.monotonic
+    ), unittest.mock.patch("time.sleep", fake_clock.sleep):
+        yield fake_clock
+
+
+class TestRateLimiter:
+    def test_invalid_arguments(self):
+        with pytest.raises(ValueError):
+            ftputil.rate_limit.RateLimiter(0)
+        with pytest.raises(ValueError):
+            ftputil.rate_limit.RateLimiter(1000, burst=-1)
+
+    def test_burst(self, clock):
+        """Up to `burst` bytes are transferred without delay."""
+        rate_limiter = ftputil.rate_limit.RateLimiter(1000, burst=500)
+        rate_limiter.acquire(500)
+        assert clock.sleeps == []
+        rate_limiter.acquire(500)
+        assert clock.sleeps == [pytest.approx(0.5)]
+
+    def test_rate(self, clock):
+        """The throughput doesn't exceed the rate."""
+        rate_limiter = ftputil.rate_limit.RateLimiter(1000, burst=0)
+        for _ in range(10):
+            rate_limiter.acquire(1000)
+        assert clock.now - 1000.0 == pytest.approx(10.0)
+
+    def test_no_tiny_sleeps(self, clock):
+        """Short delays accumulate instead of causing tiny sleeps."""
+        rate_limiter = ftputil.rate_limit.RateLimiter(1000, burst=0)
+        # Each acquisition alone would cause a delay of 0.01 seconds.
+        for _ in range(100):
+            rate_limiter.acquire(10)
+        assert all(
+            duration >= rate_limiter.MIN_SLEEP_DURATION for duration in clock.sleeps
+        )
+        assert len(clock.sleeps) < 100
+        # The sleeps still add up to the delay required by the rate
+        # (except for the last delay, which was too short for a sleep).
+        assert sum(clock.sleeps) == pytest.approx(1.0, abs=0.05)
+
+    def test_fair_share(self, clock):
+        """
+        Transfers sharing a limiter wait in the order of their
+        reservations.
+        """
+        rate_limiter = ftputil.rate_limit.RateLimiter(1000, burst=0)
+        # Two transfers reserve alternately, as threads would.
+        delays = [rate_limiter.reserve(100) for _ in range(4)]
+        assert delays == [
+            pytest.approx(0.1),
+            pytest.approx(0.2),
+            pytest.approx(0.3),
+            pytest.approx(0.4),
+        ]
+
+    def test_idle_period(self, clock):
+        """After an idle period, the bucket is full again."""
+        rate_limiter = ftputil.rate_limit.RateLimiter(1000, burst=500)
+        rate_limiter.acquire(1000)
+        clock.now += 10.0
+        assert rate_limiter.reserve(500) == 0.0
+
+
+class TestCombinedRateLimiter:
+    def test_no_limit(self):
+        assert ftputil.rate_limit.combined_rate_limiter(None, None) is None
+
+    def test_single_limit(self):
+        rate_limiter = ftputil.rate_limit.RateLimiter(1000)
+        assert (
+            ftputil.rate_limit.combined_rate_limiter(None, rate_limiter) is rate_limiter
+        )
+        new_rate_limiter = ftputil.rate_limit.combined_rate_limiter(2000)
+        assert isinstance(new_rate_limiter, ftputil.rate_limit.RateLimiter)
+        assert new_rate_limiter.rate == 2000
+
+    def test_strictest_limit_wins(self, clock):
+        """A group of limiters sleeps for the longest delay."""
+        slow_rate_limiter = ftputil.rate_limit.RateLimiter(100, burst=0)
+        fast_rate_limiter = ftputil.rate_limit.RateLimiter(1000, burst=0)
+        rate_limiter = ftputil.rate_limit.combined_rate_limiter(
+            fast_rate_limiter, slow_rate_limiter
+        )
+        rate_limiter.acquire(100)
+        assert clock.sleeps == [pytest.approx(1.0)]
+
+
+class TestCopyWithRateLimit:
+    def test_copyfileobj(self, clock):
+        data = b"x" * 10000
+        target = io.BytesIO()
+        ftputil.file_transfer.copyfileobj(
+            io.BytesIO(data),
+            target,
+            max_chunk_size=1000,
+            rate_limit=ftputil.rate_limit.RateLimiter(5000, burst=0),
+        )
+        assert target.getvalue() == data
+        assert clock.now - 1000.0 == pytest.approx(2.0)
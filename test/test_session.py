@@ -6,6 +6,12 @@
 Unit tests for session factory helpers.
 """
 
+import ftplib
+import socket
+import unittest.mock
+
+import pytest
+
 import ftputil.session
 
 
@@ -42,6 +48,39 @@ class EncryptedMockSession(MockSession):
         self.add_call("prot_p")
 
 
+class SocketMockSession(MockSession):
+    """
+    Mock session with mock sockets for the command and data
+    connections.
+    """
+
+    def connect(self, host, port, timeout=None):
+        if timeout is None:
+            self.add_call("connect", host, port)
+        else:
+            self.add_call("connect", host, port, timeout)
+        self.sock = unittest.mock.Mock(name="control_socket")
+
+    def ntransfercmd(self, cmd, rest=None):
+        return unittest.mock.Mock(name="data_socket"), None
+
+
+class TLSMockSession(ftplib.FTP_TLS):
+    """
+    `ftplib.FTP_TLS` session without network access.
+    """
+
+    def connect(self, host, port):
+        self.host = host
+        self.sock = unittest.mock.Mock(name="control_socket")
+
+    def login(self, user, password):
+        pass
+
+    def prot_p(self):
+        self._prot_p = True
+
+
 class TestSessionFactory:
     """
     Test if session factories created by
@@ -125,3 +164,157 @@ class TestSessionFactory:
             ("set_debuglevel", 1),
             ("login", "user", "password"),
         ]
+
+    def _data_connection(self, session):
+        """
+        Return the result of `session.ntransfercmd` without network
+        access.
+        """
+        session.context = unittest.mock.Mock(name="context")
+        raw_conn = unittest.mock.Mock(name="raw_data_socket")
+        with unittest.mock.patch.object(
+            ftplib.FTP, "ntransfercmd", return_value=(raw_conn, 123)
+        ) as ntransfercmd_mock:
+            conn, size = session.ntransfercmd("RETR file")
+        ntransfercmd_mock.assert_called_once_with("RETR file", None)
+        assert size == 123
+        return raw_conn, conn
+
+    def test_reuse_tls_session(self):
+        """Data connections reuse the TLS session of the command channel."""
+        factory = ftputil.session.session_factory(base_class=TLSMockSession)
+        session = factory("host", "user", "password")
+        raw_conn, conn = self._data_connection(session)
+        session.context.wrap_socket.assert_called_once_with(
+            raw_conn, server_hostname="host", session=session.sock.session
+        )
+        assert conn is session.context.wrap_socket.return_value
+
+    def test_no_tls_session_reuse(self):
+        """Without `reuse_tls_session`, use `FTP_TLS.ntransfercmd`."""
+        factory = ftputil.session.session_factory(
+            base_class=TLSMockSession, reuse_tls_session=False
+        )
+        session = factory("host", "user", "password")
+        raw_conn, conn = self._data_connection(session)
+        session.context.wrap_socket.assert_called_once_with(
+            raw_conn, server_hostname="host"
+        )
+
+    def test_tls_session_reuse_with_network_profile(self):
+        """The raw data socket is configured before the TLS handshake."""
+        profile = ftputil.session.NetworkProfile(read_timeout=10.0)
+        factory = ftputil.session.session_factory(
+            base_class=TLSMockSession, network_profile=profile
+        )
+        session = factory("host", "user", "password")
+        raw_conn, conn = self._data_connection(session)
+        raw_conn.settimeout.assert_called_once_with(10.0)
+        assert conn is session.context.wrap_socket.return_value
+
+    def test_unencrypted_data_channel(self):
+        """Without `PROT P`, the data connection isn't wrapped."""
+        factory = ftputil.session.session_factory(
+            base_class=TLSMockSession, encrypt_data_channel=False
+        )
+        session = factory("host", "user", "password")
+        raw_conn, conn = self._data_connection(session)
+        assert conn is raw_conn
+        session.context.wrap_socket.assert_not_called()
+
+
+class TestNetworkProfile:
+    """
+    Test `ftputil.session.NetworkProfile` and its use in session
+    factories.
+    """
+
+    def test_default_profile(self):
+        """By default, only `TCP_NODELAY` is set."""
+        sock = unittest.mock.Mock()
+        ftputil.session.NetworkProfile().configure_socket(sock)
+        sock.setsockopt.assert_called_once_with(
+            socket.IPPROTO_TCP, socket.TCP_NODELAY, 1
+        )
+        sock.settimeout.assert_not_called()
+
+    def test_all_settings(self):
+        profile = ftputil.session.NetworkProfile(
+            tcp_nodelay=False,
+            bandwidth_delay_product=1_250_000,
+            tcp_keepalive=True,
+            keepalive_idle=30,
+            keepalive_interval=5,
+            keepalive_count=3,
+            read_timeout=20.0,
+        )
+        sock = unittest.mock.Mock()
+        profile.configure_socket(sock)
+        calls = sock.setsockopt.call_args_list
+        assert (
+            unittest.mock.call(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1) not in calls
+        )
+        for expected_call in [
+            (socket.SOL_SOCKET, socket.SO_RCVBUF, 1_250_000),
+            (socket.SOL_SOCKET, socket.SO_SNDBUF, 1_250_000),
+            (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+        ]:
+            assert unittest.mock.call(*expected_call) in calls
+        if hasattr(socket, "TCP_KEEPIDLE"):
+            assert (
+                unittest.mock.call(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 30) in calls
+            )
+        if hasattr(socket, "TCP_KEEPINTVL"):
+            assert (
+                unittest.mock.call(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 5) in calls
+            )
+        if hasattr(socket, "TCP_KEEPCNT"):
+            assert (
+                unittest.mock.call(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 3) in calls
+            )
+        sock.settimeout.assert_called_once_with(20.0)
+
+    def test_invalid_values(self):
+        for name in [
+            "bandwidth_delay_product",
+            "keepalive_idle",
+            "keepalive_interval",
+            "keepalive_count",
+            "connect_timeout",
+            "read_timeout",
+        ]:
+            with pytest.raises(ValueError):
+                ftputil.session.NetworkProfile(**{name: 0})
+
+    def test_session_factory(self):
+        """
+        The profile is applied to the command and data connections, and
+        the connect timeout is passed to `connect`.
+        """
+        profile = ftputil.session.NetworkProfile(connect_timeout=5.0, read_timeout=30.0)
+        factory = ftputil.session.session_factory(
+            base_class=SocketMockSession, network_profile=profile
+        )
+        session = factory("host", "user", "password")
+        assert session.calls == [
+            ("connect", "host", 21, 5.0),
+            ("login", "user", "password"),
+        ]
+        session.sock.setsockopt.assert_called_once_with(
+            socket.IPPROTO_TCP, socket.TCP_NODELAY, 1
+        )
+        session.sock.settimeout.assert_called_once_with(30.0)
+        conn, _size = session.ntransfercmd("RETR file")
+        conn.setsockopt.assert_called_once_with(
+            socket.IPPROTO_TCP, socket.TCP_NODELAY, 1
+        )
+        conn.settimeout.assert_called_once_with(30.0)
+
+    def test_no_connect_timeout(self):
+        """Without a connect timeout, `connect` gets no timeout argument."""
+        factory = ftputil.session.session_factory(
+            base_class=SocketMockSession,
+            network_profile=ftputil.session.NetworkProfile(),
+        )
+        session = factory("host", "user", "password")
+        assert session.calls[0] == ("connect", "host", 21)
@@ -0,0 +1,49 @@
+# Copyright (C) 2020, Stefan Schwarzer <sschwarzer@sschwarzer.net>
+# and ftputil contributors (see `doc/contributors.txt`)
+# See the file LICENSE for licensing terms.
+
+import ftputil.session_pool
+import ftputil.sync
+
+from test import test_base
+import test.scripted_session as scripted_session
+
+
+Call = scripted_session.Call
+
+
+class TestHostPool:
+    def test_hosts_are_created_on_demand_and_reused(self):
+        host_script = [Call("__init__"), Call("pwd", result="/"), Call("close")]
+        clone_script1 = [Call("__init__"), Call("pwd", result="/"), Call("close")]
+        clone_script2 = [Call("__init__"), Call("pwd", result="/"), Call("close")]
+        multisession_factory = scripted_session.factory(
+            host_script, clone_script1, clone_script2
+        )
+        with test_base.ftp_host_factory(multisession_factory) as host:
+            host._time_shift = 3600.0
+            host.use_list_a_option = True
+            host.use_compression = True
+            with ftputil.session_pool.HostPool(host, 2) as pool:
+                with pool.host() as worker_host1:
+                    # Settings are copied.
+                    assert worker_host1 is not host
+                    assert worker_host1.time_shift() == 3600.0
+                    assert worker_host1.use_list_a_option is True
+                    assert worker_host1.use_compression is True
+                    with pool.host() as worker_host2:
+                        assert worker_host2 is not worker_host1
+                # Idle hosts are reused.
+                with pool.host() as worker_host3:
+                    assert worker_host3 in [worker_host1, worker_host2]
+            assert worker_host1.closed
+            assert worker_host2.closed
+        # Only two connections were made for the pool.
+        assert len(multisession_factory.scripted_sessions) == 3
+
+    def test_local_host_is_shared(self):
+        local_host = ftputil.sync.LocalHost()
+        with ftputil.session_pool.HostPool(local_host, 2) as pool:
+            with pool.host() as worker_host1, pool.host() as worker_host2:
+                assert worker_host1 is local_host
+                assert worker_host2 is local_host
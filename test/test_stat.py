@@ -6,12 +6,14 @@ import datetime
 import ftplib
 import stat
 import time
+import unittest.mock
 
 import freezegun
 import pytest
 
 import ftputil
 import ftputil.error
+import ftputil.host
 import ftputil.stat
 from ftputil.stat import MINUTE_PRECISION, DAY_PRECISION, UNKNOWN_PRECISION
 
@@ -322,6 +324,39 @@ class TestParsers:
         ]
         self._test_invalid_lines(ftputil.stat.UnixParser, lines)
 
+    def test_unix_parse_name(self):
+        parser = ftputil.stat.UnixParser()
+        assert (
+            parser.parse_name(
+                "drwxr-sr-x   2 45854    200   512 May  4  2000 dir with spaces"
+            )
+            == "dir with spaces"
+        )
+        assert (
+            parser.parse_name("lrwxrwxrwx   2 45854  200  6 May 29  2000 link -> ../x")
+            == "link"
+        )
+        # Variant without user id field
+        assert (
+            parser.parse_name("-rw-r--r--   1   200          4604 Dec 19 23:11 file")
+            == "file"
+        )
+        # The name is extracted without checking the other fields.
+        assert (
+            parser.parse_name(
+                "drwxr-sr-x   2 45854    200           512 Max  4  2000 chemeng"
+            )
+            == "chemeng"
+        )
+        for line in [
+            "07-17-00  02:08PM             12266720 test.exe",
+            "drwxr-sr-    2 45854    200           512 May  4  2000 chemeng",
+            "drwxr-sr-x   2 45854    200           512 May 29  2000 "
+            "os1 -> os2 -> os3",
+        ]:
+            with pytest.raises(ftputil.error.ParserError):
+                parser.parse_name(line)
+
     #
     # Microsoft parser
     #
@@ -487,6 +522,19 @@ class TestParsers:
         ]
         self._test_invalid_lines(ftputil.stat.MSParser, lines)
 
+    def test_ms_parse_name(self):
+        parser = ftputil.stat.MSParser()
+        assert (
+            parser.parse_name("07-27-01  11:16AM       <DIR>          Test dir")
+            == "Test dir"
+        )
+        with pytest.raises(ftputil.error.ParserError):
+            parser.parse_name("07-27-01  11:16AM")
+
+    def test_default_parse_name(self):
+        """Custom parsers without `parse_name` aren't parsed lazily."""
+        assert ftputil.stat.Parser().parse_name("some line") is None
+
     #
     # The following code checks if the decision logic in the Unix line parser
     # for determining the year works.
@@ -688,17 +736,9 @@ class TestLstatAndStat:
             Call("pwd", result="/"),
             Call("cwd", args=("/",)),
             Call("cwd", args=("/",)),
-            # First try with unix parser, but this parser can't parse this
-            # line.
-            Call(
-                "dir",
-                args=("",),
-                result="07-17-00  02:08PM             12266720 some_file",
-            ),
-            Call("cwd", args=("/",)),
-            Call("cwd", args=("/",)),
-            Call("cwd", args=("/",)),
-            # Now try with MS parser.
+            # The unix parser can't parse this line, so the parser
+            # detection switches to the MS parser without a second
+            # `LIST` command.
             Call(
                 "dir",
                 args=("",),
@@ -762,17 +802,9 @@ class TestLstatAndStat:
             Call("pwd", result="/"),
             Call("cwd", args=("/",)),
             Call("cwd", args=("/",)),
-            # First try with unix parser, but this parser can't parse this
-            # line.
-            Call(
-                "dir",
-                args=("",),
-                result="10-23-01  03:25PM       <DIR>          some_dir",
-            ),
-            Call("cwd", args=("/",)),
-            Call("cwd", args=("/",)),
-            Call("cwd", args=("/",)),
-            # Now try with MS parser.
+            # The unix parser can't parse this line, so the parser
+            # detection switches to the MS parser without a second
+            # `LIST` command.
             Call(
                 "dir",
                 args=("",),
@@ -809,24 +841,17 @@ class TestLstatAndStat:
     def test_stat_following_link(self):
         """Test `stat` when invoked on a link."""
         # Simple link
+        dir_lines = (
+            "lrwxrwxrwx   1 45854   200   21 Jan 19  2002 link -> link_target\n"
+            "-rw-r--r--   1 45854   200   4604 Jan 19 23:11 link_target"
+        )
+        # The listing of `/` is reused for the lookup of the link target.
         script = [
             Call("__init__"),
             Call("pwd", result="/"),
             Call("cwd", args=("/",)),
             Call("cwd", args=("/",)),
-            Call(
-                "dir",
-                args=("",),
-                result="lrwxrwxrwx   1 45854   200   21 Jan 19  2002 link -> link_target",
-            ),
-            Call("cwd", args=("/",)),
-            Call("cwd", args=("/",)),
-            Call("cwd", args=("/",)),
-            Call(
-                "dir",
-                args=("",),
-                result="-rw-r--r--   1 45854   200   4604 Jan 19 23:11 link_target",
-            ),
+            Call("dir", args=("",), result=dir_lines),
             Call("cwd", args=("/",)),
             Call("close"),
         ]
@@ -840,24 +865,12 @@ class TestLstatAndStat:
             "lrwxrwxrwx   1 45854   200   14   Jan 19  2002 link -> link_target\n"
             "-rw-r--r--   1 45854   200   4604 Jan 19 23:11 link_target"
         )
-        # Note that only one `dir` call would be needed in case of an enabled
-        # cache.
+        # All lookups in `/` use the same listing.
         script = [
             Call("__init__"),
             Call("pwd", result="/"),
             Call("cwd", args=("/",)),
             Call("cwd", args=("/",)),
-            # Look up `/link_link`.
-            Call("dir", args=("",), result=dir_lines),
-            Call("cwd", args=("/",)),
-            Call("cwd", args=("/",)),
-            Call("cwd", args=("/",)),
-            # Look up `/link`.
-            Call("dir", args=("",), result=dir_lines),
-            Call("cwd", args=("/",)),
-            Call("cwd", args=("/",)),
-            Call("cwd", args=("/",)),
-            # Look up `/link_target`.
             Call("dir", args=("",), result=dir_lines),
             Call("cwd", args=("/",)),
             Call("close"),
@@ -876,20 +889,8 @@ class TestLstatAndStat:
             Call("pwd", result="/"),
             Call("cwd", args=("/",)),
             Call("cwd", args=("/",)),
-            # This dir finds the `bad_link1` name requested in the `stat` call.
-            Call("dir", args=("",), result=dir_lines),
-            Call("cwd", args=("/",)),
-            Call("cwd", args=("/",)),
-            Call("cwd", args=("/",)),
-            # Look up link target `bad_link2`.
-            Call("dir", args=("",), result=dir_lines),
-            Call("cwd", args=("/",)),
-            Call("cwd", args=("/",)),
-            Call("cwd", args=("/",)),
-            # FIXME: `stat` looks up the link target pointed to by `bad_link2`,
-            # which is `bad_link1`. Only here ftputil notices the recursive
-            # link chain. Obviously the start of the link chain hadn't been
-            # stored in `visited_paths` (see also ticket #108).
+            # This listing is used for all lookups of `bad_link1` and
+            # `bad_link2`.
             Call("dir", args=("",), result=dir_lines),
             Call("cwd", args=("/",)),
             Call("close"),
@@ -913,20 +914,14 @@ class TestLstatAndStat:
                 "dir", args=("",), result="10-23-01  03:25PM       <DIR>          home"
             ),
             Call("cwd", args=("/",)),
-            Call("cwd", args=("/",)),
-            Call("cwd", args=("/",)),
-            Call(
-                "dir", args=("",), result="10-23-01  03:25PM       <DIR>          home"
-            ),
-            Call("cwd", args=("/",)),
             Call("close"),
         ]
         with test_base.ftp_host_factory(scripted_session.factory(script)) as host:
             host.stat_cache.disable()
             assert host._stat._allow_parser_switching is True
-            # With these directory contents, we get a `ParserError` for the
-            # Unix parser first, so `_allow_parser_switching` can be switched
-            # off no matter whether we got a `PermanentError` afterward or not.
+            # With these directory contents, only the MS parser can parse the
+            # listing, so `_allow_parser_switching` is switched off no matter
+            # whether we got a `PermanentError` afterward or not.
             with pytest.raises(ftputil.error.PermanentError):
                 host.lstat("/nonexistent")
             assert host._stat._allow_parser_switching is False
@@ -969,14 +964,6 @@ class TestLstatAndStat:
                 result="07-17-00  02:08PM             12266720 some_file",
             ),
             Call("cwd", args=("/",)),
-            Call("cwd", args=("/",)),
-            Call("cwd", args=("/",)),
-            Call(
-                "dir",
-                args=("",),
-                result="07-17-00  02:08PM             12266720 some_file",
-            ),
-            Call("cwd", args=("/",)),
             Call("close"),
         ]
         with test_base.ftp_host_factory(scripted_session.factory(script)) as host:
@@ -991,6 +978,41 @@ class TestLstatAndStat:
             assert stat_result._st_name == "some_file"
             assert stat_result.st_size == 12266720
 
+    def test_parser_switching_invalidates_unconfirmed_dirs(self):
+        """
+        After switching the parser, the cache entries from listings made
+        with the previous parser are invalidated, but no others.
+        """
+        script = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            Call("cwd", args=("/",)),
+            Call("cwd", args=("/dir",)),
+            Call(
+                "dir",
+                args=("",),
+                result="07-17-00  02:08PM             12266720 some_file",
+            ),
+            Call("cwd", args=("/",)),
+            Call("close"),
+        ]
+        with test_base.ftp_host_factory(scripted_session.factory(script)) as host:
+            host.stat_cache["/other/file"] = "stat result"
+            host.stat_cache["/unrelated/file"] = "stat result"
+            # Pretend that `/other` was listed with the Unix parser before
+            # and the parser detection was inconclusive.
+            host._stat._dirs_with_unconfirmed_parser.add("/other")
+            host._stat._parser_detection = (host._stat._parser, 0.5)
+            # Avoid listing `/` for the `isdir` check in `lstat`.
+            with unittest.mock.patch.object(host.path, "isdir", return_value=True):
+                stat_result = host.lstat("/dir/some_file")
+            assert isinstance(host._stat._parser, ftputil.stat.MSParser)
+            assert stat_result.st_size == 12266720
+            assert "/other/file" not in host.stat_cache
+            assert "/unrelated/file" in host.stat_cache
+            assert "/dir/some_file" in host.stat_cache
+            assert not host._stat._dirs_with_unconfirmed_parser
+
     def test_parser_switching_regarding_empty_dir(self):
         """Test switching of parser if a directory is empty."""
         script = [
@@ -1013,6 +1035,61 @@ class TestLstatAndStat:
             assert host._stat._allow_parser_switching is True
             assert isinstance(host._stat._parser, ftputil.stat.UnixParser)
 
+    def test_parser_detection(self):
+        """Test the detection of the MS parser from the first listing."""
+        script = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            Call("cwd", args=("/",)),
+            Call("cwd", args=("/",)),
+            Call(
+                "dir",
+                args=("",),
+                result="07-17-00  02:08PM             12266720 some_file\n"
+                "10-23-01  03:25PM       <DIR>          some_dir",
+            ),
+            Call("cwd", args=("/",)),
+            Call("close"),
+        ]
+        with test_base.ftp_host_factory(scripted_session.factory(script)) as host:
+            host.stat_cache.disable()
+            assert host.parser_detection is None
+            assert host.listdir("/") == ["some_file", "some_dir"]
+            parser, confidence = host.parser_detection
+            assert isinstance(parser, ftputil.stat.MSParser)
+            assert parser is host._stat._parser
+            assert confidence == 1.0
+            assert host._stat._allow_parser_switching is False
+
+    def test_parser_detection_confidence(self):
+        """Test the confidence for a listing with an unparsable line."""
+        script = [Call("__init__"), Call("pwd", result="/"), Call("close")]
+        lines = [
+            "total 14",
+            "-rw-r--r--   1 45854   200   4604 Jan 19 23:11 file1",
+            "-rw-r--r--   1 45854   200   4604 Jan 19 23:11 file2",
+            "-rw-r--r--   1 45854   200   4604 Jan 19 23:11 file3",
+            "garbage",
+        ]
+        with test_base.ftp_host_factory(scripted_session.factory(script)) as host:
+            host._stat._detect_parser(lines)
+            parser, confidence = host.parser_detection
+            assert isinstance(parser, ftputil.stat.UnixParser)
+            # The "total" line is ignored.
+            assert confidence == 0.75
+            # Not decisive, so keep the possibility to switch parsers.
+            assert host._stat._allow_parser_switching is True
+
+    def test_set_parser_resets_detection(self):
+        script = [Call("__init__"), Call("pwd", result="/"), Call("close")]
+        with test_base.ftp_host_factory(scripted_session.factory(script)) as host:
+            host._stat._detect_parser(
+                ["-rw-r--r--   1 45854   200   4604 Jan 19 23:11 file"]
+            )
+            assert host.parser_detection is not None
+            host.set_parser(ftputil.stat.MSParser())
+            assert host.parser_detection is None
+
 
 class TestListdir:
     """Test `FTPHost.listdir`."""
@@ -1060,3 +1137,189 @@ class TestListdir:
             for name in expected_names:
                 assert name in remote_file_list
             assert len(host.stat_cache) == 0
+
+    def test_lazy_entries(self):
+        """
+        `lstat` stores unparsed entries for the other lines of the listing in
+        the cache, which are parsed when needed.
+        """
+        script = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            Call("cwd", args=("/",)),
+            Call("cwd", args=("/",)),
+            Call(
+                "dir",
+                args=("",),
+                result="drwxr-sr-x   2 45854   200    512 Jan  3 17:17 download\n"
+                "-rw-r--r--   1 45854   200   4604 Jan 19 23:11 index.html",
+            ),
+            Call("cwd", args=("/",)),
+            Call("close"),
+        ]
+        with test_base.ftp_host_factory(scripted_session.factory(script)) as host:
+            stat_result = host.lstat("/index.html")
+            assert isinstance(stat_result, ftputil.stat.StatResult)
+            assert stat_result.st_size == 4604
+            entry = host.stat_cache._cache["/download"]
+            assert isinstance(entry, ftputil.stat_cache.LazyEntry)
+            # The time shift is read when the entry is parsed.
+            host.set_time_shift(3600.0)
+            expected_stat_result = ftputil.stat.UnixParser().parse_line(
+                "drwxr-sr-x   2 45854   200    512 Jan  3 17:17 download", 3600.0
+            )
+            assert entry.value().st_mtime == expected_stat_result.st_mtime
+
+    def _listdir_script(self, listing):
+        return [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            Call("cwd", args=("/",)),
+            Call("cwd", args=("/",)),
+            Call("dir", args=("",), result=listing),
+            Call("cwd", args=("/",)),
+            Call("close"),
+        ]
+
+    def test_listdir_doesnt_parse_lines(self):
+        """
+        If the parser can extract the names, `listdir` doesn't call
+        `parse_line`.
+        """
+        script = self._listdir_script(
+            "drwxr-sr-x   2 45854   200    512 Jan  3 17:17 download\n"
+            "-rw-r--r--   1 45854   200   4604 Jan 19 23:11 index.html"
+        )
+        with test_base.ftp_host_factory(scripted_session.factory(script)) as host:
+            # Without parser detection, which parses a sample of the lines
+            host.set_parser(ftputil.stat.UnixParser())
+            with unittest.mock.patch.object(
+                ftputil.stat.UnixParser,
+                "parse_line",
+                autospec=True,
+                side_effect=ftputil.stat.UnixParser.parse_line,
+            ) as parse_line_mock:
+                assert host.listdir("/") == ["download", "index.html"]
+                assert parse_line_mock.call_count == 0
+                # The line is parsed when the stat result is needed.
+                assert host.lstat("/index.html").st_size == 4604
+                assert parse_line_mock.call_count == 1
+
+    def test_listdir_with_malformed_line(self):
+        """`listdir` raises a `ParserError` if it can't extract a name."""
+        script = self._listdir_script("-rw-r--r--   1 45854   200   4604 index.html")
+        with test_base.ftp_host_factory(scripted_session.factory(script)) as host:
+            host.set_parser(ftputil.stat.UnixParser())
+            with pytest.raises(ftputil.error.ParserError):
+                host.listdir("/")
+
+
+class TestStatMany:
+    """Test `FTPHost.lstat_many` and `FTPHost.stat_many`."""
+
+    dir1_lines = (
+        "-rw-r--r--   1 45854   200   4604 Jan 19 23:11 a\n"
+        "-rw-r--r--   1 45854   200   1234 Jan 19 23:11 b\n"
+        "lrwxrwxrwx   1 45854   200     10 Jan 19 23:11 link -> ../dir2/c\n"
+        "lrwxrwxrwx   1 45854   200      7 Jan 19 23:11 bad_link -> missing"
+    )
+
+    dir2_lines = "-rw-r--r--   1 45854   200     42 Jan 19 23:11 c"
+
+    @staticmethod
+    def _listing_calls(dir_path, lines):
+        """Return the calls for listing `dir_path`."""
+        return [
+            Call("cwd", args=("/",)),
+            Call("cwd", args=(dir_path,)),
+            Call("dir", args=("",), result=lines),
+            Call("cwd", args=("/",)),
+        ]
+
+    def test_lstat_many(self):
+        """Each parent directory is listed only once."""
+        script = (
+            [Call("__init__"), Call("pwd", result="/")]
+            + self._listing_calls("/dir1", self.dir1_lines)
+            + self._listing_calls("/dir2", self.dir2_lines)
+            + [
+                Call("cwd", args=("/",)),
+                Call("cwd", args=("/nodir",), result=ftplib.error_perm("550 no")),
+                Call("cwd", args=("/",)),
+                Call("close"),
+            ]
+        )
+        with test_base.ftp_host_factory(scripted_session.factory(script)) as host:
+            paths = ["/dir1/a", "dir1/b", "/dir1/missing", "/dir2/c", "/nodir/x"]
+            results = host.lstat_many(paths)
+            assert list(results) == paths
+            assert results["/dir1/a"].st_size == 4604
+            assert results["dir1/b"].st_size == 1234
+            assert results["/dir2/c"].st_size == 42
+            assert results["/dir1/missing"] is None
+            assert results["/nodir/x"] is None
+            # Now all paths come from the cache.
+            assert host.lstat_many(["/dir1/b", "/dir2/c"]) == {
+                "/dir1/b": results["dir1/b"],
+                "/dir2/c": results["/dir2/c"],
+            }
+
+    def test_stat_many(self):
+        """Links are followed, listing each directory only once."""
+        script = (
+            [Call("__init__"), Call("pwd", result="/")]
+            + self._listing_calls("/dir1", self.dir1_lines)
+            + self._listing_calls("/dir2", self.dir2_lines)
+            + [Call("close")]
+        )
+        with test_base.ftp_host_factory(scripted_session.factory(script)) as host:
+            host.stat_cache.disable()
+            results = host.stat_many(["/dir1/a", "/dir1/link", "/dir1/bad_link"])
+        assert results["/dir1/a"].st_size == 4604
+        assert results["/dir1/link"].st_size == 42
+        assert results["/dir1/bad_link"] is None
+
+    def test_stat_many_with_recursive_links(self):
+        lines = (
+            "lrwxrwxrwx   1 45854   200   7    Jan 19  2002 bad_link1 -> bad_link2\n"
+            "lrwxrwxrwx   1 45854   200   14   Jan 19  2002 bad_link2 -> bad_link1"
+        )
+        script = (
+            [Call("__init__"), Call("pwd", result="/")]
+            + self._listing_calls("/dir", lines)
+            + [Call("close")]
+        )
+        with test_base.ftp_host_factory(scripted_session.factory(script)) as host:
+            with pytest.raises(ftputil.error.RecursiveLinksError):
+                host.stat_many(["/dir/bad_link1"])
+
+    def test_root_dir(self):
+        script = [Call("__init__"), Call("pwd", result="/"), Call("close")]
+        with test_base.ftp_host_factory(scripted_session.factory(script)) as host:
+            with pytest.raises(ftputil.error.RootDirError):
+                host.lstat_many(["/"])
+
+    def test_parallel_listing(self):
+        """With several workers, the directories are listed by the workers."""
+        host_script = [Call("__init__"), Call("pwd", result="/"), Call("close")]
+        worker_script = [Call("__init__"), Call("pwd", result="/"), Call("close")]
+        listings = {"/dir1": self.dir1_lines.splitlines(), "/dir2": [self.dir2_lines]}
+        listing_hosts = []
+
+        def _dir(host, path):
+            listing_hosts.append(host)
+            if path not in listings:
+                raise ftputil.error.PermanentError("550 no such directory")
+            return listings[path]
+
+        multisession_factory = scripted_session.factory(
+            host_script, worker_script, worker_script
+        )
+        with test_base.ftp_host_factory(multisession_factory) as host:
+            with unittest.mock.patch.object(ftputil.host.FTPHost, "_dir", _dir):
+                results = host.lstat_many(["/dir1/a", "/dir2/c", "/nodir/x"], workers=2)
+            assert host not in listing_hosts
+        assert len(listing_hosts) == 3
+        assert results["/dir1/a"].st_size == 4604
+        assert results["/dir2/c"].st_size == 42
+        assert results["/nodir/x"] is None
@@ -3,6 +3,7 @@
 # See the file LICENSE for licensing terms.
 
 import time
+import unittest.mock
 
 import pytest
 
@@ -44,6 +45,31 @@ class TestStatCache:
         assert "/path1" in self.cache
         assert "/path2" not in self.cache
 
+    def test_lazy_entry(self):
+        calls = []
+
+        def parse(line):
+            calls.append(line)
+            return line.upper()
+
+        self.cache["/path"] = ftputil.stat_cache.LazyEntry(parse, "line")
+        # Checking for the path doesn't compute the value.
+        assert "/path" in self.cache
+        assert calls == []
+        assert self.cache["/path"] == "LINE"
+        assert self.cache["/path"] == "LINE"
+        assert calls == ["line"]
+
+    def test_failing_lazy_entry(self):
+        def parse(line):
+            raise ftputil.error.ParserError("can't parse {}".format(line))
+
+        self.cache["/path"] = ftputil.stat_cache.LazyEntry(parse, "line")
+        with pytest.raises(ftputil.error.ParserError):
+            self.cache["/path"]
+        # The failing entry has been removed.
+        assert "/path" not in self.cache
+
     def test_len(self):
         assert len(self.cache) == 0
         self.cache["/path1"] = "test1"
@@ -118,3 +144,202 @@ class TestStatCache:
             # If bug #38 was present, this would raise an `IndexError`.
             items = host.listdir(host.curdir)
             assert items == ["download", "dir with spaces", "link", "index.html"]
+
+
+class FakeTime:
+    """Replacement for `time.time` which only advances explicitly."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def fake_time():
+    fake_time_ = FakeTime()
+    with unittest.mock.patch("time.time", fake_time_.time):
+        yield fake_time_
+
+
+class TestMaxAgeRules:
+    def setup_method(self, method):
+        self.cache = ftputil.stat_cache.StatCache()
+
+    def test_longest_prefix_wins(self, fake_time):
+        self.cache.max_age = 10
+        self.cache.set_max_age("/archive", None)
+        self.cache.set_max_age("/archive/inbox/", 1)
+        for path in ["/other/file", "/archive/file", "/archive/inbox/file"]:
+            self.cache[path] = path
+        fake_time.now += 5
+        assert "/other/file" in self.cache
+        assert "/archive/file" in self.cache
+        assert "/archive/inbox/file" not in self.cache
+        fake_time.now += 1000
+        assert "/other/file" not in self.cache
+        assert "/archive/file" in self.cache
+        # Without the rule, the entry expires.
+        self.cache.remove_max_age("/archive")
+        assert "/archive/file" not in self.cache
+
+    def test_prefix_matches_whole_names(self):
+        self.cache.set_max_age("/arch", 1)
+        assert self.cache.max_age_for("/arch/file") == 1
+        assert self.cache.max_age_for("/archive/file") is None
+
+    def test_relative_prefix(self):
+        with pytest.raises(ValueError):
+            self.cache.set_max_age("archive", 1)
+        with pytest.raises(ValueError):
+            self.cache.remove_max_age("archive")
+
+
+class TestAdaptiveMaxAge:
+    def setup_method(self, method):
+        self.cache = ftputil.stat_cache.StatCache()
+        self.cache.enable_adaptive_max_age(min_age=2, max_age=16)
+
+    def test_max_age_adapts(self):
+        assert self.cache.max_age_for("/dir/file") == 2
+        lines = ["line1", "line2"]
+        self.cache.note_listing("/dir", lines)
+        assert self.cache.max_age_for("/dir/file") == 2
+        # The maximum age grows while the directory doesn't change ...
+        for expected_max_age in [4, 8, 16, 16]:
+            self.cache.note_listing("/dir", lines)
+            assert self.cache.max_age_for("/dir/file") == expected_max_age
+        # ... and shrinks when it does.
+        self.cache.note_listing("/dir", ["line1"])
+        assert self.cache.max_age_for("/dir/file") == 8
+        # Other directories are independent.
+        assert self.cache.max_age_for("/other/file") == 2
+
+    def test_rules_take_precedence(self):
+        self.cache.set_max_age("/dir", 100)
+        self.cache.note_listing("/dir", [])
+        assert self.cache.max_age_for("/dir/file") == 100
+
+    def test_disable(self):
+        self.cache.max_age = 50
+        self.cache.disable_adaptive_max_age()
+        assert self.cache.max_age_for("/dir/file") == 50
+
+    def test_invalid_range(self):
+        with pytest.raises(ValueError):
+            self.cache.enable_adaptive_max_age(min_age=10, max_age=5)
+        with pytest.raises(ValueError):
+            self.cache.enable_adaptive_max_age(min_age=0)
+
+    def test_listing_updates_max_age(self):
+        """`listdir` reports the listing to the cache."""
+        script = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            Call("cwd", args=("/",)),
+            Call("cwd", args=("/",)),
+            Call(
+                "dir",
+                args=("",),
+                result="-rw-r--r--   1 45854   200   4604 Jan 19 23:11 index.html",
+            ),
+            Call("cwd", args=("/",)),
+            Call("close"),
+        ]
+        with test_base.ftp_host_factory(scripted_session.factory(script)) as host:
+            host.stat_cache.enable_adaptive_max_age(min_age=2, max_age=16)
+            with unittest.mock.patch.object(
+                host.stat_cache, "note_listing"
+            ) as note_listing_mock:
+                host.listdir("/")
+            note_listing_mock.assert_called_once_with(
+                "/", ["-rw-r--r--   1 45854   200   4604 Jan 19 23:11 index.html"]
+            )
+
+
+class TestTreeOperations:
+    def setup_method(self, method):
+        self.cache = ftputil.stat_cache.StatCache()
+        self._fill_cache()
+
+    def _fill_cache(self):
+        for path in [
+            "/a",
+            "/a/b",
+            "/a/b/file1",
+            "/a/b/c/file2",
+            "/a/file3",
+            "/ab/file4",
+            "/other",
+        ]:
+            self.cache[path] = path
+
+    def _paths(self):
+        return sorted(self.cache._cache)
+
+    def test_invalidate_tree(self):
+        self.cache.invalidate_tree("/a/b")
+        assert self._paths() == ["/a", "/a/file3", "/ab/file4", "/other"]
+        # The index doesn't contain the removed paths anymore.
+        assert self.cache._tree_paths("/a") == ["/a", "/a/file3"]
+        self.cache.invalidate_tree("/a")
+        assert self._paths() == ["/ab/file4", "/other"]
+        # Missing paths are ignored.
+        self.cache.invalidate_tree("/missing")
+
+    def test_invalidate_tree_below_uncached_directory(self):
+        """Paths are found even if their directory isn't cached."""
+        self.cache.invalidate("/a/b")
+        self.cache.invalidate_tree("/a")
+        assert self._paths() == ["/ab/file4", "/other"]
+
+    def test_rename_tree(self, fake_time):
+        # Set the entries again with the fake time.
+        self._fill_cache()
+        self.cache["/new/stale"] = "stale"
+        fake_time.now += 10
+        self.cache.rename_tree("/a", "/new")
+        assert self._paths() == [
+            "/ab/file4",
+            "/new/b",
+            "/new/b/c/file2",
+            "/new/b/file1",
+            "/new/file3",
+            "/other",
+        ]
+        # The entries are moved, not refreshed.
+        assert self.cache._age("/new/b/file1") == 10
+        assert self.cache["/new/b/file1"] == "/a/b/file1"
+        # The index is updated.
+        self.cache.invalidate_tree("/new/b")
+        assert self._paths() == ["/ab/file4", "/new/file3", "/other"]
+
+    def test_index_is_rebuilt(self):
+        """The index doesn't grow much larger than the cache."""
+        cache = ftputil.stat_cache.StatCache()
+        cache.resize(10)
+        for i in range(100):
+            cache["/dir/{}".format(i)] = i
+        assert len(cache) == 10
+        assert cache._index_size <= 2 * 11
+        cache.invalidate_tree("/dir")
+        assert len(cache) == 0
+
+
+class TestHostCacheUpdates:
+    def test_rename_keeps_entries(self):
+        script = [
+            Call("__init__"),
+            Call("pwd", result="/"),
+            Call("cwd", args=("/",)),
+            Call("rename", args=("/a", "/b")),
+            Call("close"),
+        ]
+        with test_base.ftp_host_factory(scripted_session.factory(script)) as host:
+            host.stat_cache["/a"] = "a"
+            host.stat_cache["/a/file"] = "file"
+            host.rename("/a", "/b")
+            assert "/a" not in host.stat_cache
+            assert "/a/file" not in host.stat_cache
+            assert host.stat_cache["/b/file"] == "file"
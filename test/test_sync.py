@@ -2,12 +2,22 @@
 # and ftputil contributors (see `doc/contributors.txt`)
 # See the file LICENSE for licensing terms.
 
+import concurrent.futures
 import io
+import json
 import ntpath
 import os
 import shutil
+import threading
+import unittest.mock
+
+import pytest
 
 import ftputil
+import ftputil.error
+import ftputil.file_transfer
+import ftputil.rate_limit
+import ftputil.stat
 import ftputil.sync
 
 
@@ -114,3 +124,467 @@ class TestUploadFromWindows:
         # If the following call raises any `AssertionError`s, the
         # test framework will catch them and show them.
         syncer.sync(local_root, "not_used_by_ArgumentCheckingFTPHost")
+
+
+class TestSyncOptions:
+    """Test conditional copying, deletion and preservation of mtimes."""
+
+    def _make_tree(self, root):
+        (root / "dir1").mkdir(parents=True)
+        (root / "file1").write_bytes(b"content1")
+        (root / "dir1" / "file2").write_bytes(b"content2")
+        # Make the source files clearly older than the copies.
+        for path in [root / "file1", root / "dir1" / "file2"]:
+            os.utime(str(path), (1_000_000_000, 1_000_000_000))
+
+    def _syncer(self, **kwargs):
+        return ftputil.sync.Syncer(
+            ftputil.sync.LocalHost(), ftputil.sync.LocalHost(), **kwargs
+        )
+
+    def test_conditional_copy(self, tmp_path):
+        source_dir = tmp_path / "source"
+        target_dir = tmp_path / "target"
+        self._make_tree(source_dir)
+        syncer = self._syncer(conditional=True)
+        syncer.sync(str(source_dir), str(target_dir))
+        assert (target_dir / "dir1" / "file2").read_bytes() == b"content2"
+        # Nothing changed, so nothing should be copied.
+        with unittest.mock.patch(
+            "ftputil.file_transfer.copyfileobj"
+        ) as copyfileobj_mock:
+            syncer.sync(str(source_dir), str(target_dir))
+        copyfileobj_mock.assert_not_called()
+        # Copy files with a different size, even if they're older.
+        (source_dir / "file1").write_bytes(b"new content1")
+        os.utime(str(source_dir / "file1"), (1_000_000_000, 1_000_000_000))
+        syncer.sync(str(source_dir), str(target_dir))
+        assert (target_dir / "file1").read_bytes() == b"new content1"
+
+    def test_unconditional_copy(self, tmp_path):
+        source_dir = tmp_path / "source"
+        target_dir = tmp_path / "target"
+        self._make_tree(source_dir)
+        syncer = self._syncer()
+        syncer.sync(str(source_dir), str(target_dir))
+        with unittest.mock.patch(
+            "ftputil.file_transfer.copyfileobj"
+        ) as copyfileobj_mock:
+            syncer.sync(str(source_dir), str(target_dir))
+        assert copyfileobj_mock.call_count == 2
+
+    @pytest.mark.parametrize("workers", [1, 2])
+    def test_checksum_comparison(self, tmp_path, workers):
+        source_dir = tmp_path / "source"
+        target_dir = tmp_path / "target"
+        self._make_tree(source_dir)
+        syncer = self._syncer(conditional=True, compare="checksum", workers=workers)
+        syncer.sync(str(source_dir), str(target_dir))
+        # Same size and older than the target, but different content
+        (source_dir / "file1").write_bytes(b"CONTENT1")
+        os.utime(str(source_dir / "file1"), (1_000_000_000, 1_000_000_000))
+        syncer.sync(str(source_dir), str(target_dir))
+        assert (target_dir / "file1").read_bytes() == b"CONTENT1"
+        # Same content, but newer than the target
+        os.utime(str(source_dir / "dir1" / "file2"))
+        with unittest.mock.patch(
+            "ftputil.file_transfer.copyfileobj"
+        ) as copyfileobj_mock:
+            syncer.sync(str(source_dir), str(target_dir))
+        copyfileobj_mock.assert_not_called()
+
+    def test_checksum_fallback_to_mtime(self, tmp_path):
+        source_dir = tmp_path / "source"
+        target_dir = tmp_path / "target"
+        self._make_tree(source_dir)
+        syncer = self._syncer(conditional=True, compare="checksum")
+        syncer.sync(str(source_dir), str(target_dir))
+        with unittest.mock.patch.object(
+            syncer,
+            "_checksum",
+            side_effect=ftputil.error.CommandNotImplementedError("no checksums"),
+        ) as checksum_mock, unittest.mock.patch(
+            "ftputil.file_transfer.copyfileobj"
+        ) as copyfileobj_mock:
+            syncer.sync(str(source_dir), str(target_dir))
+        # The syncer compares the modification times instead. Both
+        # files have the same size, so checksums were tried for both.
+        # (`FTPHost.checksum` remembers unsupported commands, so for
+        # remote hosts a repeated attempt doesn't send commands.)
+        assert checksum_mock.call_count == 2
+        copyfileobj_mock.assert_not_called()
+
+    @staticmethod
+    def _stat_result(mtime, precision):
+        stat_result = ftputil.stat.StatResult((0,) * 6 + (100, None, mtime, None))
+        stat_result._st_mtime_precision = precision
+        return stat_result
+
+    @pytest.mark.parametrize("precision", [60.0, 86400.0])
+    def test_imprecise_source_mtime(self, precision):
+        """
+        If the source mtime is less precise than the target mtime,
+        the actual source mtime may be later than the target mtime.
+        In this case, the target isn't up to date.
+        """
+        syncer = self._syncer(conditional=True)
+        source_mtime = 1_000_000 * precision
+        source_stat = self._stat_result(source_mtime, precision)
+        # Target mtime within the possible source mtimes
+        target_stat = self._stat_result(source_mtime + precision / 2, 1.0)
+        assert not syncer._is_up_to_date(source_stat, target_stat)
+        # Target mtime after all possible source mtimes
+        target_stat = self._stat_result(source_mtime + precision, 1.0)
+        assert syncer._is_up_to_date(source_stat, target_stat)
+
+    def test_invalid_compare_arguments(self):
+        with pytest.raises(ValueError):
+            self._syncer(compare="size")
+        with pytest.raises(ValueError):
+            self._syncer(checksum_algorithm="sha3")
+
+    def test_preserve_mtime(self, tmp_path):
+        source_dir = tmp_path / "source"
+        target_dir = tmp_path / "target"
+        self._make_tree(source_dir)
+        syncer = self._syncer(preserve_mtime=True)
+        syncer.sync(str(source_dir), str(target_dir))
+        assert os.path.getmtime(str(target_dir / "file1")) == 1_000_000_000
+        assert os.path.getmtime(str(target_dir / "dir1" / "file2")) == 1_000_000_000
+
+    def test_delete(self, tmp_path):
+        source_dir = tmp_path / "source"
+        target_dir = tmp_path / "target"
+        self._make_tree(source_dir)
+        (target_dir / "dir1" / "extra_dir").mkdir(parents=True)
+        (target_dir / "dir1" / "extra_dir" / "extra_file").write_bytes(b"")
+        (target_dir / "extra_file").write_bytes(b"")
+        # Without `delete`, extraneous items are kept.
+        self._syncer().sync(str(source_dir), str(target_dir))
+        assert (target_dir / "extra_file").exists()
+        self._syncer(delete=True).sync(str(source_dir), str(target_dir))
+        assert sorted(os.listdir(str(target_dir))) == ["dir1", "file1"]
+        assert os.listdir(str(target_dir / "dir1")) == ["file2"]
+
+
+class CountingLocalHost(ftputil.sync.LocalHost):
+    """
+    `LocalHost` which counts the calls of methods that would cause
+    network traffic on a remote host.
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    def __getattr__(self, attr):
+        if attr in ["listdir", "stat", "lstat", "mkdir", "remove"]:
+            self.calls.append(attr)
+        return super().__getattr__(attr)
+
+
+class TestManifest:
+    def _make_tree(self, root):
+        (root / "dir1").mkdir(parents=True)
+        (root / "file1").write_bytes(b"content1")
+        (root / "dir1" / "file2").write_bytes(b"content2")
+
+    def _sync(self, source_dir, target_dir, manifest, **kwargs):
+        target = CountingLocalHost()
+        syncer = ftputil.sync.Syncer(
+            ftputil.sync.LocalHost(), target, manifest=manifest, **kwargs
+        )
+        with unittest.mock.patch(
+            "ftputil.file_transfer.copyfileobj",
+            wraps=ftputil.file_transfer.copyfileobj,
+        ) as copyfileobj_mock:
+            syncer.sync(str(source_dir), str(target_dir))
+        return copyfileobj_mock.call_count, target.calls
+
+    def test_only_changed_items_are_synced(self, tmp_path):
+        source_dir = tmp_path / "source"
+        target_dir = tmp_path / "target"
+        manifest_path = tmp_path / "manifest.json"
+        self._make_tree(source_dir)
+        copy_count, _ = self._sync(source_dir, target_dir, str(manifest_path))
+        assert copy_count == 2
+        assert (target_dir / "dir1" / "file2").read_bytes() == b"content2"
+        state = json.loads(manifest_path.read_text())
+        assert sorted(state["entries"]) == ["dir1", "dir1/file2", "file1"]
+        # No temporary files are left behind.
+        assert sorted(os.listdir(str(tmp_path))) == [
+            "manifest.json",
+            "source",
+            "target",
+        ]
+        # Nothing changed, so the target isn't touched apart from
+        # checking the target directory itself.
+        copy_count, target_calls = self._sync(
+            source_dir, target_dir, str(manifest_path)
+        )
+        assert copy_count == 0
+        assert "listdir" not in target_calls
+        assert "stat" not in target_calls
+        # Only the changed file is copied.
+        (source_dir / "dir1" / "file2").write_bytes(b"new content2")
+        copy_count, _ = self._sync(source_dir, target_dir, str(manifest_path))
+        assert copy_count == 1
+        assert (target_dir / "dir1" / "file2").read_bytes() == b"new content2"
+
+    def test_delete(self, tmp_path):
+        source_dir = tmp_path / "source"
+        target_dir = tmp_path / "target"
+        manifest_path = tmp_path / "manifest.json"
+        self._make_tree(source_dir)
+        self._sync(source_dir, target_dir, str(manifest_path))
+        shutil.rmtree(str(source_dir / "dir1"))
+        copy_count, _ = self._sync(
+            source_dir, target_dir, str(manifest_path), delete=True
+        )
+        assert copy_count == 0
+        assert os.listdir(str(target_dir)) == ["file1"]
+        state = json.loads(manifest_path.read_text())
+        assert sorted(state["entries"]) == ["file1"]
+
+    def test_hash(self, tmp_path):
+        """
+        With hashes, a file whose mtime changed but whose content
+        didn't isn't copied again.
+        """
+        source_dir = tmp_path / "source"
+        target_dir = tmp_path / "target"
+        manifest = ftputil.sync.Manifest(
+            str(tmp_path / "manifest.json"), hash_name="sha256"
+        )
+        self._make_tree(source_dir)
+        self._sync(source_dir, target_dir, manifest)
+        os.utime(str(source_dir / "file1"), (1_000_000_000, 1_000_000_000))
+        copy_count, _ = self._sync(source_dir, target_dir, manifest)
+        assert copy_count == 0
+        assert manifest.entries["file1"]["mtime"] == 1_000_000_000
+        # Same size, different content
+        (source_dir / "file1").write_bytes(b"CONTENT1")
+        copy_count, _ = self._sync(source_dir, target_dir, manifest)
+        assert copy_count == 1
+        assert (target_dir / "file1").read_bytes() == b"CONTENT1"
+
+    def test_unsupported_hash(self, tmp_path):
+        with pytest.raises(ValueError):
+            ftputil.sync.Manifest(str(tmp_path / "manifest.json"), hash_name="md4")
+
+    def test_manifest_in_source_dir(self, tmp_path):
+        """The manifest isn't synchronized itself."""
+        source_dir = tmp_path / "source"
+        target_dir = tmp_path / "target"
+        self._make_tree(source_dir)
+        manifest_path = source_dir / "manifest.json"
+        self._sync(source_dir, target_dir, str(manifest_path))
+        self._sync(source_dir, target_dir, str(manifest_path))
+        assert sorted(os.listdir(str(target_dir))) == ["dir1", "file1"]
+
+    def test_remote_source(self):
+        """A manifest can only be used with a local source."""
+        with pytest.raises(ValueError):
+            ftputil.sync.Syncer(
+                ArgumentCheckingFTPHost(),
+                ftputil.sync.LocalHost(),
+                manifest="manifest.json",
+            )
+
+
+class TestParallelSync:
+    def _make_tree(self, root):
+        for dir_index in range(3):
+            dir_path = root / "dir{}".format(dir_index) / "subdir"
+            dir_path.mkdir(parents=True)
+            for file_index in range(3):
+                file_content = "content {} {}".format(dir_index, file_index)
+                (dir_path / "file{}".format(file_index)).write_text(file_content)
+        (root / "file").write_text("content")
+
+    def _tree_contents(self, root):
+        contents = {}
+        for dirpath, dir_names, file_names in os.walk(str(root)):
+            relative_dirpath = os.path.relpath(dirpath, str(root))
+            contents[relative_dirpath] = None
+            for file_name in file_names:
+                path = os.path.join(dirpath, file_name)
+                with open(path) as fobj:
+                    contents[os.path.join(relative_dirpath, file_name)] = fobj.read()
+        return contents
+
+    def test_sync(self, tmp_path):
+        source_dir = tmp_path / "source"
+        target_dir = tmp_path / "target"
+        self._make_tree(source_dir)
+        syncer = ftputil.sync.Syncer(
+            ftputil.sync.LocalHost(), ftputil.sync.LocalHost(), workers=4
+        )
+        syncer.sync(str(source_dir), str(target_dir))
+        assert self._tree_contents(target_dir) == self._tree_contents(source_dir)
+
+    def test_conditional_and_delete(self, tmp_path):
+        source_dir = tmp_path / "source"
+        target_dir = tmp_path / "target"
+        self._make_tree(source_dir)
+        syncer = ftputil.sync.Syncer(
+            ftputil.sync.LocalHost(),
+            ftputil.sync.LocalHost(),
+            conditional=True,
+            delete=True,
+            workers=4,
+        )
+        syncer.sync(str(source_dir), str(target_dir))
+        (target_dir / "dir1" / "extra_file").write_text("")
+        (source_dir / "dir2" / "subdir" / "file0").write_text("changed content")
+        with unittest.mock.patch(
+            "ftputil.file_transfer.copyfileobj",
+            wraps=ftputil.file_transfer.copyfileobj,
+        ) as copyfileobj_mock:
+            syncer.sync(str(source_dir), str(target_dir))
+        assert copyfileobj_mock.call_count == 1
+        assert self._tree_contents(target_dir) == self._tree_contents(source_dir)
+
+    def test_transfers_start_during_walk(self, tmp_path):
+        """
+        Files are copied while the source tree is still being walked.
+        """
+        source_dir = tmp_path / "source"
+        target_dir = tmp_path / "target"
+        self._make_tree(source_dir)
+        first_file_copied = threading.Event()
+
+        class WaitingLocalHost(ftputil.sync.LocalHost):
+            def walk(self, top):
+                for index, walk_tuple in enumerate(os.walk(top)):
+                    if index == 1:
+                        # If the workers didn't start before the walk
+                        # is finished, this would time out.
+                        assert first_file_copied.wait(timeout=10)
+                    yield walk_tuple
+
+        class SignalingLocalHost(ftputil.sync.LocalHost):
+            def utime(self, path, times):
+                os.utime(path, times)
+                first_file_copied.set()
+
+        syncer = ftputil.sync.Syncer(
+            WaitingLocalHost(), SignalingLocalHost(), preserve_mtime=True, workers=2
+        )
+        syncer.sync(str(source_dir), str(target_dir))
+        assert self._tree_contents(target_dir) == self._tree_contents(source_dir)
+
+    def test_error(self, tmp_path):
+        """An error in a worker is raised in the calling thread."""
+        source_dir = tmp_path / "source"
+        target_dir = tmp_path / "target"
+        self._make_tree(source_dir)
+
+        class FailingLocalHost(ftputil.sync.LocalHost):
+            def open(self, path, mode):
+                if path.endswith("file1"):
+                    raise OSError("can't open {}".format(path))
+                return super().open(path, mode)
+
+        syncer = ftputil.sync.Syncer(
+            ftputil.sync.LocalHost(), FailingLocalHost(), workers=4
+        )
+        with pytest.raises(OSError, match="can't open"):
+            syncer.sync(str(source_dir), str(target_dir))
+
+    def test_walk_error_without_cancel_futures(self, tmp_path):
+        """
+        If the walk fails, the remaining tasks are cancelled without
+        the `cancel_futures` argument of `Executor.shutdown`, which
+        Python 3.8 and older don't have.
+        """
+        source_dir = tmp_path / "source"
+        target_dir = tmp_path / "target"
+        self._make_tree(source_dir)
+
+        class FailingWalkLocalHost(ftputil.sync.LocalHost):
+            def walk(self, top):
+                yield next(os.walk(top))
+                raise OSError("walk failed")
+
+        original_shutdown = concurrent.futures.ThreadPoolExecutor.shutdown
+
+        def shutdown(self, wait=True):
+            original_shutdown(self, wait)
+
+        syncer = ftputil.sync.Syncer(
+            FailingWalkLocalHost(), ftputil.sync.LocalHost(), workers=2
+        )
+        with unittest.mock.patch.object(
+            concurrent.futures.ThreadPoolExecutor, "shutdown", shutdown
+        ):
+            with pytest.raises(OSError, match="walk failed"):
+                syncer.sync(str(source_dir), str(target_dir))
+
+    def test_invalid_workers(self):
+        with pytest.raises(ValueError):
+            ftputil.sync.Syncer(
+                ftputil.sync.LocalHost(), ftputil.sync.LocalHost(), workers=0
+            )
+
+
+class TestFXP:
+    def _ftp_host_mock(self, data=b""):
+        host = unittest.mock.Mock(spec=ftputil.FTPHost)
+        host.rate_limit = None
+        host.open.side_effect = lambda path, mode: io.BytesIO(data)
+        return host
+
+    def test_fxp(self):
+        source = self._ftp_host_mock()
+        target = self._ftp_host_mock()
+        syncer = ftputil.sync.Syncer(source, target)
+        syncer._copy_file(source, target, "/source", "/target", True, False)
+        source.copy_to.assert_called_once_with(target, "/source", "/target")
+        source.open.assert_not_called()
+        target.open.assert_not_called()
+
+    def test_fallback_to_copy_via_client(self):
+        source = self._ftp_host_mock(b"data")
+        source.copy_to.side_effect = ftputil.error.CommandNotImplementedError(
+            "502 not supported"
+        )
+        target = self._ftp_host_mock()
+        syncer = ftputil.sync.Syncer(source, target)
+        syncer._copy_file(source, target, "/source", "/target", True, False)
+        source.open.assert_called_once_with("/source", "rb")
+        target.open.assert_called_once_with("/target", "wb")
+        # FXP is tried for each file, and the syncer isn't changed.
+        syncer._copy_file(source, target, "/source", "/target", True, False)
+        assert source.copy_to.call_count == 2
+        assert syncer._use_fxp
+
+    def test_without_fxp(self):
+        source = self._ftp_host_mock(b"data")
+        target = self._ftp_host_mock()
+        syncer = ftputil.sync.Syncer(source, target)
+        syncer._copy_file(source, target, "/source", "/target", False, False)
+        source.copy_to.assert_not_called()
+        source.open.assert_called_once_with("/source", "rb")
+
+    def test_no_fxp_with_rate_limit(self):
+        source = self._ftp_host_mock(b"data")
+        target = self._ftp_host_mock()
+        syncer = ftputil.sync.Syncer(source, target, rate_limit=1_000_000)
+        syncer._copy_file(source, target, "/source", "/target", True, False)
+        source.copy_to.assert_not_called()
+
+    def test_host_rate_limit_set_after_creating_syncer(self):
+        """
+        The host-wide rate limits are read when a file is copied,
+        not when the syncer is created.
+        """
+        source = self._ftp_host_mock(b"data")
+        target = self._ftp_host_mock()
+        syncer = ftputil.sync.Syncer(source, target)
+        target.rate_limit = ftputil.rate_limit.RateLimiter(1_000_000)
+        with unittest.mock.patch.object(
+            ftputil.file_transfer, "copyfileobj"
+        ) as copyfileobj_mock:
+            syncer._copy_file(source, target, "/source", "/target", True, False)
+        source.copy_to.assert_not_called()
+        assert copyfileobj_mock.call_args[1]["rate_limit"] is target.rate_limit